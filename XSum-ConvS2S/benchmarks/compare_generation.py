@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+"""
+Generate the same subset with several variants of a trained model (fp32,
+dynamic int8 quantization, or a vocabulary shortlist of --shortlist-topk words)
+and print the BLEU, ROUGE and generation speed of each, and how many top
+hypotheses are the same as with the first variant. Takes the arguments of
+generate.py, e.g.:
+
+    PYTHONPATH=. python3 benchmarks/compare_generation.py data-bin/xsum \\
+        --path checkpoints/checkpoint_best.pt --gen-subset test --cpu \\
+        --batch-size 1 --beam 10 --variants fp32 int8 shortlist --shortlist-topk 1000
+"""
+
+import argparse
+
+import torch
+
+from fairseq import bleu, options, rouge
+from fairseq.meters import StopwatchMeter
+
+import generate as gen
+
+# generation options overridden by each variant; the shortlist variant uses
+# the --shortlist-* options of the command line
+VARIANTS = {
+    'fp32': dict(quantize=False, shortlist_topk=0),
+    'int8': dict(quantize=True, shortlist_topk=0),
+    'shortlist': dict(quantize=False),
+}
+
+
+def main():
+    parser = options.get_generation_parser()
+    parser.add_argument('--variants', nargs='+', default=['fp32', 'int8'], choices=list(VARIANTS),
+                        help='variants to compare, the first one is the baseline')
+    base_args = parser.parse_args()
+    print(base_args)
+    if 'shortlist' in base_args.variants and base_args.shortlist_topk <= 0:
+        parser.error('the shortlist variant requires --shortlist-topk')
+
+    use_cuda = torch.cuda.is_available() and not base_args.cpu
+
+    results = []
+    for name in base_args.variants:
+        args = argparse.Namespace(**vars(base_args))
+        # the hypotheses are collected from the output lines
+        args.quiet = False
+        for key, value in VARIANTS[name].items():
+            setattr(args, key, value)
+        # --replace-unk adds the words of the references to the target
+        # dictionary, and make_generation_fast_ modifies the models in place,
+        # so each variant starts from a fresh dataset and fresh models
+        dataset = gen.load_dataset_for_generation(args)
+        models = gen.load_models_for_generation(args, dataset)
+        itr = gen.get_generation_iterator(args, dataset, models)
+        scorer = bleu.Scorer(dataset.dst_dict.pad(), dataset.dst_dict.eos(), dataset.dst_dict.unk())
+        rouge_scorer = rouge.RougeScorer(num_workers=args.rouge_workers)
+        gen_timer = StopwatchMeter()
+        hypos = {}
+        for sample_id, lines, _ in gen.generate(
+                args, dataset, models, itr, scorer, gen_timer, use_cuda, rouge_scorer=rouge_scorer):
+            hypos[sample_id] = next(line for line in lines if line.startswith('H-')).split('\t')[2]
+            if not base_args.quiet:
+                print('{}-{}\t{}'.format(name, sample_id, hypos[sample_id]))
+        results.append((name, scorer.result_string(), rouge_scorer.result_string(), gen_timer, hypos))
+        rouge_scorer.shutdown()
+
+    base_hypos = results[0][4]
+    for name, bleu_string, rouge_string, gen_timer, hypos in results:
+        same = sum(hypos[i] == base_hypos.get(i) for i in hypos)
+        print('| {}: {:.2f} tokens/s ({} tokens in {:.1f}s), {}/{} hypotheses same as {}'.format(
+            name, gen_timer.n / gen_timer.sum, gen_timer.n, gen_timer.sum, same, len(hypos), results[0][0]))
+        print('| {}: {}'.format(name, bleu_string))
+        print('| {}: {}'.format(name, rouge_string))
+
+
+if __name__ == '__main__':
+    main()
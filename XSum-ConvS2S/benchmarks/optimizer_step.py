@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+"""
+Time the single-tensor and multi-tensor (torch._foreach_*) updates of NAG and
+Adam on the parameters of a model. Both versions are timed on CPU too, where
+training only uses the single-tensor one.
+"""
+
+import argparse
+from unittest import mock
+
+import torch
+
+from fairseq.optim import adam, nag
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    common.add_model_args(parser)
+    parser.add_argument('--steps', default=20, type=int, metavar='N', help='number of timed steps')
+    parser.add_argument('--repeat', default=3, type=int, metavar='N', help='number of timings of each version')
+    args = parser.parse_args()
+    print(args)
+
+    model, _ = common.build_model(args)
+    params = list(model.parameters())
+    print('| {} parameters in {} tensors'.format(sum(p.numel() for p in params), len(params)))
+    cuda = common.use_cuda(args)
+
+    configs = [
+        ('nag', nag, nag.NAG, dict(lr=0.1, momentum=0.99, weight_decay=0.0001)),
+        ('adam', adam, adam.Adam, dict(lr=0.001, weight_decay=0.0001)),
+        ('adam (amsgrad)', adam, adam.Adam, dict(lr=0.001, weight_decay=0.0001, amsgrad=True)),
+    ]
+    for name, module, optimizer_cls, kwargs in configs:
+        # alternate the two versions and keep the best time of each
+        times = [float('inf'), float('inf')]
+        for _ in range(args.repeat):
+            for i, multi_tensor in enumerate([False, True]):
+                with mock.patch.object(module, '_multi_tensor_available', return_value=multi_tensor):
+                    copies = [torch.nn.Parameter(p.data.clone()) for p in params]
+                    for p in copies:
+                        p.grad = torch.randn_like(p)
+                    optimizer = optimizer_cls(copies, **kwargs)
+                    times[i] = min(times[i], common.timeit(optimizer.step, args.steps, cuda=cuda))
+        print('| {}: single-tensor {:.2f} ms/step, multi-tensor {:.2f} ms/step ({:.2f}x)'.format(
+            name, times[0] * 1000, times[1] * 1000, times[0] / times[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import torch
+import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
+
+from fairseq import utils
+
+from . import register_criterion
+from .label_smoothed_cross_entropy import LabelSmoothedCrossEntropyCriterion
+
+
+@register_criterion('chunked_label_smoothed_cross_entropy')
+class ChunkedLabelSmoothedCrossEntropyCriterion(LabelSmoothedCrossEntropyCriterion):
+    """Label smoothed cross-entropy that never materializes B x T x V scores.
+
+    The decoder features are gathered for non-pad target positions only and
+    projected onto the vocabulary in chunks of --loss-chunk-size tokens. Each
+    chunk computes the logits, log-softmax, NLL and smoothing terms and is
+    recomputed during the backward pass, so the peak memory of the output
+    layer is one chunk x V instead of B x T x V. The loss is the same as
+    label_smoothed_cross_entropy.
+    """
+
+    def __init__(self, args, src_dict, dst_dict):
+        super().__init__(args, src_dict, dst_dict)
+        self.chunk_size = args.loss_chunk_size
+
+    @staticmethod
+    def add_args(parser):
+        """Add criterion-specific arguments to the parser."""
+        LabelSmoothedCrossEntropyCriterion.add_args(parser)
+        parser.add_argument('--loss-chunk-size', default=1024, type=int, metavar='N',
+                            help='number of target tokens projected onto the vocabulary at once')
+
+    def forward(self, model, sample, reduce=True):
+        """Compute the loss for the given sample.
+
+        Returns a tuple with three elements:
+        1) the loss, as a Variable
+        2) the sample size, which is used as the denominator for the gradient
+        3) logging outputs to display while training
+        """
+        features = model.extract_features(**sample['net_input'])
+        features = features.view(-1, features.size(-1))
+        target = sample['target'].view(-1)
+        non_pad_mask = target.ne(self.padding_idx)
+        features = features[non_pad_mask]
+        target = target[non_pad_mask]
+
+        def chunk_loss(x, target):
+            lprobs = F.log_softmax(model.decoder.output_layer(x), dim=-1)
+            nll_loss = -lprobs.gather(dim=-1, index=target.unsqueeze(-1)).squeeze(-1)
+            smooth_loss = -lprobs.sum(dim=-1)
+            return nll_loss, smooth_loss
+
+        nll_losses, smooth_losses = [], []
+        for i in range(0, target.size(0), self.chunk_size):
+            x = features[i:i+self.chunk_size]
+            t = target[i:i+self.chunk_size]
+            if torch.is_grad_enabled() and x.requires_grad:
+                # don't keep the chunk's V-sized activations for backward
+                nll_loss, smooth_loss = checkpoint(chunk_loss, x, t)
+            else:
+                nll_loss, smooth_loss = chunk_loss(x, t)
+            nll_losses.append(nll_loss)
+            smooth_losses.append(smooth_loss)
+        nll_loss = torch.cat(nll_losses)
+        smooth_loss = torch.cat(smooth_losses)
+        if reduce:
+            nll_loss = nll_loss.sum()
+            smooth_loss = smooth_loss.sum()
+        eps_i = self.eps / len(model.decoder.dictionary)
+        loss = (1. - self.eps) * nll_loss + eps_i * smooth_loss
+
+        sample_size = sample['target'].size(0) if self.args.sentence_avg else sample['ntokens']
+        logging_output = {
+            'loss': utils.item(loss.data) if reduce else loss.data,
+            'nll_loss': utils.item(nll_loss.data) if reduce else loss.data,
+            'ntokens': sample['ntokens'],
+            'sample_size': sample_size,
+        }
+        return loss, sample_size, logging_output
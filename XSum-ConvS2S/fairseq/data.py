@@ -153,14 +153,19 @@ class LanguageDatasets(object):
     def eval_dataloader(self, split, num_workers=0, max_tokens=None,
                         max_sentences=None, max_positions=(1024, 1024),
                         skip_invalid_size_inputs_valid_test=False,
-                        descending=False, shard_id=0, num_shards=1):
+                        descending=False, shard_id=0, num_shards=1,
+                        shard_by_tokens=False):
         dataset = self.splits[split]
         batch_sampler = batches_by_size(
             dataset.src, dataset.dst, max_tokens, max_sentences,
             max_positions=max_positions,
             ignore_invalid_inputs=skip_invalid_size_inputs_valid_test,
             descending=descending)
-        batch_sampler = mask_batches(batch_sampler, shard_id=shard_id, num_shards=num_shards)
+        if shard_by_tokens:
+            batch_sampler = token_balanced_shard(
+                batch_sampler, dataset.src.sizes, shard_id=shard_id, num_shards=num_shards)
+        else:
+            batch_sampler = mask_batches(batch_sampler, shard_id=shard_id, num_shards=num_shards)
         return torch.utils.data.DataLoader(
             dataset, num_workers=num_workers, collate_fn=dataset.collater,
             batch_sampler=batch_sampler)
@@ -410,6 +415,27 @@ def mask_batches(batch_sampler, shard_id, num_shards):
     return res + [[]] * (expected_length - len(res))
 
 
+def token_balanced_shard(batch_sampler, sizes, shard_id, num_shards):
+    """Split batches into shards with about the same number of source tokens
+    and return the batches of the given shard.
+
+    Batches are assigned from largest to smallest, each to the shard with
+    the fewest tokens so far. Unlike :func:`mask_batches`, shards may contain
+    different numbers of batches.
+    """
+    if num_shards == 1:
+        return batch_sampler
+    num_tokens = [sum(sizes[idx] for idx in batch) for batch in batch_sampler]
+    shard_tokens = [0] * num_shards
+    res = []
+    for i in sorted(range(len(batch_sampler)), key=lambda i: -num_tokens[i]):
+        shard = min(range(num_shards), key=lambda j: shard_tokens[j])
+        shard_tokens[shard] += num_tokens[i]
+        if shard == shard_id:
+            res.append(batch_sampler[i])
+    return res
+
+
 @contextlib.contextmanager
 def numpy_seed(seed):
     """Context manager which seeds the NumPy PRNG with the specified seed and
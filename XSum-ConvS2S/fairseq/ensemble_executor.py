@@ -0,0 +1,38 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class EnsembleExecutor(object):
+    """Runs a function over the members of an ensemble concurrently.
+
+    Each member gets its own worker thread, and the available intra-op
+    threads are split evenly among the workers. Since torch releases the GIL
+    inside its operators, the members then run in parallel on multi-core
+    hosts. Note that grad mode is thread-local, so functions that are run
+    here must disable gradients themselves.
+    """
+
+    def __init__(self, num_models, num_threads=None):
+        if num_threads is None:
+            num_threads = torch.get_num_threads()
+        self.threads_per_model = max(1, num_threads // num_models)
+        self.pool = ThreadPoolExecutor(
+            max_workers=num_models,
+            initializer=torch.set_num_threads,
+            initargs=(self.threads_per_model,),
+        )
+
+    def map(self, fn, *iterables):
+        """Like the builtin map, but returns a list of the results."""
+        return list(self.pool.map(fn, *iterables))
+
+    def shutdown(self):
+        self.pool.shutdown()
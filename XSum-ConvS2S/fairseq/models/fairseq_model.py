@@ -5,6 +5,7 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
+import torch
 import torch.nn as nn
 
 from . import FairseqDecoder, FairseqEncoder
@@ -44,6 +45,13 @@ class FairseqModel(nn.Module):
         decoder_out, _ = self.decoder(prev_output_tokens, encoder_out)
         return decoder_out
 
+    def extract_features(self, src_tokens, src_lengths, prev_output_tokens):
+        """Like :func:`forward`, but return the decoder features before the
+        output projection (see FairseqDecoder.extract_features)."""
+        encoder_out = self.encoder(src_tokens, src_lengths)
+        features, _ = self.decoder.extract_features(prev_output_tokens, encoder_out)
+        return features
+
     def get_normalized_probs(self, net_output, log_probs):
         """Get normalized probabilities (or log probs) from a net's output."""
         return self.decoder.get_normalized_probs(net_output, log_probs)
@@ -71,8 +79,13 @@ class FairseqModel(nn.Module):
         state_dict = self.decoder.upgrade_state_dict(state_dict)
         return state_dict
 
-    def make_generation_fast_(self, **kwargs):
-        """Optimize model for faster generation."""
+    def make_generation_fast_(self, quantize=False, **kwargs):
+        """Optimize model for faster generation.
+
+        If *quantize* is True, the weights of the linear layers are converted
+        to int8 and their inputs are quantized dynamically. Quantized models
+        only run on CPU.
+        """
         if self._is_generation_fast:
             return  # only apply once
         self._is_generation_fast = True
@@ -87,13 +100,16 @@ class FairseqModel(nn.Module):
 
         def apply_make_generation_fast_(module):
             if module != self and hasattr(module, 'make_generation_fast_'):
-                module.make_generation_fast_(**kwargs)
+                module.make_generation_fast_(quantize=quantize, **kwargs)
         self.apply(apply_make_generation_fast_)
 
-        def train(mode):
-            if mode:
-                raise RuntimeError('cannot train after make_generation_fast')
+        if quantize:
+            torch.quantization.quantize_dynamic(self, {nn.Linear}, dtype=torch.qint8, inplace=True)
 
         # this model should no longer be used for training
         self.eval()
-        self.train = train
+
+    def train(self, mode=True):
+        if mode and self._is_generation_fast:
+            raise RuntimeError('cannot train after make_generation_fast')
+        return super().train(mode)
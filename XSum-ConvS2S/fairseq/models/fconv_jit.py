@@ -0,0 +1,192 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import math
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def _replace_none(modules):
+    """Replace the missing layers (None) of a ModuleList with nn.Identity,
+    which is easier to trace."""
+    return nn.ModuleList([
+        module if module is not None else nn.Identity() for module in modules
+    ])
+
+
+class LazyTrace(object):
+    """Traces ``module_cls(*args)`` with the inputs of the first call and
+    runs the traced graph from then on.
+
+    The module is built at the first call rather than here, so that it picks
+    up any submodules that were replaced in the meantime (e.g., by dynamic
+    quantization). Tracing is done on copies of the inputs, since the traced
+    modules may update them in place.
+    """
+
+    def __init__(self, module_cls, *args):
+        self.module_cls = module_cls
+        self.args = args
+        self.traced = None
+
+    def __call__(self, *inputs):
+        if self.traced is None:
+            module = self.module_cls(*self.args)
+            with torch.no_grad():
+                self.traced = torch.jit.trace(
+                    module, tuple(x.clone() for x in inputs), check_trace=False)
+        return self.traced(*inputs)
+
+
+def make_positions(tokens, padding_idx):
+    """Replace non-padding symbols with their position numbers.
+
+    Unlike LearnedPositionalEmbedding.make_positions, this only uses tensor
+    ops, so that it can be traced, and works for both left and right padding.
+    """
+    mask = tokens.ne(padding_idx).long()
+    return torch.cumsum(mask, dim=1) * mask + padding_idx
+
+
+class FConvEncoderForTracing(nn.Module):
+    """Inference-only version of FConvEncoder.forward that can be traced.
+
+    Dropout and gradient scaling are left out and nothing depends on the
+    input sizes, so the traced graph can be used for any batch.
+    """
+
+    def __init__(self, encoder):
+        super().__init__()
+        self.padding_idx = encoder.embed_positions.padding_idx
+        self.embed_tokens = encoder.embed_tokens
+        self.embed_positions = encoder.embed_positions
+        self.fc1 = encoder.fc1
+        self.projections = _replace_none(encoder.projections)
+        self.convolutions = encoder.convolutions
+        self.fc2 = encoder.fc2
+
+    def forward(self, src_tokens):
+        positions = make_positions(src_tokens, self.padding_idx)
+        x = self.embed_tokens(src_tokens) + F.embedding(positions, self.embed_positions.weight)
+        input_embedding = x
+
+        # B x T x C -> T x B x C
+        x = self.fc1(x).transpose(0, 1)
+
+        for proj, conv in zip(self.projections, self.convolutions):
+            residual = proj(x)
+            padding_l = (conv.kernel_size[0] - 1) // 2
+            padding_r = conv.kernel_size[0] // 2
+            x = F.pad(x, (0, 0, 0, 0, padding_l, padding_r))
+            x = F.glu(conv(x), dim=2)
+            x = (x + residual) * math.sqrt(0.5)
+
+        # T x B x C -> B x T x C
+        x = self.fc2(x.transpose(1, 0))
+        y = (x + input_embedding) * math.sqrt(0.5)
+        return x, y
+
+
+class FConvDecoderStepForTracing(nn.Module):
+    """Inference-only version of one incremental FConvDecoder.extract_features
+    step that can be traced.
+
+    The last kw-1 inputs of each convolution are kept in a single state
+    tensor of size bsz x :attr:`state_size`, which is updated in place, so
+    that it can be reordered like any other incremental state buffer.
+
+    The convolutions are applied as linear layers prepared once, here: the
+    int8 linear layer of a quantized convolution (a submodule, so that it can
+    be traced), or a buffer with the linearized weight.
+    """
+
+    def __init__(self, decoder):
+        super().__init__()
+        self.embed_tokens = decoder.embed_tokens
+        self.embed_positions = decoder.embed_positions
+        self.fc1 = decoder.fc1
+        self.projections = _replace_none(decoder.projections)
+        self.convolutions = decoder.convolutions
+        self.quantized_convolutions = nn.ModuleList([
+            conv._get_quantized_linear() if conv._quantize else nn.Identity()
+            for conv in decoder.convolutions
+        ])
+        for i, conv in enumerate(decoder.convolutions):
+            if not conv._quantize:
+                self.register_buffer(
+                    'linearized_weight_{}'.format(i), conv._get_linearized_weight().detach().clone())
+        self.attention = _replace_none(decoder.attention)
+        self.has_attention = [attention is not None for attention in decoder.attention]
+        self.fc2 = decoder.fc2
+        self.num_attn_layers = len(decoder.attention)
+        self.state_size = self.get_state_size(decoder)
+
+    @staticmethod
+    def get_state_size(decoder):
+        return sum(
+            (conv.kernel_size[0] - 1) * conv.in_channels
+            for conv in decoder.convolutions
+        )
+
+    def forward(self, tokens, positions, encoder_a, encoder_b, state):
+        """
+        Args:
+            tokens: the last output token of each hypothesis (bsz x 1)
+            positions: the position of the tokens (1 x 1)
+            encoder_a: the encoder output, transposed (bsz x C x srclen)
+            encoder_b: the encoder output plus input embedding, multiplied
+                by the attention scale (bsz x srclen x C)
+            state: the convolution input buffers (bsz x state_size)
+        """
+        x = self.embed_tokens(tokens) + F.embedding(positions, self.embed_positions.weight)
+        target_embedding = x
+        x = self.fc1(x)
+
+        avg_attn_scores = None
+        offset = 0
+        for i, (proj, conv, quantized_conv, attention, has_attention) in enumerate(zip(
+                self.projections, self.convolutions, self.quantized_convolutions, self.attention,
+                self.has_attention)):
+            residual = proj(x)
+
+            kw = conv.kernel_size[0]
+            if kw > 1:
+                numel = (kw - 1) * conv.in_channels
+                buffer = state[:, offset:offset+numel].view(-1, kw - 1, conv.in_channels)
+                offset += numel
+                input = torch.cat([buffer, x], dim=1)
+                buffer.copy_(input[:, 1:])
+            else:
+                input = x
+            input = input.flatten(1)
+            if conv._quantize:
+                x = quantized_conv(input)
+            else:
+                x = F.linear(input, getattr(self, 'linearized_weight_{}'.format(i)), conv.bias)
+            x = F.glu(x.unsqueeze(1), dim=2)
+
+            if has_attention:
+                attn_residual = x
+                x = (attention.in_projection(x) + target_embedding) * math.sqrt(0.5)
+                attn_scores = F.softmax(torch.bmm(x, encoder_a), dim=2)
+                x = torch.bmm(attn_scores, encoder_b)
+                x = (attention.out_projection(x) + attn_residual) * math.sqrt(0.5)
+
+                attn_scores = attn_scores / self.num_attn_layers
+                if avg_attn_scores is None:
+                    avg_attn_scores = attn_scores
+                else:
+                    avg_attn_scores = avg_attn_scores + attn_scores
+
+            x = (x + residual) * math.sqrt(0.5)
+
+        x = self.fc2(x)
+        if avg_attn_scores is None:
+            # traced modules can't return None
+            avg_attn_scores = x.new_zeros(x.size(0), 1, encoder_b.size(1))
+        return x, avg_attn_scores
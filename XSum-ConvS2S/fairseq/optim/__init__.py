@@ -5,17 +5,21 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
-import importlib
 import os
 
+from fairseq.registry import LazyRegistry
+
 from .fairseq_optimizer import FairseqOptimizer
 
 
-OPTIMIZER_REGISTRY = {}
+OPTIMIZER_REGISTRY = LazyRegistry(__name__, os.path.dirname(__file__), 'register_optimizer')
 OPTIMIZER_CLASS_NAMES = set()
 
 
 def build_optimizer(args, params):
+    if getattr(args, 'shard_optimizer_state', False) and args.distributed_world_size > 1:
+        from .sharded_optimizer import ShardedOptimizer
+        return ShardedOptimizer(args, params)
     return OPTIMIZER_REGISTRY[args.optimizer](args, params)
 
 
@@ -23,7 +27,7 @@ def register_optimizer(name):
     """Decorator to register a new optimizer."""
 
     def register_optimizer_cls(cls):
-        if name in OPTIMIZER_REGISTRY:
+        if name in OPTIMIZER_REGISTRY.loaded:
             raise ValueError('Cannot register duplicate optimizer ({})'.format(name))
         if not issubclass(cls, FairseqOptimizer):
             raise ValueError('Optimizer ({}: {}) must extend FairseqOptimizer'.format(name, cls.__name__))
@@ -31,15 +35,8 @@ def register_optimizer(name):
             # We use the optimizer class name as a unique identifier in
             # checkpoints, so all optimizer must have unique class names.
             raise ValueError('Cannot register optimizer with duplicate class name ({})'.format(cls.__name__))
-        OPTIMIZER_REGISTRY[name] = cls
+        OPTIMIZER_REGISTRY.loaded[name] = cls
         OPTIMIZER_CLASS_NAMES.add(cls.__name__)
         return cls
 
     return register_optimizer_cls
-
-
-# automatically import any Python files in the optim/ directory
-for file in os.listdir(os.path.dirname(__file__)):
-    if file.endswith('.py') and not file.startswith('_'):
-        module = file[:file.find('.py')]
-        importlib.import_module('fairseq.optim.' + module)
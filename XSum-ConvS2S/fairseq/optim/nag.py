@@ -5,6 +5,7 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
+import torch
 from torch.optim.optimizer import Optimizer, required
 
 from . import FairseqOptimizer, register_optimizer
@@ -54,6 +55,7 @@ class NAG(Optimizer):
             lr_old = group.get('lr_old', lr)
             lr_correct = lr / lr_old
 
+            params, grads, bufs = [], [], []
             for p in group['params']:
                 if p.grad is None:
                     continue
@@ -63,15 +65,43 @@ class NAG(Optimizer):
                 if 'momentum_buffer' not in param_state:
                     param_state['momentum_buffer'] = d_p.clone().zero_()
 
-                buf = param_state['momentum_buffer']
+                params.append(p.data)
+                grads.append(d_p)
+                bufs.append(param_state['momentum_buffer'])
 
-                if weight_decay != 0:
-                    p.data.mul_(1 - lr * weight_decay)
-                p.data.add_(momentum * momentum * lr_correct, buf)
-                p.data.add_(-(1 + momentum) * lr, d_p)
-
-                buf.mul_(momentum * lr_correct).add_(-lr, d_p)
+            if len(params) > 0:
+                if _multi_tensor_available(grads):
+                    _multi_tensor_nag(params, grads, bufs, weight_decay, momentum, lr, lr_correct)
+                else:
+                    _single_tensor_nag(params, grads, bufs, weight_decay, momentum, lr, lr_correct)
 
             group['lr_old'] = lr
 
         return loss
+
+
+def _multi_tensor_available(tensors):
+    # on CPU, the multi-tensor ops are no faster than a loop over the tensors
+    return hasattr(torch, '_foreach_add_') and all(t.is_cuda and not t.is_sparse for t in tensors)
+
+
+def _single_tensor_nag(params, grads, bufs, weight_decay, momentum, lr, lr_correct):
+    for p, d_p, buf in zip(params, grads, bufs):
+        if weight_decay != 0:
+            p.mul_(1 - lr * weight_decay)
+        p.add_(momentum * momentum * lr_correct, buf)
+        p.add_(-(1 + momentum) * lr, d_p)
+
+        buf.mul_(momentum * lr_correct).add_(-lr, d_p)
+
+
+def _multi_tensor_nag(params, grads, bufs, weight_decay, momentum, lr, lr_correct):
+    """Same update as _single_tensor_nag, but each op is applied to all
+    parameters at once, which saves a kernel launch per parameter."""
+    if weight_decay != 0:
+        torch._foreach_mul_(params, 1 - lr * weight_decay)
+    torch._foreach_add_(params, bufs, alpha=momentum * momentum * lr_correct)
+    torch._foreach_add_(params, grads, alpha=-(1 + momentum) * lr)
+
+    torch._foreach_mul_(bufs, momentum * lr_correct)
+    torch._foreach_add_(bufs, grads, alpha=-lr)
@@ -133,6 +133,9 @@ def add_distributed_training_args(parser):
                        help='port number (not required if using --distributed-init-method)')
     group.add_argument('--device-id', default=0, type=int,
                        help='which GPU to use (usually configured automatically)')
+    group.add_argument('--shard-optimizer-state', action='store_true',
+                       help='partition optimizer state and updates across workers, '
+                            'reducing optimizer memory by the world size')
     return group
 
 
@@ -188,6 +191,16 @@ def add_checkpoint_args(parser):
                        help='don\'t save models and checkpoints')
     group.add_argument('--no-epoch-checkpoints', action='store_true',
                        help='only store last and best checkpoints')
+    group.add_argument('--no-async-save', action='store_true',
+                       help='write checkpoints in the foreground instead of a background thread')
+    group.add_argument('--keep-last-epochs', type=int, default=-1, metavar='N',
+                       help='keep only the last N epoch checkpoints (default: keep all)')
+    group.add_argument('--keep-interval-updates', type=int, default=-1, metavar='N',
+                       help='keep only the last N mid-epoch checkpoints saved with '
+                            '--save-interval (default: keep all)')
+    group.add_argument('--keep-best-checkpoints', type=int, default=-1, metavar='K',
+                       help='additionally keep the K epoch checkpoints with the best '
+                            'validation loss, even if they are older than --keep-last-epochs')
     return group
 
 
@@ -228,6 +241,23 @@ def add_generation_args(parser):
                        help='just score the reference translation')
     group.add_argument('--prefix-size', default=0, type=int, metavar='PS',
                        help=('initialize generation by target prefix of given length'))
+    group.add_argument('--shortlist-topk', default=0, type=int, metavar='N',
+                       help=('if > 0, only score words from the source document, '
+                             'the N most frequent target words and their aligned '
+                             'translations (see --shortlist-align-dict)'))
+    group.add_argument('--shortlist-align-dict', default=None, metavar='FILE',
+                       help='alignment dictionary used to expand the shortlist with source word translations')
+    group.add_argument('--parallel-ensemble', action='store_true',
+                       help='run the models of an ensemble concurrently, each on its own thread')
+    group.add_argument('--quantize', action='store_true',
+                       help='use dynamic int8 quantization for the linear and linearized convolution layers (CPU only)')
+    group.add_argument('--jit', action='store_true',
+                       help='run the encoder and the incremental decoder steps with traced TorchScript graphs')
+    group.add_argument('--rouge', action='store_true',
+                       help='also report ROUGE-1/2/L F1 of the top hypotheses (without stemming, '
+                            'so not comparable to scores of the Perl ROUGE toolkit)')
+    group.add_argument('--rouge-workers', default=1, type=int, metavar='N',
+                       help='number of processes used to compute ROUGE')
     return group
 
 
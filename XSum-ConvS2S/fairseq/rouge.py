@@ -0,0 +1,191 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import re
+
+
+METRICS = ('rouge1', 'rouge2', 'rougeL')
+
+# n-grams of token ids are packed into a single integer, which is exact for
+# ids below 2**32
+NGRAM_SHIFT = 32
+
+NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+
+
+def tokenize(line):
+    """Lowercase and split on non-alphanumeric characters, like the ROUGE
+    toolkit does (without stemming)."""
+    return NON_ALNUM_RE.sub(' ', line.lower()).split()
+
+
+def to_ids(ref, pred, ignore=()):
+    """Convert a reference and a prediction to lists of token ids.
+
+    Strings are tokenized with :func:`tokenize` and mapped to ids that are
+    shared by the pair. Tensors and other sequences of ids are used as is,
+    except that the ids in *ignore* (e.g., pad and eos) are removed.
+    """
+    if isinstance(ref, str) or isinstance(pred, str):
+        vocab = {}
+        return (
+            [vocab.setdefault(w, len(vocab)) for w in tokenize(ref)],
+            [vocab.setdefault(w, len(vocab)) for w in tokenize(pred)],
+        )
+    if hasattr(ref, 'tolist'):
+        ref = ref.tolist()
+    if hasattr(pred, 'tolist'):
+        pred = pred.tolist()
+    return (
+        [x for x in ref if x not in ignore],
+        [x for x in pred if x not in ignore],
+    )
+
+
+def ngrams(ids, n):
+    """Return a Counter of the n-grams of *ids*, each packed into an int."""
+    if n == 1:
+        return Counter(ids)
+    keys = ids[:len(ids) - n + 1]
+    for k in range(1, n):
+        keys = [(key << NGRAM_SHIFT) | x for key, x in zip(keys, ids[k:])]
+    return Counter(keys)
+
+
+def lcs_length(a, b):
+    """Length of the longest common subsequence of *a* and *b*.
+
+    This is the usual dynamic program with a single rolling row, with the
+    row encoded as the bits of an integer (Hyyrö, 2004), so that each element
+    of *b* takes a constant number of big-integer operations.
+    """
+    if len(a) == 0 or len(b) == 0:
+        return 0
+    match = {}
+    for i, x in enumerate(a):
+        match[x] = match.get(x, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    row = full
+    for y in b:
+        u = row & match.get(y, 0)
+        row = ((row + u) | (row - u)) & full
+    return len(a) - bin(row).count('1')
+
+
+def f_score(overlap, ref_len, pred_len):
+    """Return the precision, recall and F1 of an overlap."""
+    precision = overlap / pred_len if pred_len > 0 else 0.
+    recall = overlap / ref_len if ref_len > 0 else 0.
+    if precision + recall == 0:
+        return precision, recall, 0.
+    return precision, recall, 2 * precision * recall / (precision + recall)
+
+
+def score_pair(ref, pred):
+    """Return the (precision, recall, F1) of ROUGE-1, ROUGE-2 and ROUGE-L for
+    a reference and a prediction given as lists of token ids."""
+    scores = []
+    for n in (1, 2):
+        ref_ngrams, pred_ngrams = ngrams(ref, n), ngrams(pred, n)
+        overlap = sum((ref_ngrams & pred_ngrams).values())
+        scores.append(f_score(
+            overlap, max(len(ref) - n + 1, 0), max(len(pred) - n + 1, 0)))
+    scores.append(f_score(lcs_length(ref, pred), len(ref), len(pred)))
+    return scores
+
+
+def _score_chunk(pairs):
+    """Return the sums of the scores of a list of (ref, pred) id lists."""
+    sums = [[0., 0., 0.] for _ in METRICS]
+    for ref, pred in pairs:
+        for total, scores in zip(sums, score_pair(ref, pred)):
+            for i, x in enumerate(scores):
+                total[i] += x
+    return sums, len(pairs)
+
+
+class RougeScorer(object):
+    """Computes ROUGE-1, ROUGE-2 and ROUGE-L, averaged over documents.
+
+    References and predictions can be strings or sequences of token ids
+    (e.g., IntTensors), in which case the ids in *ignore* are skipped. Pairs
+    are added as they come and scored in chunks of *chunk_size*; with
+    *num_workers* > 1, the chunks are scored in a process pool while more
+    pairs are added.
+    """
+
+    def __init__(self, ignore=(), num_workers=1, chunk_size=1000):
+        self.ignore = set(ignore)
+        self.chunk_size = chunk_size
+        self.pool = ProcessPoolExecutor(num_workers) if num_workers > 1 else None
+        self.reset()
+
+    def reset(self):
+        self.sums = [[0., 0., 0.] for _ in METRICS]
+        self.count = 0
+        self.pending = []
+        self.futures = []
+
+    def add(self, ref, pred):
+        self.pending.append(to_ids(ref, pred, self.ignore))
+        if len(self.pending) >= self.chunk_size:
+            self._flush()
+
+    def add_many(self, refs, preds):
+        assert len(refs) == len(preds)
+        for ref, pred in zip(refs, preds):
+            self.add(ref, pred)
+
+    def _flush(self):
+        pairs, self.pending = self.pending, []
+        if len(pairs) == 0:
+            return
+        if self.pool is None:
+            self._accumulate(*_score_chunk(pairs))
+        else:
+            self.futures.append(self.pool.submit(_score_chunk, pairs))
+
+    def _wait(self):
+        self._flush()
+        for future in self.futures:
+            self._accumulate(*future.result())
+        self.futures = []
+
+    def _accumulate(self, sums, count):
+        for total, chunk_total in zip(self.sums, sums):
+            for i, x in enumerate(chunk_total):
+                total[i] += x
+        self.count += count
+
+    def stat_dict(self):
+        """Return the accumulated statistics as a picklable dict."""
+        self._wait()
+        return {'sums': self.sums, 'count': self.count}
+
+    def merge(self, stat_dict):
+        """Add statistics accumulated by another RougeScorer (see
+        :func:`stat_dict`), e.g., in another process."""
+        self._accumulate(stat_dict['sums'], stat_dict['count'])
+
+    def score(self):
+        """Return a dict from metric name to average (precision, recall, F1)."""
+        self._wait()
+        return {
+            metric: tuple(x / self.count if self.count > 0 else 0. for x in total)
+            for metric, total in zip(METRICS, self.sums)
+        }
+
+    def result_string(self):
+        scores = self.score()
+        return 'ROUGE-1 = {:2.2f}, ROUGE-2 = {:2.2f}, ROUGE-L = {:2.2f} (F1, {} documents)'.format(
+            *[scores[metric][2] * 100 for metric in METRICS], self.count)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
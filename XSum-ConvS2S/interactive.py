@@ -12,12 +12,15 @@ from torch.autograd import Variable
 
 from fairseq import options, tokenizer, utils
 from fairseq.sequence_generator import SequenceGenerator
+from fairseq.vocab_shortlist import build_shortlist
 
 
 def main(args):
     print(args)
 
     use_cuda = torch.cuda.is_available() and not args.cpu
+    if args.quantize and use_cuda:
+        raise ValueError('--quantize is only supported with --cpu')
 
     # Load ensemble
     print('| loading model(s) from {}'.format(', '.join(args.path)))
@@ -31,13 +34,17 @@ def main(args):
     for model in models:
         model.make_generation_fast_(
             beamable_mm_beam_size=None if args.no_beamable_mm else args.beam,
+            quantize=args.quantize,
+            jit=args.jit,
         )
 
     # Initialize generator
     translator = SequenceGenerator(
         models, beam_size=args.beam, stop_early=(not args.no_early_stop),
         normalize_scores=(not args.unnormalized), len_penalty=args.lenpen,
-        unk_penalty=args.unkpen)
+        unk_penalty=args.unkpen,
+        shortlist=build_shortlist(args, src_dict, dst_dict),
+        parallel_ensemble=args.parallel_ensemble)
     if use_cuda:
         translator.cuda()
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import torch
+
+from fairseq import bleu, options, rouge
+from fairseq.meters import StopwatchMeter
+
+from generate import generate, get_generation_iterator, load_dataset_for_generation, load_models_for_generation
+from multiprocessing_train import ErrorHandler
+
+
+def main(args):
+    print(args)
+
+    use_cuda = torch.cuda.is_available() and not args.cpu
+    num_workers = args.num_shards
+
+    # Load the ensemble once and share its parameters with the workers.
+    dataset = load_dataset_for_generation(args)
+    models = load_models_for_generation(args, dataset)
+    for model in models:
+        model.share_memory()
+
+    mp = torch.multiprocessing.get_context('spawn')
+
+    # Create a thread to listen for errors in the child processes.
+    error_queue = mp.SimpleQueue()
+    error_handler = ErrorHandler(error_queue)
+    result_queue = mp.SimpleQueue()
+
+    # Generate with multiprocessing, splitting the threads among the workers.
+    num_threads = max(1, torch.get_num_threads() // num_workers)
+    procs = []
+    for i in range(num_workers):
+        procs.append(mp.Process(
+            target=run,
+            args=(args, i, num_threads, models, use_cuda, result_queue, error_queue, ),
+            daemon=True,
+        ))
+        procs[i].start()
+        error_handler.add_child(procs[i].pid)
+
+    # Merge the outputs and statistics of the workers.
+    scorer = bleu.Scorer(dataset.dst_dict.pad(), dataset.dst_dict.eos(), dataset.dst_dict.unk())
+    rouge_scorer = rouge.RougeScorer() if args.rouge else None
+    outputs = []
+    num_tokens, gen_time = 0, 0.
+    has_target = True
+    for _ in range(num_workers):
+        result = result_queue.get()
+        outputs.extend(result['outputs'])
+        scorer.merge(result['bleu_stats'])
+        if rouge_scorer is not None:
+            rouge_scorer.merge(result['rouge_stats'])
+        num_tokens += result['num_tokens']
+        gen_time = max(gen_time, result['gen_time'])
+        has_target = has_target and result['has_target']
+    for p in procs:
+        p.join()
+
+    for _, lines in sorted(outputs, key=lambda x: x[0]):
+        for line in lines:
+            print(line)
+
+    print('| Translated {} sentences ({} tokens) in {:.1f}s ({:.2f} tokens/s) with {} workers'.format(
+        len(outputs), num_tokens, gen_time, num_tokens / gen_time if gen_time > 0 else 0., num_workers))
+    if has_target:
+        print('| Generate {} with beam={}: {}'.format(args.gen_subset, args.beam, scorer.result_string()))
+        if rouge_scorer is not None:
+            print('| Generate {} with beam={}: {}'.format(args.gen_subset, args.beam, rouge_scorer.result_string()))
+
+
+def run(args, shard_id, num_threads, models, use_cuda, result_queue, error_queue):
+    try:
+        torch.set_num_threads(num_threads)
+        if use_cuda:
+            torch.cuda.set_device(shard_id % torch.cuda.device_count())
+
+        dataset = load_dataset_for_generation(args)
+        itr = get_generation_iterator(
+            args, dataset, models, shard_id=shard_id, num_shards=args.num_shards)
+
+        scorer = bleu.Scorer(dataset.dst_dict.pad(), dataset.dst_dict.eos(), dataset.dst_dict.unk())
+        rouge_scorer = rouge.RougeScorer() if args.rouge else None
+        gen_timer = StopwatchMeter()
+        outputs = []
+        has_target = True
+        for sample_id, lines, has_target in generate(
+                args, dataset, models, itr, scorer, gen_timer, use_cuda, rouge_scorer=rouge_scorer):
+            outputs.append((int(sample_id), lines))
+
+        result_queue.put({
+            'outputs': outputs,
+            'bleu_stats': scorer.stat_dict(),
+            'rouge_stats': rouge_scorer.stat_dict() if rouge_scorer is not None else None,
+            'num_tokens': gen_timer.n,
+            'gen_time': gen_timer.sum,
+            'has_target': has_target,
+        })
+    except KeyboardInterrupt:
+        pass  # killed by parent, do nothing
+    except Exception:
+        # propagate exception to parent process, keeping original traceback
+        import traceback
+        error_queue.put((shard_id, traceback.format_exc()))
+
+
+if __name__ == '__main__':
+    parser = options.get_generation_parser()
+    args = parser.parse_args()
+    if args.num_shards < 1:
+        raise ValueError('--num-shards must be at least 1')
+    main(args)
@@ -8,6 +8,7 @@
 #
 
 import argparse
+import itertools
 import os
 import sys
 
@@ -22,6 +23,8 @@ def main():
                         type=int, help='consider ngrams up to this order')
     parser.add_argument('--ignore-case', action='store_true',
                         help='case-insensitive scoring')
+    parser.add_argument('--chunk-size', default=10000, type=int, metavar='N',
+                        help='number of sentences to add to the scorer at once')
 
     args = parser.parse_args()
     print(args)
@@ -34,7 +37,7 @@ def main():
     dict = dictionary.Dictionary()
 
     def readlines(fd):
-        for line in fd.readlines():
+        for line in fd:
             if args.ignore_case:
                 yield line.lower()
             yield line
@@ -42,10 +45,14 @@ def main():
     def score(fdsys):
         with open(args.ref) as fdref:
             scorer = bleu.Scorer(dict.pad(), dict.eos(), dict.unk())
-            for sys_tok, ref_tok in zip(readlines(fdsys), readlines(fdref)):
-                sys_tok = tokenizer.Tokenizer.tokenize(sys_tok, dict)
-                ref_tok = tokenizer.Tokenizer.tokenize(ref_tok, dict)
-                scorer.add(ref_tok, sys_tok)
+            pairs = zip(readlines(fdsys), readlines(fdref))
+            while True:
+                chunk = list(itertools.islice(pairs, args.chunk_size))
+                if len(chunk) == 0:
+                    break
+                sys_toks = [tokenizer.Tokenizer.tokenize(sys_tok, dict) for sys_tok, _ in chunk]
+                ref_toks = [tokenizer.Tokenizer.tokenize(ref_tok, dict) for _, ref_tok in chunk]
+                scorer.add_many(ref_toks, sys_toks)
             print(scorer.result_string(args.order))
 
     if args.sys == '-':
@@ -0,0 +1,74 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from fairseq import rouge
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_fixture():
+    """Pairs of (ref, hyp) strings with reference ROUGE scores, computed
+    without stemming (see the description in the fixture)."""
+    with open(os.path.join(TESTS_DIR, 'fixtures', 'rouge.json')) as f:
+        return json.load(f)['pairs']
+
+
+class TestRouge(unittest.TestCase):
+
+    def setUp(self):
+        self.pairs = load_fixture()
+
+    def expected_average(self, metric):
+        return [sum(pair[metric][i] for pair in self.pairs) / len(self.pairs) for i in range(3)]
+
+    def test_score_pair(self):
+        for pair in self.pairs:
+            scores = rouge.score_pair(*rouge.to_ids(pair['ref'], pair['hyp']))
+            for metric, score in zip(rouge.METRICS, scores):
+                for x, y in zip(score, pair[metric]):
+                    self.assertAlmostEqual(x, y, places=5, msg='{} of {}'.format(metric, pair))
+
+    def test_scorer(self):
+        for num_workers in [1, 2]:
+            scorer = rouge.RougeScorer(num_workers=num_workers, chunk_size=8)
+            for pair in self.pairs:
+                scorer.add(pair['ref'], pair['hyp'])
+            scores = scorer.score()
+            scorer.shutdown()
+            for metric in rouge.METRICS:
+                for x, y in zip(scores[metric], self.expected_average(metric)):
+                    self.assertAlmostEqual(x, y, places=5)
+
+    def test_score_rouge_script(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ref_file, sys_file = os.path.join(tmpdir, 'ref.txt'), os.path.join(tmpdir, 'sys.txt')
+            with open(ref_file, 'w') as fref, open(sys_file, 'w') as fsys:
+                for pair in self.pairs:
+                    fref.write(pair['ref'] + '\n')
+                    fsys.write(pair['hyp'] + '\n')
+            for num_workers in [1, 2]:
+                output = subprocess.check_output(
+                    [sys.executable, 'score_rouge.py', '-s', sys_file, '-r', ref_file,
+                     '--workers', str(num_workers), '--chunk-size', '8'],
+                    cwd=os.path.dirname(TESTS_DIR), universal_newlines=True,
+                )
+                for name, metric in zip(['ROUGE-1', 'ROUGE-2', 'ROUGE-L'], rouge.METRICS):
+                    value = float(re.search(name + r' = ([0-9.]+)', output).group(1))
+                    self.assertAlmostEqual(value, self.expected_average(metric)[2] * 100, delta=0.005 + 1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import argparse
+import torch
+
+from fairseq.dictionary import Dictionary
+from fairseq.models import fconv
+
+
+def dummy_dictionary(vocab_size, prefix='token_'):
+    d = Dictionary()
+    for i in range(vocab_size):
+        token = prefix + str(i)
+        d.add_symbol(token)
+    d.finalize()
+    return d
+
+
+def fconv_args(**kwargs):
+    """Arguments of a small FConv model."""
+    args = argparse.Namespace(
+        encoder_embed_dim=16,
+        encoder_layers='[(16, 3)] * 2',
+        decoder_embed_dim=16,
+        decoder_layers='[(16, 3)] * 3',
+        decoder_out_embed_dim=16,
+        decoder_attention='True',
+        dropout=0.,
+        max_source_positions=64,
+        max_target_positions=64,
+        share_input_output_embed=False,
+    )
+    for k, v in kwargs.items():
+        setattr(args, k, v)
+    return args
+
+
+def build_fconv_models(args, dictionary, n=2, seed=1):
+    """Build *n* FConv models with the same random weights."""
+    torch.manual_seed(seed)
+    model = fconv.FConvModel.build_model(args, dictionary, dictionary)
+    models = [model]
+    for _ in range(n - 1):
+        copy = fconv.FConvModel.build_model(args, dictionary, dictionary)
+        copy.load_state_dict(model.state_dict())
+        models.append(copy)
+    return models
+
+
+def dummy_source(dictionary, bsz=3, srclen=7, seed=1):
+    """Random source tokens (left padded, as in LanguagePairDataset) and lengths."""
+    torch.manual_seed(seed)
+    src_tokens = torch.randint(dictionary.nspecial, len(dictionary), (bsz, srclen))
+    src_lengths = torch.LongTensor([srclen - i for i in range(bsz)])
+    for i in range(bsz):
+        src_tokens[i, :srclen - src_lengths[i]] = dictionary.pad()
+    src_tokens[:, -1] = dictionary.eos()
+    return src_tokens, src_lengths
@@ -1,13 +1,19 @@
 import requests
+import argparse
+import concurrent.futures
 import logging
+import threading
 import time
 import math
 import os
 import sys
 from pathlib import Path
+from urllib.parse import urlsplit
 import typing as ty
 import tqdm
 
+from html_shards import ShardWriter
+
 """Rewritten by Kensuke Mitsuzawa <kensuke.mit@gmail.com>.
 The original code can not cope with the connection issues.
 """
@@ -37,8 +43,56 @@ def setup_logger():
     return logger
 
 
-
-def download_wayback_html(url: str, downloads_dir: Path, timeout=15, max_attempts=5):
+# Mimic a common browser User-Agent to avoid blocking
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1', # Do Not Track request header
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+class HostRateLimiter:
+    """Spaces out the requests to each host by at least 1 / rate seconds,
+    across all the threads. A rate <= 0 disables the limit."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = {}
+
+    def wait(self, url: str):
+        if self.interval == 0.0:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time.get(host, now))
+            self.next_time[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """A session that keeps up to *pool_size* connections per host alive."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def download_wayback_html(url: str,
+                          downloads_dir: Path,
+                          timeout=15,
+                          max_attempts=5,
+                          session: ty.Optional[requests.Session] = None,
+                          rate_limiter: ty.Optional[HostRateLimiter] = None,
+                          shard_writer: ty.Optional[ShardWriter] = None):
     """
     Downloads HTML content from a Wayback Machine URL with robust error handling.
 
@@ -47,12 +101,19 @@ def download_wayback_html(url: str, downloads_dir: Path, timeout=15, max_attempt
         downloads_dir (str): Directory to save the downloaded HTML.
         timeout (int): Timeout for the request in seconds.
         max_attempts (int): Maximum number of retry attempts.
+        session (requests.Session): Session to reuse connections from (a new one by default).
+        rate_limiter (HostRateLimiter): Limits the requests per second to each host.
+        shard_writer (ShardWriter): If given, the HTML is appended to its shards
+            instead of being saved as a separate file.
 
     Returns:
         str: The decoded HTML content if successful, None otherwise.
     """
     if not os.path.exists(downloads_dir):
-        os.makedirs(downloads_dir)
+        os.makedirs(downloads_dir, exist_ok=True)
+    # end if
+    if session is None:
+        session = make_session(1)
     # end if
 
     # Get file id
@@ -85,22 +146,14 @@ def download_wayback_html(url: str, downloads_dir: Path, timeout=15, max_attempt
     # file_path = os.path.join(downloads_dir, html_file_id)
     file_path_save = downloads_dir / htmlfileid
 
-    # Mimic a common browser User-Agent to avoid blocking
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'DNT': '1', # Do Not Track request header
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-    }
-
     attempts = 0
     while attempts < max_attempts:
         try:
             logger.debug(f"Attempt {attempts + 1}/{max_attempts} to download: {url}")
-            req = requests.get(url, allow_redirects=True, timeout=timeout, headers=headers)
+            if rate_limiter is not None:
+                rate_limiter.wait(url)
+            # end if
+            req = session.get(url, allow_redirects=True, timeout=timeout)
             req.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
 
             # Internet Archive often wraps the original content in an iframe or adds banners.
@@ -111,10 +164,15 @@ def download_wayback_html(url: str, downloads_dir: Path, timeout=15, max_attempt
             # If you specifically want the raw content, modify the 'url' to include 'id_' before making the request.
 
             content = req.text
-            # It's better to write the raw text directly if req.text is already decoded
-            with open(file_path_save, 'w', encoding='utf-8') as f:
-                f.write(content)
-            logger.info(f"Successfully saved: {url} to {file_path_save}")
+            if shard_writer is not None:
+                shard_writer.add(url, content.encode('utf-8'))
+                logger.info(f"Successfully saved: {url} to shard {shard_writer.index[url][0]}")
+            else:
+                # It's better to write the raw text directly if req.text is already decoded
+                with open(file_path_save, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                logger.info(f"Successfully saved: {url} to {file_path_save}")
+            # end if
             return content
 
         except requests.exceptions.HTTPError as e:
@@ -136,7 +194,7 @@ def download_wayback_html(url: str, downloads_dir: Path, timeout=15, max_attempt
             logger.error(f"An unexpected error occurred for {url}: {e}. Giving up.")
             return None
 
-        # Exponential back-off.
+        # Exponential back-off. Only this URL's worker waits; the other downloads go on.
         time.sleep(math.pow(2, attempts))
         attempts += 1
 
@@ -147,47 +205,146 @@ def download_wayback_html(url: str, downloads_dir: Path, timeout=15, max_attempt
 def load_source_url_list(path_list: Path) -> ty.List[str]:
     seq_url = []
     with open(path_list) as f:
-        seq_url = list(f.readlines())
+        seq_url = [line.strip() for line in f if line.strip()]
     # end with
 
     return seq_url
 
 
+def load_manifest(path_manifest: Path) -> ty.Set[str]:
+    """Returns the URLs recorded as completed in the manifest."""
+    if not path_manifest.exists():
+        return set()
+    # end if
+    with open(path_manifest) as f:
+        seq_line = f.readlines()
+    # end with
+    if seq_line and not seq_line[-1].endswith('\n'):
+        # a line cut short by a crash: ignore it and start the next entries on a new line
+        with open(path_manifest, 'a') as f:
+            f.write('\n')
+        # end with
+    # end if
+    return {line[:-1] for line in seq_line if line.endswith('\n')}
+
+
 def main(path_file_source_url_list: Path, 
-         path_file_missing_url_list: Path, 
+         path_file_missing_url_list: ty.Optional[Path], 
          downloads_dir: Path = Path("./xsum-raw-downloads"),
          timeout: int = 15, 
-         max_attempts: int = 5):
+         max_attempts: int = 5,
+         concurrency: int = 8,
+         rate_per_host: float = 5.0,
+         path_manifest: ty.Optional[Path] = None,
+         use_shards: bool = True,
+         max_shard_size: int = 1 << 30):
+    """Downloads the URLs with *concurrency* threads, sharing a pool of
+    connections and at most *rate_per_host* requests per second to each host.
+
+    Every downloaded URL is appended to the manifest (by default
+    `downloads_dir/manifest.txt`), and the URLs found in it are skipped, so
+    that an interrupted run can be restarted.
+
+    With *use_shards*, the pages are stored compressed in a few shard files of
+    at most *max_shard_size* bytes in *downloads_dir* (see html_shards.py),
+    rather than as one file per URL.
+    """
     assert path_file_source_url_list.exists()
 
     seq_source_url_list = load_source_url_list(path_file_source_url_list)
-    if path_file_missing_url_list:
+    if path_file_missing_url_list and path_file_missing_url_list.exists():
         seq_missing_url_list = load_source_url_list(path_file_missing_url_list)
         seq_source_url_list = seq_missing_url_list
     # end if
 
     downloads_dir = Path(downloads_dir)
     downloads_dir.mkdir(parents=True, exist_ok=True)
+    if path_manifest is None:
+        path_manifest = downloads_dir / "manifest.txt"
+    # end if
 
-    logger.info(f"Files to be downloaded: {len(seq_source_url_list)}")
-    for url in tqdm.tqdm(seq_source_url_list):
-        download_wayback_html(url=url, downloads_dir=downloads_dir, timeout=timeout, max_attempts=max_attempts)
-
-        # deleting the url from the missing url list
-    # end for
+    set_done = load_manifest(path_manifest)
+    seq_todo = [url for url in seq_source_url_list if url not in set_done]
+    logger.info(f"Files to be downloaded: {len(seq_todo)} ({len(seq_source_url_list) - len(seq_todo)} already in {path_manifest})")
+
+    session = make_session(concurrency)
+    shard_writer = ShardWriter(str(downloads_dir), max_shard_size=max_shard_size) if use_shards else None
+    rate_limiter = HostRateLimiter(rate_per_host)
+    seq_failed = []
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        with open(path_manifest, 'a') as f_manifest, tqdm.tqdm(total=len(seq_todo)) as progress:
+            # submit lazily, so that only a few URLs per worker are queued at any time
+            iter_todo = iter(seq_todo)
+            running = {}
+            while True:
+                for url in iter_todo:
+                    future = executor.submit(download_wayback_html, url=url, downloads_dir=downloads_dir,
+                                             timeout=timeout, max_attempts=max_attempts,
+                                             session=session, rate_limiter=rate_limiter,
+                                             shard_writer=shard_writer)
+                    running[future] = url
+                    if len(running) >= 4 * concurrency:
+                        break
+                    # end if
+                # end for
+                if not running:
+                    break
+                # end if
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    url = running.pop(future)
+                    if future.result() is None:
+                        seq_failed.append(url)
+                    else:
+                        f_manifest.write(url + '\n')
+                        f_manifest.flush()
+                    # end if
+                    progress.update(1)
+                # end for
+            # end while
+        # end with
+    finally:
+        # when interrupted, wait for the running downloads but drop the queued ones
+        executor.shutdown(wait=True, cancel_futures=True)
+        if shard_writer is not None:
+            shard_writer.close()
+        # end if
+    # end try
+
+    logger.info(f"Failed to download {len(seq_failed)} URLs; rerun the script to retry them.")
+    return seq_failed
 
 
 # --- Example Usage ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the BBC articles from the Wayback Machine.")
+    parser.add_argument('--urls', type=str, default="XSum-WebArxiveUrls.txt", help='File with the URLs to download')
+    parser.add_argument('--missing-urls', type=str, default="XSum-WebArxiveUrls.missing.txt",
+                        help='If this file exists, only its URLs are downloaded')
+    parser.add_argument('--downloads-dir', type=str, default="./xsum-raw-downloads", help='Output directory')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='Append-only list of the downloaded URLs (default: DOWNLOADS_DIR/manifest.txt)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent downloads')
+    parser.add_argument('--rate', type=float, default=5.0, help='Maximum requests per second to a host (<= 0: no limit)')
+    parser.add_argument('--timeout', type=int, default=15, help='Timeout of a request in seconds')
+    parser.add_argument('--max-attempts', type=int, default=5, help='Maximum number of attempts per URL')
+    parser.add_argument('--storage', choices=['shards', 'files'], default='shards',
+                        help='Store the pages compressed in a few shard files, or as one HTML file per URL')
+    parser.add_argument('--max-shard-size', type=int, default=1 << 30, help='Maximum size of a shard in bytes')
+    args = parser.parse_args()
+
     logger = setup_logger()
-    
-    urls_file_to_download = "XSum-WebArxiveUrls.txt"
-    missing_urls_file = "XSum-WebArxiveUrls.missing.txt" 
-    downloads_dir = "./xsum-raw-downloads"
 
     main(
-        path_file_missing_url_list=Path(missing_urls_file),
-        path_file_source_url_list=Path(urls_file_to_download),
-        downloads_dir=Path(downloads_dir)
+        path_file_missing_url_list=Path(args.missing_urls),
+        path_file_source_url_list=Path(args.urls),
+        downloads_dir=Path(args.downloads_dir),
+        timeout=args.timeout,
+        max_attempts=args.max_attempts,
+        concurrency=args.concurrency,
+        rate_per_host=args.rate,
+        path_manifest=Path(args.manifest) if args.manifest else None,
+        use_shards=args.storage == 'shards',
+        max_shard_size=args.max_shard_size,
     )
-
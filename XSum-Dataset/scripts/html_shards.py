@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+"""Packed storage of the downloaded HTML pages.
+
+Instead of one file per URL, pages are zlib-compressed and appended to a few
+large shard files (shard-00000.bin, shard-00001.bin, ...), and a new shard is
+started when the current one reaches `max_shard_size` bytes. The directory
+also holds an append-only index, index.tsv, with one line per page:
+
+    url <TAB> shard <TAB> offset <TAB> length
+
+A record is only indexed once its data is written, so an interrupted
+download leaves at most a few unindexed bytes at the end of a shard.
+
+Works with Python 2.7 and Python 3.
+"""
+
+import os
+import threading
+import zlib
+
+INDEX_FILE = "index.tsv"
+SHARD_FILE = "shard-%05d.bin"
+
+
+def read_index(shards_dir):
+  """Returns a dict from URL to (shard, offset, length)."""
+  index = {}
+  index_path = os.path.join(shards_dir, INDEX_FILE)
+  if not os.path.exists(index_path):
+    return index
+  with open(index_path) as f:
+    for line in f:
+      fields = line.rstrip("\n").split("\t")
+      # skip a line cut short by a crash
+      if not line.endswith("\n") or len(fields) != 4:
+        continue
+      index[fields[0]] = (int(fields[1]), int(fields[2]), int(fields[3]))
+  return index
+
+
+def iter_records(shards_dir, index=None):
+  """Yields (url, html) pairs, reading each shard sequentially.
+
+  Args:
+    shards_dir: Directory of the shards.
+    index: The records to read, as returned by read_index (all by default).
+  """
+  if index is None:
+    index = read_index(shards_dir)
+  entries = sorted((shard, offset, length, url) for url, (shard, offset, length) in index.items())
+  f, current_shard, position = None, None, 0
+  try:
+    for shard, offset, length, url in entries:
+      if shard != current_shard:
+        if f is not None:
+          f.close()
+        f = open(os.path.join(shards_dir, SHARD_FILE % shard), "rb")
+        current_shard, position = shard, 0
+      if offset != position:
+        f.seek(offset)
+      yield url, zlib.decompress(f.read(length))
+      position = offset + length
+  finally:
+    if f is not None:
+      f.close()
+
+
+class ShardWriter(object):
+  """Appends compressed pages to rolling shards. Thread-safe.
+
+  Args:
+    shards_dir: Directory of the shards, created if needed. Writing resumes
+      after the records that are already indexed there.
+    max_shard_size: Size in bytes from which a new shard is started.
+    level: zlib compression level.
+  """
+
+  def __init__(self, shards_dir, max_shard_size=1 << 30, level=6):
+    if not os.path.exists(shards_dir):
+      os.makedirs(shards_dir)
+    self.shards_dir = shards_dir
+    self.max_shard_size = max_shard_size
+    self.level = level
+    self.lock = threading.Lock()
+    self.index = read_index(shards_dir)
+    self.index_file = open(os.path.join(shards_dir, INDEX_FILE), "a")
+    self.shard_file = None
+    self._open_shard(max([shard for shard, _, _ in self.index.values()] or [0]))
+
+  def _open_shard(self, shard):
+    if self.shard_file is not None:
+      self.shard_file.close()
+    path = os.path.join(self.shards_dir, SHARD_FILE % shard)
+    self.shard = shard
+    self.shard_file = open(path, "ab")
+    self.offset = os.path.getsize(path)
+
+  def __contains__(self, url):
+    return url in self.index
+
+  def add(self, url, html):
+    """Stores the page *html* (bytes) downloaded from *url*."""
+    record = zlib.compress(html, self.level)
+    with self.lock:
+      if self.offset > 0 and self.offset + len(record) > self.max_shard_size:
+        self._open_shard(self.shard + 1)
+      self.shard_file.write(record)
+      self.shard_file.flush()
+      self.index_file.write("%s\t%d\t%d\t%d\n" % (url, self.shard, self.offset, len(record)))
+      self.index_file.flush()
+      self.index[url] = (self.shard, self.offset, len(record))
+      self.offset += len(record)
+
+  def close(self):
+    with self.lock:
+      self.shard_file.close()
+      self.index_file.close()
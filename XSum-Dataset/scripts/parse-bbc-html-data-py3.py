@@ -0,0 +1,235 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+# Modifications Copyright 2018 Shashi Narayan
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Python 3 version of parse-bbc-html-data.py.
+
+Each article is decoded and parsed into an lxml tree once, and its title,
+introduction and rest of the content are extracted with a single precompiled
+XPath query. Articles are parsed in a process pool; the outputs and the
+failures are written in the order of the input.
+"""
+
+import argparse
+import multiprocessing
+import os
+import typing as ty
+from collections import namedtuple
+from pathlib import Path
+
+import cchardet as chardet
+import tqdm
+from lxml import etree
+from lxml import html
+
+import html_shards
+
+Story = namedtuple('Story', 'url title introduction restcontent')
+
+
+class ParseHtml:
+    """Parses the HTML of a BBC story.
+
+    The tree is built once, the embedded tweets and Instagram posts are
+    removed, and the title, introduction and rest content paragraphs are
+    selected together in document order.
+    """
+
+    # Elements to delete.
+    DELETE_XPATH = etree.XPath(
+        '//blockquote[contains(@class, "twitter-tweet")]'
+        ' | //blockquote[contains(@class, "instagram-media")]'
+    )
+
+    # Rest Content exclusions: ads, links, bylines, comments, headline and story introduction
+    BBC_EXCLUDE = (
+        'not(contains(@class, "story-headline"))'
+        ' and not(contains(@class, "story-body__h1"))'
+        ' and not(contains(@class, "story-body__introduction"))'
+        ' and not(contains(@class, "with-extracted-share-icons"))'
+    )
+
+    # Title, introduction and rest content selectors
+    CONTENT_XPATH = etree.XPath(
+        '//h1[contains(@class, "story-headline")]'
+        ' | //h1[contains(@class, "story-body__h1")]'
+        ' | //p[contains(@class, "story-body__introduction")]'
+        ' | //div[contains(@class, "story-body")]//p[%s]' % BBC_EXCLUDE    # story-body__inner
+    )
+
+    def __init__(self, url: str, story_html: bytes):
+        self.url = url
+        parser = html.HTMLParser(encoding=chardet.detect(story_html)['encoding'])
+        self.tree = html.document_fromstring(story_html, parser=parser)
+        for bad in self.DELETE_XPATH(self.tree):
+            bad.getparent().remove(bad)
+
+    def getstory(self) -> Story:
+        title, introduction, restcontent = [], [], []
+        for element in self.CONTENT_XPATH(self.tree):
+            text = element.text_content().strip()
+            if not text:
+                continue
+            # end if
+            if element.tag == 'h1':
+                title.append(text)
+            elif 'story-body__introduction' in element.get('class', ''):
+                introduction.append(text)
+            else:
+                restcontent.append(text)
+            # end if
+        # end for
+        return Story(self.url, title, introduction, restcontent)
+
+
+##############################################################
+
+def GenerateMapper(t: ty.Tuple[str, str, bytes]) -> ty.Tuple[str, ty.Optional[Story], ty.Optional[str]]:
+    """Parse BBC HTML File
+
+    Args:
+        (bbcid, url, story_html)
+
+    Returns:
+        (bbcid, story, error): the story is None if the page could not be parsed.
+    """
+    bbcid, url, story_html = t
+    if not story_html:
+        return bbcid, None, "EMPTY HTML FILE."
+    # end if
+    try:
+        return bbcid, ParseHtml(url, story_html).getstory(), None
+    except Exception as e:
+        return bbcid, None, "PARSING ERROR: %s" % repr(e).replace("\n", " ")
+    # end try
+
+
+def get_download_file_name(url: str) -> str:
+    fileid = url.replace("http://web.archive.org/web/", "")
+    fileid = fileid.replace("http://", "")
+    htmlfileid = fileid.replace("/", "-") + ".html"
+    return htmlfileid
+
+
+def iter_downloads(download_dir: Path,
+                   bbcids_dict: ty.Dict[str, str],
+                   seq_failed: ty.List[str]) -> ty.Iterator[ty.Tuple[str, str, bytes]]:
+    """Yields (bbcid, webarxivid, htmldata) for the downloaded pages of bbcids_dict.
+
+    If the pages are stored in shards (see html_shards.py), the shards are read
+    sequentially; otherwise, each page is read from its own file.
+    """
+    if (download_dir / html_shards.INDEX_FILE).is_file():
+        webarxivid_bbcid_dict = {webarxivid: bbcid for bbcid, webarxivid in bbcids_dict.items()}
+        index = html_shards.read_index(str(download_dir))
+        for bbcid, webarxivid in bbcids_dict.items():
+            if webarxivid not in index:
+                seq_failed.append(bbcid + "\tHTML FILE IS NOT YET DOWNLOADED.")
+            # end if
+        # end for
+        index = {url: entry for url, entry in index.items() if url in webarxivid_bbcid_dict}
+        for webarxivid, htmldata in html_shards.iter_records(str(download_dir), index):
+            yield webarxivid_bbcid_dict[webarxivid], webarxivid, htmldata
+        # end for
+        return
+    # end if
+
+    for bbcid, webarxivid in bbcids_dict.items():
+        downloaded_file = download_dir / get_download_file_name(webarxivid)
+        if not downloaded_file.is_file():
+            seq_failed.append(bbcid + "\tHTML FILE IS NOT YET DOWNLOADED.")
+            continue
+        # end if
+        yield bbcid, webarxivid, downloaded_file.read_bytes()
+    # end for
+
+
+def main(download_dir: Path,
+         path_map_webarxiv_bbcid: Path,
+         result_dir: Path,
+         path_failed_ids: Path,
+         num_workers: int = 1,
+         chunksize: int = 16):
+    result_dir.mkdir(parents=True, exist_ok=True)
+
+    # Get all bbcids
+    bbcids_dict = {}
+    with open(path_map_webarxiv_bbcid) as f:
+        for line in f:
+            data = line.strip().split()
+            bbcids_dict[data[1]] = data[0]
+        # end for
+    # end with
+    print(len(bbcids_dict))
+
+    # Skip the processed ids
+    todo_bbcids_dict = {bbcid: webarxivid for bbcid, webarxivid in bbcids_dict.items()
+                        if not (result_dir / (bbcid + ".data")).is_file()}
+
+    seq_failed = []
+    count = 0
+    with multiprocessing.Pool(num_workers) as pool:
+        # imap keeps the order of the input
+        results = pool.imap(GenerateMapper, iter_downloads(download_dir, todo_bbcids_dict, seq_failed),
+                            chunksize=chunksize)
+        for bbcid, story, error in tqdm.tqdm(results, total=len(todo_bbcids_dict)):
+            if story is None:
+                seq_failed.append(bbcid + "\t" + error)
+                continue
+            # end if
+            if not ((len(story.title) == 1) and (len(story.introduction) == 1) and (len(story.restcontent) != 0)):
+                seq_failed.append(bbcid + "\t" + str(len(story.title)) + "\t" + str(len(story.introduction)) +
+                                  "\t" + str(len(story.restcontent)))
+                continue
+            # end if
+
+            # Write the parsed output
+            with open(result_dir / (bbcid + ".data"), "w", encoding="utf-8") as foutput:
+                foutput.write("[XSUM]URL[XSUM]\n" + story.url +
+                              "\n\n[XSUM]INTRODUCTION[XSUM]\n" + story.introduction[0] +
+                              "\n\n[XSUM]RESTBODY[XSUM]\n" + "\n".join(story.restcontent) + "\n")
+            # end with
+            count += 1
+        # end for
+    # end with
+
+    with open(path_failed_ids, "w") as failed_id_file:
+        for line in seq_failed:
+            failed_id_file.write(line + "\n")
+        # end for
+    # end with
+    print(f"Extracted {count} articles; {len(seq_failed)} failures are listed in {path_failed_ids}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the text of the downloaded BBC articles.")
+    parser.add_argument('--download-dir', type=str, default="./xsum-raw-downloads",
+                        help='Directory of the downloaded HTML files or shards')
+    parser.add_argument('--bbcids', type=str, default="XSum-WebArxiveUrls-BBCids.txt",
+                        help='Mapping from Wayback URLs to BBC ids')
+    parser.add_argument('--result-dir', type=str, default="./xsum-extracts-from-downloads", help='Output directory')
+    parser.add_argument('--failed-ids', type=str, default="xsum-extracts-from-downloads-failedIds.txt",
+                        help='Report of the ids that could not be extracted')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of parsing processes')
+    parser.add_argument('--chunksize', type=int, default=16, help='Number of articles sent to a process at once')
+    args = parser.parse_args()
+
+    main(
+        download_dir=Path(args.download_dir),
+        path_map_webarxiv_bbcid=Path(args.bbcids),
+        result_dir=Path(args.result_dir),
+        path_failed_ids=Path(args.failed_ids),
+        num_workers=args.workers,
+        chunksize=args.chunksize,
+    )
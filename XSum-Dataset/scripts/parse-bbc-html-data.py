@@ -22,6 +22,7 @@ from collections import namedtuple
 from lxml import html
 import cchardet as chardet
 from itertools import chain
+import html_shards
 
 RawStory = namedtuple('RawStory', 'url html')
 StoryTitle = namedtuple('StoryTitle', 'url title')
@@ -161,6 +162,33 @@ def get_download_file_name(url):
   htmlfileid = fileid.replace("/", "-") + ".html"
   return htmlfileid
 
+def iter_downloads(download_dir, bbcids_dict, failed_id_file):
+  """Yields (bbcid, webarxivid, htmldata) for the downloaded pages of bbcids_dict.
+
+  If the pages are stored in shards (see html_shards.py), the shards are read
+  sequentially; otherwise, each page is read from its own file.
+  """
+  if os.path.isfile(download_dir+"/"+html_shards.INDEX_FILE):
+    webarxivid_bbcid_dict = dict((webarxivid, bbcid) for bbcid, webarxivid in bbcids_dict.items())
+    index = html_shards.read_index(download_dir)
+    for bbcid in bbcids_dict:
+      if bbcids_dict[bbcid] not in index:
+        failed_id_file.write(bbcid+"\tHTML FILE IS NOT YET DOWNLOADED.\n")
+    index = dict((url, entry) for url, entry in index.items() if url in webarxivid_bbcid_dict)
+    for webarxivid, htmldata in html_shards.iter_records(download_dir, index):
+      yield webarxivid_bbcid_dict[webarxivid], webarxivid, htmldata
+    return
+
+  for bbcid in bbcids_dict:
+    webarxivid = bbcids_dict[bbcid]
+    downloaded_file = download_dir+"/"+get_download_file_name(webarxivid)
+    
+    if not os.path.isfile(downloaded_file):
+      failed_id_file.write(bbcid+"\tHTML FILE IS NOT YET DOWNLOADED.\n")
+      continue
+
+    yield bbcid, webarxivid, open(downloaded_file).read()
+
 if __name__ == "__main__":
   download_dir = "./xsum-raw-downloads"
   map_webarxiv_bbcid_file = "XSum-WebArxiveUrls-BBCids.txt"
@@ -178,21 +206,14 @@ if __name__ == "__main__":
 
   count = 0
 
-  # Process all downloads
+  # Skip the processed ids
+  todo_bbcids_dict = {}
   for bbcid in bbcids_dict:
-    
-    if os.path.isfile(result_dir+"/"+bbcid+".data"):
-      # Alread processed
-      continue
+    if not os.path.isfile(result_dir+"/"+bbcid+".data"):
+      todo_bbcids_dict[bbcid] = bbcids_dict[bbcid]
 
-    webarxivid = bbcids_dict[bbcid]
-    downloaded_file = download_dir+"/"+get_download_file_name(webarxivid)
-    
-    if not os.path.isfile(downloaded_file):
-      failed_id_file.write(bbcid+"\tHTML FILE IS NOT YET DOWNLOADED.\n")
-      continue
-
-    htmldata = open(downloaded_file).read()
+  # Process all downloads
+  for bbcid, webarxivid, htmldata in iter_downloads(download_dir, todo_bbcids_dict, failed_id_file):
     
     # url, corpus, htmldata
     story_title, story_introduction, story_restcontent = GenerateMapper((webarxivid, "bbc", htmldata))
@@ -0,0 +1,166 @@
+"""Tests of scripts/download-bbc-articles-py3.py against a local stub HTTP server.
+
+Run from XSum-Dataset with: python -m unittest discover -s tests
+"""
+
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+spec = importlib.util.spec_from_file_location(
+    "download_bbc_articles", os.path.join(SCRIPTS_DIR, "download-bbc-articles-py3.py"))
+download_bbc_articles = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(download_bbc_articles)
+download_bbc_articles.logger = logging.getLogger("internet_archive_downloader")
+
+import html_shards  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+  """Serves /web/.../<name>, where names starting with "flaky" fail with a 503
+  the first time, names starting with "slow" time out the first time, and
+  every request takes `server.delay` seconds."""
+
+  protocol_version = "HTTP/1.1"
+
+  def log_message(self, *args):
+    pass
+
+  def do_GET(self):
+    server = self.server
+    name = self.path.rsplit("/", 1)[-1]
+    with server.lock:
+      server.requests.append((time.monotonic(), name))
+      hits = sum(1 for _, n in server.requests if n == name)
+    time.sleep(server.delay)
+    if name.startswith("slow") and hits == 1:
+      time.sleep(server.timeout_delay)
+    if name.startswith("flaky") and hits == 1:
+      code, body = 503, b"unavailable"
+    else:
+      code, body = 200, ("<html>%s</html>" % name).encode("utf-8")
+    try:
+      self.send_response(code)
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    except (BrokenPipeError, ConnectionResetError):
+      pass
+
+
+class TestDownload(unittest.TestCase):
+
+  def setUp(self):
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    self.server.daemon_threads = True
+    self.server.lock = threading.Lock()
+    self.server.requests = []
+    self.server.delay = 0.0
+    self.server.timeout_delay = 2.0
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    self.tmpdir = tempfile.mkdtemp()
+    self.downloads_dir = Path(self.tmpdir) / "downloads"
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    shutil.rmtree(self.tmpdir)
+
+  def make_urls(self, names):
+    urls = ["http://127.0.0.1:%d/web/20170101000000/http://www.bbc.com/news/%s" % (self.server.server_port, name)
+            for name in names]
+    path = Path(self.tmpdir) / "urls.txt"
+    path.write_text("\n".join(urls) + "\n")
+    return urls, path
+
+  def run_main(self, path, **kwargs):
+    options = dict(timeout=1, max_attempts=3, concurrency=8, rate_per_host=0)
+    options.update(kwargs)
+    return download_bbc_articles.main(path, None, self.downloads_dir, **options)
+
+  def downloaded(self):
+    return {url: html.decode("utf-8") for url, html in html_shards.iter_records(str(self.downloads_dir))}
+
+  def manifest(self):
+    return download_bbc_articles.load_manifest(self.downloads_dir / "manifest.txt")
+
+  def test_throughput(self):
+    self.server.delay = 0.1
+    urls, path = self.make_urls(["%d" % i for i in range(40)])
+    start = time.monotonic()
+    failed = self.run_main(path, concurrency=8)
+    elapsed = time.monotonic() - start
+    self.assertEqual(failed, [])
+    self.assertEqual(set(self.downloaded()), set(urls))
+    # 40 requests of 0.1s each take 4s one at a time
+    self.assertLess(elapsed, 2.0)
+
+  def test_retry(self):
+    urls, path = self.make_urls(["flaky1", "flaky2", "slow1", "ok1", "ok2"])
+    failed = self.run_main(path)
+    self.assertEqual(failed, [])
+    downloaded = self.downloaded()
+    self.assertEqual(set(downloaded), set(urls))
+    for url in urls:
+      self.assertEqual(downloaded[url], "<html>%s</html>" % url.rsplit("/", 1)[-1])
+    self.assertEqual(self.manifest(), set(urls))
+    names = [name for _, name in self.server.requests]
+    for name in ["flaky1", "flaky2", "slow1"]:
+      self.assertEqual(names.count(name), 2)
+    for name in ["ok1", "ok2"]:
+      self.assertEqual(names.count(name), 1)
+
+  def test_rate_limit(self):
+    rate = 20.0
+    urls, path = self.make_urls(["%d" % i for i in range(20)])
+    failed = self.run_main(path, concurrency=8, rate_per_host=rate)
+    self.assertEqual(failed, [])
+    times = sorted(t for t, _ in self.server.requests)
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # requests are spaced by 1 / rate seconds, up to the scheduling jitter of
+    # the client and server threads (without the limit, they arrive together)
+    self.assertGreater(min(gaps), 0.5 / rate)
+    self.assertGreater(times[-1] - times[0], (len(urls) - 1) * 0.95 / rate)
+
+  def test_resume(self):
+    urls, path = self.make_urls(["%d" % i for i in range(30)])
+    download = download_bbc_articles.download_wayback_html
+    calls = []
+
+    def interrupted_download(url, **kwargs):
+      calls.append(url)
+      if len(calls) > 10:
+        raise RuntimeError("interrupted")
+      return download(url, **kwargs)
+
+    download_bbc_articles.download_wayback_html = interrupted_download
+    try:
+      with self.assertRaises(RuntimeError):
+        self.run_main(path, concurrency=2)
+    finally:
+      download_bbc_articles.download_wayback_html = download
+    done = self.manifest()
+    self.assertTrue(0 < len(done) < len(urls))
+
+    del self.server.requests[:]
+    failed = self.run_main(path, concurrency=2)
+    self.assertEqual(failed, [])
+    fetched = [name for _, name in self.server.requests]
+    self.assertEqual(sorted(fetched), sorted(url.rsplit("/", 1)[-1] for url in urls if url not in done))
+    self.assertEqual(self.manifest(), set(urls))
+    self.assertEqual(set(self.downloaded()), set(urls))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+"""
+Time a training step (forward and backward) of a model with several values of
+--checkpoint-activations, and measure the memory of the activations saved for
+the backward pass (and the peak CUDA memory, on GPU). With checkpointing, the
+activations of one group of layers are also held while it is recomputed
+during the backward pass.
+"""
+
+import argparse
+
+import torch
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    common.add_model_args(parser)
+    parser.add_argument('--checkpoint-activations', default=[0, 1, 5], type=int, nargs='+', metavar='N',
+                        help='values of --checkpoint-activations to compare')
+    parser.add_argument('--batch-size', default=16, type=int, metavar='N', help='number of sentences')
+    parser.add_argument('--src-len', default=400, type=int, metavar='N', help='source length')
+    parser.add_argument('--tgt-len', default=30, type=int, metavar='N', help='target length')
+    parser.add_argument('--steps', default=5, type=int, metavar='N', help='number of timed steps')
+    args = parser.parse_args()
+    print(args)
+    cuda = common.use_cuda(args)
+
+    for n in args.checkpoint_activations:
+        torch.manual_seed(1)
+        model, dictionary = common.build_model(args, checkpoint_activations=n)
+        model.train()
+        inputs = sample_inputs(args, model, dictionary, cuda)
+
+        def step():
+            model.zero_grad()
+            model(*inputs).sum().backward()
+
+        saved = saved_tensor_bytes(model, lambda: model(*inputs))
+        if cuda:
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats()
+        t = common.timeit(step, args.steps, cuda=cuda)
+        peak = ', {:.0f} MB peak CUDA memory'.format(torch.cuda.max_memory_allocated() / 2**20) if cuda else ''
+        print('| checkpoint-activations {}: {:.0f} ms/step, {:.0f} MB of activations saved for backward{}'.format(
+            n, t * 1000, saved / 2**20, peak))
+        del model, inputs
+
+
+def sample_inputs(args, model, dictionary, cuda):
+    """Random source tokens, source lengths, document topics, word topics and
+    previous output tokens."""
+    embed_dim = model.encoder.embed_tokens.embedding_dim
+    src_tokens = torch.randint(dictionary.nspecial, len(dictionary), (args.batch_size, args.src_len))
+    src_lengths = torch.LongTensor(args.batch_size).fill_(args.src_len)
+    src_doctopic = torch.rand(args.batch_size, embed_dim)
+    src_wordtopics = torch.rand(args.batch_size, args.src_len, embed_dim)
+    prev_output_tokens = torch.randint(dictionary.nspecial, len(dictionary), (args.batch_size, args.tgt_len))
+    inputs = (src_tokens, src_lengths, src_doctopic, src_wordtopics, prev_output_tokens)
+    return tuple(x.cuda() for x in inputs) if cuda else inputs
+
+
+def saved_tensor_bytes(model, forward):
+    """Return the size of the (non-parameter) tensors that autograd saves
+    for the backward pass during ``forward()``."""
+    params = {p.data_ptr() for p in model.parameters()}
+    storages = {}
+
+    def pack(t):
+        if t.data_ptr() not in params:
+            storages[t.untyped_storage().data_ptr()] = t.untyped_storage().nbytes()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        forward()
+    return sum(storages.values())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import argparse
+import time
+
+import torch
+
+from fairseq import models
+from fairseq.dictionary import Dictionary
+
+
+def add_model_args(parser):
+    parser.add_argument('--arch', '-a', default='fconv_newsroom', metavar='ARCH',
+                        help='model architecture')
+    parser.add_argument('--vocab-size', default=50000, type=int, metavar='N',
+                        help='size of the (random) source and target vocabularies')
+    parser.add_argument('--cpu', action='store_true', help='run on CPU even if CUDA is available')
+
+
+def build_model(args, **overrides):
+    """Build a randomly initialized model of architecture *args.arch*."""
+    model_args = argparse.Namespace(
+        arch=args.arch, dropout=0.1, max_source_positions=1024, max_target_positions=1024, **overrides)
+    models.ARCH_CONFIG_REGISTRY[args.arch](model_args)
+    dictionary = Dictionary()
+    for i in range(args.vocab_size - dictionary.nspecial):
+        dictionary.add_symbol(str(i))
+    model = models.build_model(model_args, dictionary, dictionary)
+    if use_cuda(args):
+        model.cuda()
+    return model, dictionary
+
+
+def use_cuda(args):
+    return torch.cuda.is_available() and not args.cpu
+
+
+def timeit(fn, num_runs, num_warmup=2, cuda=False):
+    """Return the average time of ``fn()`` in seconds."""
+    for _ in range(num_warmup):
+        fn()
+    if cuda:
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(num_runs):
+        fn()
+    if cuda:
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / num_runs
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+"""
+Time the startup of generate.py (importing fairseq.options and building the
+generation parser) in fresh interpreters, after torch is imported, with the
+lazy registries and with every registered module imported, as the registries
+used to do.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# torch is imported by every entry point, so it is left out of the timing
+STARTUP = """
+import sys, time
+import torch
+start = time.perf_counter()
+from fairseq import options
+options.get_generation_parser()
+if {eager}:
+    from fairseq.criterions import CRITERION_REGISTRY
+    from fairseq.models import ARCH_MODEL_REGISTRY, MODEL_REGISTRY
+    from fairseq.optim import OPTIMIZER_REGISTRY
+    from fairseq.optim.lr_scheduler import LR_SCHEDULER_REGISTRY
+    for registry in [CRITERION_REGISTRY, ARCH_MODEL_REGISTRY, MODEL_REGISTRY, OPTIMIZER_REGISTRY,
+                     LR_SCHEDULER_REGISTRY]:
+        for name in registry:
+            registry[name]
+print(time.perf_counter() - start, sum(name.startswith('fairseq') for name in sys.modules))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', default=10, type=int, metavar='N', help='number of interpreters per version')
+    args = parser.parse_args()
+    print(args)
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    # alternate the two versions
+    times = {'lazy': [], 'eager': []}
+    num_modules = {}
+    for _ in range(args.repeat):
+        for name in times:
+            out = subprocess.check_output(
+                [sys.executable, '-c', STARTUP.format(eager=(name == 'eager'))], cwd=ROOT, env=env)
+            t, num_modules[name] = out.decode().split()
+            times[name].append(float(t))
+    for name, ts in times.items():
+        print('| {}: median {:.0f} ms, best {:.0f} ms, {} fairseq modules imported'.format(
+            name, statistics.median(ts) * 1000, min(ts) * 1000, num_modules[name]))
+
+
+if __name__ == '__main__':
+    main()
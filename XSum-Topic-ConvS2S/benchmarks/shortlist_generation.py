@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+"""
+Time beam search over the full target vocabulary and with vocabulary
+shortlists (--shortlist-topk) on random source documents. Every hypothesis
+is generated to --maxlen tokens, so that all versions run the same number of
+steps. See compare_generation.py for the quality of a trained model.
+"""
+
+import argparse
+
+import torch
+
+from fairseq.sequence_generator import SequenceGenerator
+from fairseq.vocab_shortlist import VocabShortlist
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    common.add_model_args(parser)
+    parser.add_argument('--shortlist-topk', default=[1000, 5000], type=int, nargs='+', metavar='N',
+                        help='values of --shortlist-topk to compare with the full vocabulary')
+    parser.add_argument('--batch-size', default=8, type=int, metavar='N', help='number of documents')
+    parser.add_argument('--src-len', default=400, type=int, metavar='N', help='source length')
+    parser.add_argument('--beam', default=10, type=int, metavar='N', help='beam size')
+    parser.add_argument('--maxlen', default=30, type=int, metavar='N', help='output length')
+    parser.add_argument('--steps', default=2, type=int, metavar='N', help='number of timed batches')
+    parser.add_argument('--repeat', default=3, type=int, metavar='N', help='number of timings of each version')
+    args = parser.parse_args()
+    print(args)
+    cuda = common.use_cuda(args)
+
+    torch.manual_seed(1)
+    model, dictionary = common.build_model(args)
+    model.eval()
+    model.make_generation_fast_(beamable_mm_beam_size=args.beam)
+    inputs = sample_inputs(args, model, dictionary, cuda)
+
+    versions = []
+    for topk in [0] + args.shortlist_topk:
+        shortlist = VocabShortlist(dictionary, dictionary, topk=topk) if topk > 0 else None
+        translator = SequenceGenerator(
+            [model], beam_size=args.beam, minlen=args.maxlen, maxlen=args.maxlen, shortlist=shortlist)
+        size = len(dictionary) if shortlist is None else shortlist.candidates(inputs[0]).numel()
+        versions.append((topk, translator, size))
+
+    # alternate the versions and keep the best time of each
+    times = [float('inf')] * len(versions)
+    for _ in range(args.repeat):
+        for i, (_, translator, _) in enumerate(versions):
+            t = common.timeit(lambda: translator.generate(*inputs), args.steps, num_warmup=1, cuda=cuda)
+            times[i] = min(times[i], t)
+    for (topk, _, size), t in zip(versions, times):
+        print('| shortlist-topk {}: {:.0f} ms/batch ({:.2f}x), {} candidate words'.format(
+            topk, t * 1000, times[0] / t, size))
+
+
+def sample_inputs(args, model, dictionary, cuda):
+    """Random source tokens, source lengths, document topics and word topics."""
+    embed_dim = model.encoder.embed_tokens.embedding_dim
+    src_tokens = torch.randint(dictionary.nspecial, len(dictionary), (args.batch_size, args.src_len))
+    src_tokens[:, -1] = dictionary.eos()
+    src_lengths = torch.LongTensor(args.batch_size).fill_(args.src_len)
+    src_doctopic = torch.rand(args.batch_size, embed_dim)
+    src_wordtopics = torch.rand(args.batch_size, args.src_len, embed_dim)
+    inputs = (src_tokens, src_lengths, src_doctopic, src_wordtopics)
+    return tuple(x.cuda() for x in inputs) if cuda else inputs
+
+
+if __name__ == '__main__':
+    main()
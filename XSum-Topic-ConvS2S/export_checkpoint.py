@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+#
+
+import argparse
+import os
+
+import torch
+from torch.serialization import default_restore_location
+
+from fairseq import utils
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export a training checkpoint for inference: drop the optimizer '
+                    'state and store the model parameters in a memory-mappable file.')
+    parser.add_argument('--path', required=True, metavar='FILE',
+                        help='training checkpoint')
+    parser.add_argument('--output', required=True, metavar='FILE',
+                        help='inference checkpoint to write')
+    parser.add_argument('--fp16', action='store_true',
+                        help='store floating point parameters in half precision')
+
+    args = parser.parse_args()
+    print(args)
+
+    state = torch.load(args.path, map_location=lambda s, l: default_restore_location(s, 'cpu'))
+    utils.save_inference_state(args.output, state['args'], state['model'], fp16=args.fp16)
+
+    print('| exported {} ({:.1f} MB) to {} ({:.1f} MB)'.format(
+        args.path, os.path.getsize(args.path) / 2**20,
+        args.output, os.path.getsize(args.output) / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -57,11 +57,7 @@ class Scorer(object):
             raise TypeError('pred must be a torch.IntTensor(got {})'
                             .format(type(pred)))
 
-        assert self.unk > 0, 'unknown token index must be >0'
-        rref = ref.clone()
-        rref.apply_(lambda x: x if x != self.unk else -x)
-
-        rref = rref.contiguous().view(-1)
+        rref = self._mask_unk(ref.contiguous().view(-1))
         pred = pred.contiguous().view(-1)
 
         C.bleu_add(
@@ -73,6 +69,60 @@ class Scorer(object):
             ctypes.c_int(self.pad),
             ctypes.c_int(self.eos))
 
+    def add_many(self, refs, preds):
+        """Add a list of references and the corresponding list of predictions
+        with a single call into libbleu."""
+        assert len(refs) == len(preds)
+        if len(refs) == 0:
+            return
+        for ref, pred in zip(refs, preds):
+            if not isinstance(ref, torch.IntTensor):
+                raise TypeError('ref must be a torch.IntTensor (got {})'
+                                .format(type(ref)))
+            if not isinstance(pred, torch.IntTensor):
+                raise TypeError('pred must be a torch.IntTensor(got {})'
+                                .format(type(pred)))
+        if not hasattr(C, 'bleu_add_many'):
+            # libbleu was built before bleu_add_many was added
+            for ref, pred in zip(refs, preds):
+                self.add(ref, pred)
+            return
+
+        rrefs = self._mask_unk(torch.cat([ref.contiguous().view(-1) for ref in refs]))
+        preds_cat = torch.cat([pred.contiguous().view(-1) for pred in preds])
+
+        def offsets(tensors):
+            res = (ctypes.c_size_t * (len(tensors) + 1))()
+            for i, t in enumerate(tensors):
+                res[i + 1] = res[i] + t.numel()
+            return res
+
+        C.bleu_add_many(
+            ctypes.byref(self.stat),
+            ctypes.c_size_t(len(refs)),
+            offsets(refs),
+            ctypes.c_void_p(rrefs.data_ptr()),
+            offsets(preds),
+            ctypes.c_void_p(preds_cat.data_ptr()),
+            ctypes.c_int(self.pad),
+            ctypes.c_int(self.eos))
+
+    def _mask_unk(self, ref):
+        """Negate the unknown token indices of *ref*, so that they never
+        match a prediction."""
+        assert self.unk > 0, 'unknown token index must be >0'
+        return ref.masked_fill(ref.eq(self.unk), -self.unk)
+
+    def stat_dict(self):
+        """Return the accumulated statistics as a picklable dict."""
+        return {name: getattr(self.stat, name) for name, _ in BleuStat._fields_}
+
+    def merge(self, stat_dict):
+        """Add statistics accumulated by another Scorer (see :func:`stat_dict`),
+        e.g., in another process."""
+        for name, _ in BleuStat._fields_:
+            setattr(self.stat, name, getattr(self.stat, name) + stat_dict[name])
+
     def score(self, order=4):
         psum = sum(math.log(p) if p > 0 else float('-Inf')
                    for p in self.precision()[:order])
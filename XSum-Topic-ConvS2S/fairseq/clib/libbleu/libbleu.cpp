@@ -129,4 +129,20 @@ void bleu_add(
   bleu_addngram(&stat->count4, &stat->match4, 4, reflen, ref, predlen, pred);
 }
 
+// add n sentence pairs; sentence i of refs (preds) is stored at
+// [ref_offsets[i], ref_offsets[i + 1]) ([pred_offsets[i], pred_offsets[i + 1]])
+void bleu_add_many(
+    bleu_stat* stat, size_t n,
+    size_t* ref_offsets, int* refs, size_t* pred_offsets, int* preds,
+    int pad, int eos) {
+
+  for (size_t i = 0; i < n; i++) {
+    bleu_add(
+        stat,
+        ref_offsets[i + 1] - ref_offsets[i], refs + ref_offsets[i],
+        pred_offsets[i + 1] - pred_offsets[i], preds + pred_offsets[i],
+        pad, eos);
+  }
+}
+
 }
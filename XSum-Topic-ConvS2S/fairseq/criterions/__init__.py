@@ -5,13 +5,14 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
-import importlib
 import os
 
+from fairseq.registry import LazyRegistry
+
 from .fairseq_criterion import FairseqCriterion
 
 
-CRITERION_REGISTRY = {}
+CRITERION_REGISTRY = LazyRegistry(__name__, os.path.dirname(__file__), 'register_criterion')
 CRITERION_CLASS_NAMES = set()
 
 
@@ -23,7 +24,7 @@ def register_criterion(name):
     """Decorator to register a new criterion."""
 
     def register_criterion_cls(cls):
-        if name in CRITERION_REGISTRY:
+        if name in CRITERION_REGISTRY.loaded:
             raise ValueError('Cannot register duplicate criterion ({})'.format(name))
         if not issubclass(cls, FairseqCriterion):
             raise ValueError('Criterion ({}: {}) must extend FairseqCriterion'.format(name, cls.__name__))
@@ -31,15 +32,8 @@ def register_criterion(name):
             # We use the criterion class name as a unique identifier in
             # checkpoints, so all criterions must have unique class names.
             raise ValueError('Cannot register criterion with duplicate class name ({})'.format(cls.__name__))
-        CRITERION_REGISTRY[name] = cls
+        CRITERION_REGISTRY.loaded[name] = cls
         CRITERION_CLASS_NAMES.add(cls.__name__)
         return cls
 
     return register_criterion_cls
-
-
-# automatically import any Python files in the criterions/ directory
-for file in os.listdir(os.path.dirname(__file__)):
-    if file.endswith('.py') and not file.startswith('_'):
-        module = file[:file.find('.py')]
-        importlib.import_module('fairseq.criterions.' + module)
@@ -47,17 +47,21 @@ def suppress_output():
     __builtin__.print = print
 
 
-def all_reduce_and_rescale_tensors(tensors, rescale_denom, buffer_size=10485760):
+def all_reduce_and_rescale_tensors(tensors, rescale_denom, buffer_size=10485760,
+                                   compute_norm=False):
     """All-reduce and rescale tensors in chunks of the specified size.
 
     Args:
         tensors: list of Tensors to all-reduce
         rescale_denom: denominator for rescaling summed Tensors
         buffer_size: all-reduce chunk size in bytes
+        compute_norm: also return the total 2-norm of the rescaled tensors,
+            computed on the all-reduce buffer while it is in memory
     """
     # buffer size is in bytes, determine equiv. # of elements based on data type
     buffer_t = tensors[0].new(math.ceil(buffer_size / tensors[0].element_size())).zero_()
     buffer = []
+    sq_norms = []
 
     def all_reduce_buffer():
         # copy tensors into buffer_t
@@ -70,6 +74,8 @@ def all_reduce_and_rescale_tensors(tensors, rescale_denom, buffer_size=10485760)
         # all-reduce and rescale
         torch.distributed.all_reduce(buffer_t[:offset])
         buffer_t.div_(rescale_denom)
+        if compute_norm:
+            sq_norms.append(buffer_t[:offset].norm()**2)
 
         # copy all-reduced buffer back into tensors
         offset = 0
@@ -85,6 +91,8 @@ def all_reduce_and_rescale_tensors(tensors, rescale_denom, buffer_size=10485760)
             # tensor is bigger than buffer, all-reduce and rescale directly
             torch.distributed.all_reduce(t)
             t.div_(rescale_denom)
+            if compute_norm:
+                sq_norms.append(t.norm()**2)
         elif filled + sz > buffer_size:
             # buffer is full, all-reduce and replace buffer with grad
             all_reduce_buffer()
@@ -98,6 +106,9 @@ def all_reduce_and_rescale_tensors(tensors, rescale_denom, buffer_size=10485760)
     if len(buffer) > 0:
         all_reduce_buffer()
 
+    if compute_norm:
+        return math.sqrt(torch.stack(sq_norms).sum().item())
+
 
 def all_gather_list(data, max_size=4096):
     """Gathers arbitrary data from all nodes into a list."""
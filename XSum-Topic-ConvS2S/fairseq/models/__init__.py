@@ -5,18 +5,19 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
-import importlib
 import os
 
+from fairseq.registry import LazyRegistry
+
 from .fairseq_decoder import FairseqDecoder  # noqa: F401
 from .fairseq_encoder import FairseqEncoder  # noqa: F401
 from .fairseq_incremental_decoder import FairseqIncrementalDecoder  # noqa: F401
 from .fairseq_model import FairseqModel  # noqa: F401
 
 
-MODEL_REGISTRY = {}
-ARCH_MODEL_REGISTRY = {}
-ARCH_CONFIG_REGISTRY = {}
+MODEL_REGISTRY = LazyRegistry(__name__, os.path.dirname(__file__), 'register_model')
+ARCH_MODEL_REGISTRY = LazyRegistry(__name__, os.path.dirname(__file__), 'register_model_architecture', 1)
+ARCH_CONFIG_REGISTRY = LazyRegistry(__name__, os.path.dirname(__file__), 'register_model_architecture', 1)
 
 
 def build_model(args, src_dict, dst_dict):
@@ -27,11 +28,11 @@ def register_model(name):
     """Decorator to register a new model (e.g., LSTM)."""
 
     def register_model_cls(cls):
-        if name in MODEL_REGISTRY:
+        if name in MODEL_REGISTRY.loaded:
             raise ValueError('Cannot register duplicate model ({})'.format(name))
         if not issubclass(cls, FairseqModel):
             raise ValueError('Model ({}: {}) must extend FairseqModel'.format(name, cls.__name__))
-        MODEL_REGISTRY[name] = cls
+        MODEL_REGISTRY.loaded[name] = cls
         return cls
 
     return register_model_cls
@@ -43,19 +44,12 @@ def register_model_architecture(model_name, arch_name):
     def register_model_arch_fn(fn):
         if model_name not in MODEL_REGISTRY:
             raise ValueError('Cannot register model architecture for unknown model type ({})'.format(model_name))
-        if arch_name in ARCH_MODEL_REGISTRY:
+        if arch_name in ARCH_MODEL_REGISTRY.loaded:
             raise ValueError('Cannot register duplicate model architecture ({})'.format(arch_name))
         if not callable(fn):
             raise ValueError('Model architecture must be callable ({})'.format(arch_name))
-        ARCH_MODEL_REGISTRY[arch_name] = MODEL_REGISTRY[model_name]
-        ARCH_CONFIG_REGISTRY[arch_name] = fn
+        ARCH_MODEL_REGISTRY.loaded[arch_name] = MODEL_REGISTRY[model_name]
+        ARCH_CONFIG_REGISTRY.loaded[arch_name] = fn
         return fn
 
     return register_model_arch_fn
-
-
-# automatically import any Python files in the models/ directory
-for file in os.listdir(os.path.dirname(__file__)):
-    if file.endswith('.py') and not file.startswith('_'):
-        module = file[:file.find('.py')]
-        importlib.import_module('fairseq.models.' + module)
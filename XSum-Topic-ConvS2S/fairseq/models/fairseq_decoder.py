@@ -19,6 +19,19 @@ class FairseqDecoder(nn.Module):
     def forward(self, prev_output_tokens, encoder_out):
         raise NotImplementedError
 
+    def extract_features(self, prev_output_tokens, encoder_out, src_doctopic):
+        """Return the decoder features before the output projection, which can
+        be mapped to vocabulary scores with :func:`output_layer`."""
+        raise NotImplementedError
+
+    def output_layer(self, features, vocab_subset=None):
+        """Project features to the vocabulary size.
+
+        If *vocab_subset* is given, only the scores for those target indices
+        are computed, in the order given by *vocab_subset*.
+        """
+        raise NotImplementedError
+
     def get_normalized_probs(self, net_output, log_probs):
         """Get normalized probabilities (or log probs) from a net's output."""
         vocab = net_output.size(-1)
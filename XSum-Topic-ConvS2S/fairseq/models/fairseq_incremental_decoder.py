@@ -23,11 +23,19 @@ class FairseqIncrementalDecoder(FairseqDecoder):
         This should be called when the order of the input has changed from the
         previous time step. A typical use case is beam search, where the input
         order changes between time steps based on the selection of beams.
+
+        Buffers stored with ``reorder=True`` are reordered together by the
+        incremental state; any children that keep other state reorder it in
+        their own reorder_incremental_state.
         """
-        def apply_reorder_incremental_state(module):
-            if module != self and hasattr(module, 'reorder_incremental_state'):
-                module.reorder_incremental_state(incremental_state, new_order)
-        self.apply(apply_reorder_incremental_state)
+        incremental_state.reorder(new_order)
+        if getattr(self, '_reorder_modules', None) is None:
+            self._reorder_modules = [
+                module for module in self.modules()
+                if module != self and hasattr(module, 'reorder_incremental_state')
+            ]
+        for module in self._reorder_modules:
+            module.reorder_incremental_state(incremental_state, new_order)
 
     def set_beam_size(self, beam_size):
         """Sets the beam size in the decoder and all children."""
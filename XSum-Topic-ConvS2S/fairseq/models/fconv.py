@@ -7,16 +7,19 @@
 #
 # Modified by Shashi Narayan (2018)
 
+import functools
 import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 
 from fairseq import utils
 from fairseq.data import LanguagePairDataset
 from fairseq.modules import BeamableMM, GradMultiply, LearnedPositionalEmbedding, LinearizedConvolution
 
 from . import FairseqEncoder, FairseqIncrementalDecoder, FairseqModel, register_model, register_model_architecture
+from .fconv_jit import FConvDecoderStepForTracing, FConvEncoderForTracing, LazyTrace
 
 
 @register_model('fconv')
@@ -46,6 +49,10 @@ class FConvModel(FairseqModel):
                             help='share input and output embeddings (requires'
                                  ' --decoder-out-embed-dim and --decoder-embed-dim'
                                  ' to be equal)')
+        parser.add_argument('--checkpoint-activations', type=int, metavar='N',
+                            help='recompute the activations of groups of N convolutional'
+                                 ' layers during the backward pass to save memory'
+                                 ' (0 disables)')
 
     @classmethod
     def build_model(cls, args, src_dict, dst_dict):
@@ -56,6 +63,7 @@ class FConvModel(FairseqModel):
             convolutions=eval(args.encoder_layers),
             dropout=args.dropout,
             max_positions=args.max_source_positions,
+            checkpoint_activations=getattr(args, 'checkpoint_activations', 0),
         )
         decoder = FConvDecoder(
             dst_dict,
@@ -65,7 +73,8 @@ class FConvModel(FairseqModel):
             attention=eval(args.decoder_attention),
             dropout=args.dropout,
             max_positions=args.max_target_positions,
-            share_embed=args.share_input_output_embed
+            share_embed=args.share_input_output_embed,
+            checkpoint_activations=getattr(args, 'checkpoint_activations', 0),
         )
         return FConvModel(encoder, decoder)
 
@@ -73,10 +82,11 @@ class FConvModel(FairseqModel):
 class FConvEncoder(FairseqEncoder):
     """Convolutional encoder"""
     def __init__(self, dictionary, embed_dim=512, max_positions=1024,
-                 convolutions=((512, 3),) * 20, dropout=0.1):
+                 convolutions=((512, 3),) * 20, dropout=0.1, checkpoint_activations=0):
         super().__init__(dictionary)
         self.dropout = dropout
         self.num_attention_layers = None
+        self.checkpoint_activations = checkpoint_activations
 
         num_embeddings = len(dictionary)
         padding_idx = dictionary.pad()
@@ -102,8 +112,12 @@ class FConvEncoder(FairseqEncoder):
             )
             in_channels = out_channels
         self.fc2 = Linear(in_channels, embed_dim+embed_dim)
+        self._jit_forward = None
 
     def forward(self, src_tokens, src_lengths, src_doctopic, src_wordtopics):
+        if self._jit_forward is not None and not self.training:
+            return self._jit_forward(src_tokens, src_doctopic, src_wordtopics)
+
         # embed tokens and positions
         # print(self.embed_tokens(src_tokens), self.embed_positions(src_tokens), src_doctopic, src_wordtopics)
 
@@ -145,15 +159,14 @@ class FConvEncoder(FairseqEncoder):
         x = x.transpose(0, 1)
 
         # temporal convolutions
-        for proj, conv in zip(self.projections, self.convolutions):
-            residual = x if proj is None else proj(x)
-            x = F.dropout(x, p=self.dropout, training=self.training)
-            padding_l = (conv.kernel_size[0] - 1) // 2
-            padding_r = conv.kernel_size[0] // 2
-            x = F.pad(x, (0, 0, 0, 0, padding_l, padding_r))
-            x = conv(x)
-            x = F.glu(x, dim=2)
-            x = (x + residual) * math.sqrt(0.5)
+        num_layers = len(self.convolutions)
+        if self.training and self.checkpoint_activations > 0:
+            # recompute the activations of each group of layers during backward
+            for start in range(0, num_layers, self.checkpoint_activations):
+                end = min(start + self.checkpoint_activations, num_layers)
+                x = checkpoint(functools.partial(self._convolutions, start, end), x)
+        else:
+            x = self._convolutions(0, num_layers, x)
 
         # T x B x C -> B x T x C
         x = x.transpose(1, 0)
@@ -170,6 +183,23 @@ class FConvEncoder(FairseqEncoder):
         # print(x,y)
         return x, y
 
+    def _convolutions(self, start, end, x):
+        """Apply conv+GLU+residual layers [start, end) to x (T x B x C)."""
+        for proj, conv in zip(self.projections[start:end], self.convolutions[start:end]):
+            residual = x if proj is None else proj(x)
+            x = F.dropout(x, p=self.dropout, training=self.training)
+            padding_l = (conv.kernel_size[0] - 1) // 2
+            padding_r = conv.kernel_size[0] // 2
+            x = F.pad(x, (0, 0, 0, 0, padding_l, padding_r))
+            x = conv(x)
+            x = F.glu(x, dim=2)
+            x = (x + residual) * math.sqrt(0.5)
+        return x
+
+    def make_generation_fast_(self, jit=False, **kwargs):
+        """Run forward with a traced graph if *jit* is True."""
+        self._jit_forward = LazyTrace(FConvEncoderForTracing, self) if jit else None
+
     def max_positions(self):
         """Maximum input length supported by the encoder."""
         return self.embed_positions.max_positions()
@@ -219,10 +249,11 @@ class FConvDecoder(FairseqIncrementalDecoder):
     """Convolutional decoder"""
     def __init__(self, dictionary, embed_dim=512, out_embed_dim=256,
                  max_positions=1024, convolutions=((512, 3),) * 20,
-                 attention=True, dropout=0.1, share_embed=False):
+                 attention=True, dropout=0.1, share_embed=False, checkpoint_activations=0):
         super().__init__(dictionary)
         self.register_buffer('version', torch.Tensor([2]))
         self.dropout = dropout
+        self.checkpoint_activations = checkpoint_activations
 
         in_channels = convolutions[0][0]
         if isinstance(attention, bool):
@@ -265,8 +296,18 @@ class FConvDecoder(FairseqIncrementalDecoder):
             self.fc3.weight = self.embed_tokens.weight
         else:
             self.fc3 = Linear(out_embed_dim, num_embeddings, dropout=dropout)
+        self._jit_step = None
 
     def forward(self, prev_output_tokens, encoder_out, src_doctopic, incremental_state=None):
+        x, avg_attn_scores = self.extract_features(
+            prev_output_tokens, encoder_out, src_doctopic, incremental_state)
+        return self.output_layer(x), avg_attn_scores
+
+    def extract_features(self, prev_output_tokens, encoder_out, src_doctopic, incremental_state=None):
+        if self._jit_step is not None and incremental_state is not None:
+            return self._extract_features_jit(
+                prev_output_tokens, encoder_out, src_doctopic, incremental_state)
+
         # split and transpose encoder outputs
         encoder_a, encoder_b = self._split_encoder_out(encoder_out, incremental_state)
         # print(encoder_a.size(), encoder_b.size())
@@ -299,9 +340,67 @@ class FConvDecoder(FairseqIncrementalDecoder):
         x = self._transpose_if_training(x, incremental_state)
         
         # temporal convolutions
+        num_layers = len(self.convolutions)
+        if incremental_state is None and self.training and self.checkpoint_activations > 0:
+            # recompute the activations of each group of layers during backward
+            avg_attn_scores = None
+            for start in range(0, num_layers, self.checkpoint_activations):
+                end = min(start + self.checkpoint_activations, num_layers)
+
+                def run_group(x, target_embedding, encoder_a, encoder_b, start=start, end=end):
+                    x, attn_scores = self._convolutions(
+                        start, end, x, target_embedding, encoder_a, encoder_b)
+                    # checkpoint only accepts tensor outputs
+                    return (x,) if attn_scores is None else (x, attn_scores)
+
+                outputs = checkpoint(run_group, x, target_embedding, encoder_a, encoder_b)
+                x = outputs[0]
+                if len(outputs) > 1:
+                    if avg_attn_scores is None:
+                        avg_attn_scores = outputs[1]
+                    else:
+                        avg_attn_scores = avg_attn_scores + outputs[1]
+        else:
+            x, avg_attn_scores = self._convolutions(
+                0, num_layers, x, target_embedding, encoder_a, encoder_b, incremental_state)
+
+        # T x B x C -> B x T x C
+        x = self._transpose_if_training(x, incremental_state)
+
+        # project to size of output embedding
+        x = self.fc2(x)
+        x = F.dropout(x, p=self.dropout, training=self.training)
+
+        return x, avg_attn_scores
+
+    def output_layer(self, features, vocab_subset=None):
+        """Project features to the size of the vocabulary, or only onto the
+        rows of the output projection given by *vocab_subset*."""
+        if vocab_subset is None:
+            return self.fc3(features)
+        if hasattr(self.fc3, 'weight_g') or not isinstance(self.fc3, nn.Linear):
+            # fc3.weight is only recomputed from the weight norm parameters
+            # in forward (or stored in int8 if quantized), so it can't be
+            # sliced directly
+            return self.fc3(features).index_select(-1, vocab_subset)
+        return F.linear(
+            features,
+            self.fc3.weight.index_select(0, vocab_subset),
+            self.fc3.bias.index_select(0, vocab_subset),
+        )
+
+    def _convolutions(self, start, end, x, target_embedding, encoder_a, encoder_b,
+                      incremental_state=None):
+        """Apply conv+GLU+attention+residual layers [start, end) to x.
+
+        Returns the output and the sum of the (normalized) attention scores of
+        the attention layers in this range, or None if there are none.
+        """
         avg_attn_scores = None
         num_attn_layers = len(self.attention)
-        for proj, conv, attention in zip(self.projections, self.convolutions, self.attention):
+        for proj, conv, attention in zip(self.projections[start:end],
+                                         self.convolutions[start:end],
+                                         self.attention[start:end]):
             residual = x if proj is None else proj(x)
 
             x = F.dropout(x, p=self.dropout, training=self.training)
@@ -325,15 +424,35 @@ class FConvDecoder(FairseqIncrementalDecoder):
             # residual
             x = (x + residual) * math.sqrt(0.5)
 
-        # T x B x C -> B x T x C
-        x = self._transpose_if_training(x, incremental_state)
-        # print(x.size())
-        
-        # project back to size of vocabulary
-        x = self.fc2(x)
-        x = F.dropout(x, p=self.dropout, training=self.training)
-        x = self.fc3(x)
+        return x, avg_attn_scores
 
+    def make_generation_fast_(self, jit=False, **kwargs):
+        """Run incremental decoding steps with a traced graph if *jit* is True."""
+        self._jit_step = LazyTrace(FConvDecoderStepForTracing, self) if jit else None
+
+    def _extract_features_jit(self, prev_output_tokens, encoder_out, src_doctopic, incremental_state):
+        cached_result = utils.get_incremental_state(self, incremental_state, 'jit_encoder_out')
+        if cached_result is None:
+            # transpose encoder_a and fold the attention scale into encoder_b
+            encoder_a, encoder_b = encoder_out
+            s = encoder_b.size(1)
+            cached_result = (encoder_a.transpose(1, 2).contiguous(), encoder_b * (s * math.sqrt(1.0 / s)))
+            utils.set_incremental_state(self, incremental_state, 'jit_encoder_out', cached_result)
+        encoder_a, encoder_b = cached_result
+
+        state = utils.get_incremental_state(self, incremental_state, 'jit_state')
+        if state is None:
+            state_size = FConvDecoderStepForTracing.get_state_size(self)
+            state = encoder_b.new(prev_output_tokens.size(0), state_size).zero_()
+            utils.set_incremental_state(self, incremental_state, 'jit_state', state, reorder=True)
+
+        # same as LearnedPositionalEmbedding for a single step
+        positions = prev_output_tokens.new(1, 1).fill_(
+            self.embed_positions.padding_idx + prev_output_tokens.size(1))
+        x, avg_attn_scores = self._jit_step(
+            prev_output_tokens[:, -1:], positions, src_doctopic, encoder_a, encoder_b, state)
+        if all(attention is None for attention in self.attention):
+            avg_attn_scores = None
         return x, avg_attn_scores
 
     def max_positions(self):
@@ -428,6 +547,7 @@ def base_architecture(args):
     args.decoder_out_embed_dim = getattr(args, 'decoder_out_embed_dim', 256)
     args.decoder_attention = getattr(args, 'decoder_attention', 'True')
     args.share_input_output_embed = getattr(args, 'share_input_output_embed', False)
+    args.checkpoint_activations = getattr(args, 'checkpoint_activations', 0)
 
 @register_model_architecture('fconv', 'fconv_newsroom')
 def fconv_newsroom(args):
@@ -5,6 +5,8 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
+import torch
+import torch.nn as nn
 import torch.nn.functional as F
 
 from fairseq import utils
@@ -19,12 +21,24 @@ class LinearizedConvolution(ConvTBC):
     of Conv1d. At inference time, it optimizes incremental generation (i.e.,
     one time step at a time) by replacing the convolutions with linear layers.
     Note that the input order changes from training to inference.
+
+    During incremental generation the last kw input frames are kept in a ring
+    buffer: each step overwrites the oldest frame and advances a head pointer,
+    and the linearized weight is rotated to match the head position instead
+    of shifting the buffer. The buffer is reordered together with the other
+    decoder buffers by the incremental state.
+
+    After ``make_generation_fast_(quantize=True)`` the linearized weights are
+    stored in int8 and applied with dynamically quantized linear layers
+    (CPU only).
     """
 
     def __init__(self, in_channels, out_channels, kernel_size, **kwargs):
         super().__init__(in_channels, out_channels, kernel_size, **kwargs)
         self._linearized_weight = None
-        self.register_backward_hook(self._clear_linearized_weight)
+        self._quantized_linear = None
+        self._quantize = False
+        self._backward_hook = self.register_backward_hook(self._clear_linearized_weight)
 
     def forward(self, input, incremental_state=None):
         """
@@ -43,8 +57,6 @@ class LinearizedConvolution(ConvTBC):
                 output = output[:-self.padding[0], :, :]
             return output
 
-        # reshape weight
-        weight = self._get_linearized_weight()
         kw = self.kernel_size[0]
 
         bsz = input.size(0)  # input: bsz x len x dim
@@ -54,35 +66,69 @@ class LinearizedConvolution(ConvTBC):
             if input_buffer is None:
                 input_buffer = input.new(bsz, kw, input.size(2)).zero_()
                 self._set_input_buffer(incremental_state, input_buffer)
+                head = 0
             else:
-                # shift buffer
-                input_buffer[:, :-1, :] = input_buffer[:, 1:, :].clone()
-            # append next input
-            input_buffer[:, -1, :] = input[:, -1, :]
+                head = utils.get_incremental_state(self, incremental_state, 'head')
+            # overwrite the oldest frame with the next input, after which the
+            # oldest frame is the one following it
+            input_buffer[:, head, :] = input[:, -1, :]
+            head = (head + 1) % kw
+            utils.set_incremental_state(self, incremental_state, 'head', head)
             input = utils.volatile_variable(input_buffer)
+        else:
+            head = 0
         with utils.maybe_no_grad():
-            output = F.linear(input.view(bsz, -1), weight, self.bias)
+            if self._quantize:
+                output = self._get_quantized_linear(head)(input.view(bsz, -1))
+            else:
+                output = F.linear(input.view(bsz, -1), self._get_linearized_weight(head), self.bias)
         return output.view(bsz, 1, -1)
 
-    def reorder_incremental_state(self, incremental_state, new_order):
-        input_buffer = self._get_input_buffer(incremental_state)
-        if input_buffer is not None:
-            input_buffer = input_buffer.index_select(0, new_order)
-            self._set_input_buffer(incremental_state, input_buffer)
+    def make_generation_fast_(self, quantize=False, jit=False, **kwargs):
+        self._quantize = quantize
+        self._clear_linearized_weight()
+        if jit and self._backward_hook is not None:
+            # modules with backward hooks can't be traced, and this model
+            # won't be trained anymore
+            self._backward_hook.remove()
+            self._backward_hook = None
 
     def _get_input_buffer(self, incremental_state):
         return utils.get_incremental_state(self, incremental_state, 'input_buffer')
 
     def _set_input_buffer(self, incremental_state, new_buffer):
-        return utils.set_incremental_state(self, incremental_state, 'input_buffer', new_buffer)
+        return utils.set_incremental_state(
+            self, incremental_state, 'input_buffer', new_buffer, reorder=True)
 
-    def _get_linearized_weight(self):
+    def _get_linearized_weight(self, head=0):
+        """Return the weight of the equivalent linear layer for an input ring
+        buffer whose oldest frame is at position *head*."""
+        kw = self.kernel_size[0]
         if self._linearized_weight is None:
-            kw = self.kernel_size[0]
+            self._linearized_weight = [None] * kw
+        if self._linearized_weight[head] is None:
             weight = self.weight.transpose(2, 1).transpose(1, 0).contiguous()
             assert weight.size() == (self.out_channels, kw, self.in_channels)
-            self._linearized_weight = weight.view(self.out_channels, -1)
-        return self._linearized_weight
+            if head > 0:
+                # frame t of the input is stored at position (head + t) % kw
+                weight = torch.roll(weight, shifts=head, dims=1).contiguous()
+            self._linearized_weight[head] = weight.view(self.out_channels, -1)
+        return self._linearized_weight[head]
+
+    def _get_quantized_linear(self, head=0):
+        """Return a dynamically quantized linear layer with the weight from
+        :func:`_get_linearized_weight`."""
+        kw = self.kernel_size[0]
+        if self._quantized_linear is None:
+            self._quantized_linear = [None] * kw
+        if self._quantized_linear[head] is None:
+            linear = nn.Linear(kw * self.in_channels, self.out_channels)
+            linear.weight.data = self._get_linearized_weight(head).data
+            linear.bias.data = self.bias.data
+            linear.qconfig = torch.quantization.default_dynamic_qconfig
+            self._quantized_linear[head] = nn.quantized.dynamic.Linear.from_float(linear)
+        return self._quantized_linear[head]
 
     def _clear_linearized_weight(self, *args):
         self._linearized_weight = None
+        self._quantized_linear = None
@@ -84,13 +84,18 @@ class Adam(torch.optim.Optimizer):
             loss = closure()
 
         for group in self.param_groups:
+            amsgrad = group['amsgrad']
+            beta1, beta2 = group['betas']
+
+            # parameters are bucketed by step count, which is the same for all
+            # parameters unless some of them did not receive gradients
+            buckets = {}
             for p in group['params']:
                 if p.grad is None:
                     continue
                 grad = p.grad.data
                 if grad.is_sparse:
                     raise RuntimeError('Adam does not support sparse gradients, please consider SparseAdam instead')
-                amsgrad = group['amsgrad']
 
                 state = self.state[p]
 
@@ -105,31 +110,82 @@ class Adam(torch.optim.Optimizer):
                         # Maintains max of all exp. moving avg. of sq. grad. values
                         state['max_exp_avg_sq'] = torch.zeros_like(p.data)
 
-                exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
-                if amsgrad:
-                    max_exp_avg_sq = state['max_exp_avg_sq']
-                beta1, beta2 = group['betas']
-
                 state['step'] += 1
 
-                # Decay the first and second moment running average coefficient
-                exp_avg.mul_(beta1).add_(1 - beta1, grad)
-                exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
+                bucket = buckets.setdefault(state['step'], ([], [], [], [], []))
+                bucket[0].append(p.data)
+                bucket[1].append(grad)
+                bucket[2].append(state['exp_avg'])
+                bucket[3].append(state['exp_avg_sq'])
                 if amsgrad:
-                    # Maintains the maximum of all 2nd moment running avg. till now
-                    torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
-                    # Use the max. for normalizing running avg. of gradient
-                    denom = max_exp_avg_sq.sqrt().add_(group['eps'])
-                else:
-                    denom = exp_avg_sq.sqrt().add_(group['eps'])
+                    bucket[4].append(state['max_exp_avg_sq'])
 
-                bias_correction1 = 1 - beta1 ** state['step']
-                bias_correction2 = 1 - beta2 ** state['step']
+            for step, (params, grads, exp_avgs, exp_avg_sqs, max_exp_avg_sqs) in buckets.items():
+                bias_correction1 = 1 - beta1 ** step
+                bias_correction2 = 1 - beta2 ** step
                 step_size = group['lr'] * math.sqrt(bias_correction2) / bias_correction1
 
-                if group['weight_decay'] != 0:
-                    p.data.add_(-group['weight_decay'] * group['lr'], p.data)
-
-                p.data.addcdiv_(-step_size, exp_avg, denom)
+                if _multi_tensor_available(grads):
+                    update = _multi_tensor_adam
+                else:
+                    update = _single_tensor_adam
+                update(
+                    params, grads, exp_avgs, exp_avg_sqs, max_exp_avg_sqs, amsgrad,
+                    beta1, beta2, group['eps'], group['lr'], group['weight_decay'], step_size,
+                )
 
         return loss
+
+
+def _multi_tensor_available(tensors):
+    # on CPU, the multi-tensor ops are no faster than a loop over the tensors
+    return hasattr(torch, '_foreach_add_') and all(t.is_cuda for t in tensors)
+
+
+def _single_tensor_adam(params, grads, exp_avgs, exp_avg_sqs, max_exp_avg_sqs, amsgrad,
+                        beta1, beta2, eps, lr, weight_decay, step_size):
+    for i, (p, grad, exp_avg, exp_avg_sq) in enumerate(zip(params, grads, exp_avgs, exp_avg_sqs)):
+        # Decay the first and second moment running average coefficient
+        exp_avg.mul_(beta1).add_(1 - beta1, grad)
+        exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
+        if amsgrad:
+            # Maintains the maximum of all 2nd moment running avg. till now
+            torch.max(max_exp_avg_sqs[i], exp_avg_sq, out=max_exp_avg_sqs[i])
+            # Use the max. for normalizing running avg. of gradient
+            denom = max_exp_avg_sqs[i].sqrt().add_(eps)
+        else:
+            denom = exp_avg_sq.sqrt().add_(eps)
+
+        if weight_decay != 0:
+            p.add_(-weight_decay * lr, p)
+
+        p.addcdiv_(-step_size, exp_avg, denom)
+
+
+def _multi_tensor_adam(params, grads, exp_avgs, exp_avg_sqs, max_exp_avg_sqs, amsgrad,
+                       beta1, beta2, eps, lr, weight_decay, step_size):
+    """Same update as _single_tensor_adam, but each op is applied to all
+    parameters at once, which saves a kernel launch per parameter."""
+    # Decay the first and second moment running average coefficient
+    torch._foreach_mul_(exp_avgs, beta1)
+    torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+    torch._foreach_mul_(exp_avg_sqs, beta2)
+    torch._foreach_addcmul_(exp_avg_sqs, grads, grads, value=1 - beta2)
+    if amsgrad:
+        # Maintains the maximum of all 2nd moment running avg. till now
+        if hasattr(torch, '_foreach_maximum_'):
+            torch._foreach_maximum_(max_exp_avg_sqs, exp_avg_sqs)
+        else:
+            # older versions of PyTorch
+            for max_exp_avg_sq, exp_avg_sq in zip(max_exp_avg_sqs, exp_avg_sqs):
+                torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
+        # Use the max. for normalizing running avg. of gradient
+        denoms = torch._foreach_sqrt(max_exp_avg_sqs)
+    else:
+        denoms = torch._foreach_sqrt(exp_avg_sqs)
+    torch._foreach_add_(denoms, eps)
+
+    if weight_decay != 0:
+        torch._foreach_add_(params, params, alpha=-weight_decay * lr)
+
+    torch._foreach_addcdiv_(params, exp_avgs, denoms, value=-step_size)
@@ -5,13 +5,14 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
-import importlib
 import os
 
+from fairseq.registry import LazyRegistry
+
 from .fairseq_lr_scheduler import FairseqLRScheduler
 
 
-LR_SCHEDULER_REGISTRY = {}
+LR_SCHEDULER_REGISTRY = LazyRegistry(__name__, os.path.dirname(__file__), 'register_lr_scheduler')
 
 
 def build_lr_scheduler(args, optimizer):
@@ -22,18 +23,11 @@ def register_lr_scheduler(name):
     """Decorator to register a new LR scheduler."""
 
     def register_lr_scheduler_cls(cls):
-        if name in LR_SCHEDULER_REGISTRY:
+        if name in LR_SCHEDULER_REGISTRY.loaded:
             raise ValueError('Cannot register duplicate LR scheduler ({})'.format(name))
         if not issubclass(cls, FairseqLRScheduler):
             raise ValueError('LR Scheduler ({}: {}) must extend FairseqLRScheduler'.format(name, cls.__name__))
-        LR_SCHEDULER_REGISTRY[name] = cls
+        LR_SCHEDULER_REGISTRY.loaded[name] = cls
         return cls
 
     return register_lr_scheduler_cls
-
-
-# automatically import any Python files in the optim/lr_scheduler/ directory
-for file in os.listdir(os.path.dirname(__file__)):
-    if file.endswith('.py') and not file.startswith('_'):
-        module = file[:file.find('.py')]
-        importlib.import_module('fairseq.optim.lr_scheduler.' + module)
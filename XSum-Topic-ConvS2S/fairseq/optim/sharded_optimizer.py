@@ -0,0 +1,141 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import math
+import torch
+import torch.distributed
+
+from . import FairseqOptimizer
+
+
+class ShardedOptimizer(FairseqOptimizer):
+    """Partitions optimizer state across data-parallel workers (ZeRO stage 1).
+
+    All trainable parameters are moved into a single flat buffer (the model
+    parameters become views into it) and the buffer is split into
+    ``distributed_world_size`` equally sized partitions. Each worker builds the
+    configured optimizer (e.g., NAG or Adam) over its own partition only, so
+    momentum buffers and Adam moments are not replicated. After each update
+    the partitions are all-gathered so that every replica sees the full set of
+    updated parameters.
+
+    Gradients are still all-reduced in full by the trainer; only the optimizer
+    state and update are sharded.
+    """
+
+    def __init__(self, args, params):
+        from . import OPTIMIZER_REGISTRY
+        params = [p for p in params if p.requires_grad]
+        super().__init__(args, params)
+        self.rank = args.distributed_rank
+        self.world_size = args.distributed_world_size
+
+        # flatten parameters into a buffer padded to a multiple of world_size
+        self.numel = sum(p.data.numel() for p in params)
+        self.shard_size = int(math.ceil(self.numel / self.world_size))
+        self.flat_params = params[0].data.new(self.shard_size * self.world_size).zero_()
+        offset = 0
+        for p in params:
+            numel = p.data.numel()
+            self.flat_params[offset:offset+numel].copy_(p.data.view(-1))
+            p.data = self.flat_params[offset:offset+numel].view_as(p.data)
+            offset += numel
+
+        # record which slices of which gradients belong to our partition
+        start = self.rank * self.shard_size
+        end = start + self.shard_size
+        self._grad_slices = []
+        offset = 0
+        for p in params:
+            numel = p.data.numel()
+            lo, hi = max(offset, start), min(offset + numel, end)
+            if lo < hi:
+                self._grad_slices.append((p, lo - offset, hi - offset, lo - start, hi - start))
+            offset += numel
+
+        # build the wrapped optimizer over a single parameter that shares
+        # storage with our partition of the flat buffer
+        self.shard = torch.nn.Parameter(self.flat_params[start:end])
+        self.shard.grad = self.flat_params.new(self.shard_size).zero_()
+        self.wrapped_optimizer = OPTIMIZER_REGISTRY[args.optimizer](args, [self.shard])
+        self._optimizer = self.wrapped_optimizer.optimizer
+        self._consolidated_state_dict = None
+
+    @property
+    def optimizer_config(self):
+        return self.wrapped_optimizer.optimizer_config
+
+    def consolidate_state_dict(self):
+        """Gather the full optimizer state onto the first worker.
+
+        This must be called on all workers, since it involves collective
+        communication. Afterwards :func:`state_dict` returns the consolidated
+        state on the first worker.
+        """
+        state_dict = self.optimizer.state_dict()
+        consolidated = {
+            'state': {},
+            'param_groups': state_dict['param_groups'],
+            'sharded_optimizer_name': self.wrapped_optimizer.__class__.__name__,
+        }
+        for key, param_state in state_dict['state'].items():
+            # don't modify param_state in place, it is shared with the live
+            # optimizer state
+            consolidated['state'][key] = {}
+            for k, v in param_state.items():
+                if torch.is_tensor(v) and v.numel() == self.shard_size:
+                    shards = [v.new(self.shard_size) for _ in range(self.world_size)]
+                    torch.distributed.all_gather(shards, v.contiguous())
+                    v = torch.cat(shards)[:self.numel].cpu()
+                consolidated['state'][key][k] = v
+        self._consolidated_state_dict = consolidated if self.rank == 0 else None
+
+    def state_dict(self):
+        """Return the consolidated optimizer state dict."""
+        if self._consolidated_state_dict is None:
+            raise RuntimeError('consolidate_state_dict() must be called on all '
+                               'workers before state_dict()')
+        return self._consolidated_state_dict
+
+    def load_state_dict(self, state_dict):
+        """Load a consolidated optimizer state dict, keeping only the
+        partition owned by this worker."""
+        if state_dict.get('sharded_optimizer_name') != self.wrapped_optimizer.__class__.__name__:
+            print('| WARNING: optimizer state does not match {}, not loading it'.format(
+                self.wrapped_optimizer.__class__.__name__))
+            return
+        start = self.rank * self.shard_size
+        local_state_dict = {'state': {}, 'param_groups': state_dict['param_groups']}
+        for key, param_state in state_dict['state'].items():
+            local_state_dict['state'][key] = {}
+            for k, v in param_state.items():
+                if torch.is_tensor(v) and v.numel() == self.numel:
+                    padded = v.new(self.shard_size * self.world_size).zero_()
+                    padded[:self.numel].copy_(v)
+                    v = padded[start:start+self.shard_size].clone()
+                local_state_dict['state'][key][k] = v
+        super().load_state_dict(local_state_dict)
+
+    def step(self, closure=None):
+        """Update our partition of the parameters and all-gather the result."""
+        for p, p_lo, p_hi, s_lo, s_hi in self._grad_slices:
+            if p.grad is None:
+                self.shard.grad.data[s_lo:s_hi].zero_()
+            else:
+                self.shard.grad.data[s_lo:s_hi].copy_(p.grad.data.view(-1)[p_lo:p_hi])
+        loss = self.optimizer.step(closure)
+
+        shards = list(self.flat_params.split(self.shard_size))
+        torch.distributed.all_gather(shards, shards[self.rank].clone())
+        return loss
+
+    def zero_grad(self):
+        """Clears the gradients of all optimized parameters."""
+        for p in self.params:
+            if p.grad is not None:
+                p.grad.data.zero_()
+        self.shard.grad.data.zero_()
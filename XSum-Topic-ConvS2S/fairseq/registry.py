@@ -0,0 +1,60 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+from collections.abc import Mapping
+import importlib
+import os
+import re
+
+
+class LazyRegistry(Mapping):
+    """A registry that only imports the module of an entry when it is looked up.
+
+    The names of the entries are found without importing anything, by
+    scanning the source files of *package* (in *package_dir*) for calls to
+    the decorator *register_fn* and taking its *arg_index*-th string
+    argument, e.g., ``@register_model_architecture('fconv', 'fconv_wmt_en_de')``.
+    The decorator itself stores the registered objects in :attr:`loaded`.
+    """
+
+    def __init__(self, package, package_dir, register_fn, arg_index=0):
+        self.loaded = {}
+        self.modules = _scan_package(package, package_dir, register_fn, arg_index)
+
+    def __getitem__(self, name):
+        if name not in self.loaded and name in self.modules:
+            importlib.import_module(self.modules[name])
+        return self.loaded[name]
+
+    def __contains__(self, name):
+        return name in self.loaded or name in self.modules
+
+    def __iter__(self):
+        yield from self.modules
+        for name in self.loaded:
+            if name not in self.modules:
+                yield name
+
+    def __len__(self):
+        return len(self.modules) + sum(name not in self.modules for name in self.loaded)
+
+
+def _scan_package(package, package_dir, register_fn, arg_index):
+    """Return an ordered dict from registered names to the modules of
+    *package* that register them."""
+    call_re = re.compile(r'^@' + re.escape(register_fn) + r'\(([^)]*)\)', re.MULTILINE)
+    string_re = re.compile(r'[\'"]([^\'"]+)[\'"]')
+
+    modules = {}
+    for file in sorted(os.listdir(package_dir)):
+        if file.endswith('.py') and not file.startswith('_'):
+            with open(os.path.join(package_dir, file), 'r') as f:
+                source = f.read()
+            for args in call_re.findall(source):
+                name = string_re.findall(args)[arg_index]
+                modules[name] = package + '.' + file[:file.find('.py')]
+    return modules
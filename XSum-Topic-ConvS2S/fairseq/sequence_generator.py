@@ -9,13 +9,15 @@ import math
 import torch
 
 from fairseq import utils
+from fairseq.ensemble_executor import EnsembleExecutor
 from fairseq.models import FairseqIncrementalDecoder
 
 
 class SequenceGenerator(object):
     def __init__(self, models, beam_size=1, minlen=1, maxlen=None,
                  stop_early=True, normalize_scores=True, len_penalty=1,
-                 unk_penalty=0, retain_dropout=False):
+                 unk_penalty=0, retain_dropout=False, shortlist=None,
+                 parallel_ensemble=False):
         """Generates translations of a given source sentence.
 
         Args:
@@ -25,6 +27,9 @@ class SequenceGenerator(object):
                 hypotheses, even though longer hypotheses might have better
                 normalized scores.
             normalize_scores: Normalize scores by the length of the output.
+            shortlist: Optional VocabShortlist. If given, only the candidate
+                target words for each batch are scored at each step.
+            parallel_ensemble: Run the models of an ensemble concurrently.
         """
         self.models = models
         self.pad = models[0].dst_dict.pad()
@@ -43,6 +48,10 @@ class SequenceGenerator(object):
         self.len_penalty = len_penalty
         self.unk_penalty = unk_penalty
         self.retain_dropout = retain_dropout
+        self.shortlist = shortlist
+        self.executor = None
+        if parallel_ensemble and len(models) > 1:
+            self.executor = EnsembleExecutor(len(models))
 
     def cuda(self):
         for model in self.models:
@@ -65,7 +74,7 @@ class SequenceGenerator(object):
         for sample in data_itr:
             s = utils.make_variable(sample, volatile=True, cuda=cuda)
             input = s['net_input']
-            srclen = input['src_tokens'].size(1)
+            maxlens = (maxlen_a*input['src_lengths'].data.float() + maxlen_b).long()
             if timer is not None:
                 timer.start()
             with utils.maybe_no_grad():
@@ -75,7 +84,7 @@ class SequenceGenerator(object):
                     input['src_doctopic'],
                     input['src_wordtopics'],
                     beam_size=beam_size,
-                    maxlen=int(maxlen_a*srclen + maxlen_b),
+                    maxlen=maxlens,
                     prefix_tokens=s['target'][:, :prefix_size] if prefix_size > 0 else None,
                 )
             if timer is not None:
@@ -87,10 +96,141 @@ class SequenceGenerator(object):
                 yield id, src, ref, hypos[i]
 
     def generate(self, src_tokens, src_lengths, src_doctopic, src_wordtopics, beam_size=None, maxlen=None, prefix_tokens=None):
-        """Generate a batch of translations."""
+        """Generate a batch of translations.
+
+        Args:
+            maxlen: maximum output length, either for the whole batch or as a
+                tensor with one entry per sentence. It is always capped by
+                the maxlen given to the constructor.
+        """
+        beam_size = beam_size if beam_size is not None else self.beam_size
         with utils.maybe_no_grad():
+            if beam_size == 1:
+                return self._generate_greedy(
+                    src_tokens, src_lengths, src_doctopic, src_wordtopics, maxlen, prefix_tokens)
             return self._generate(src_tokens, src_lengths, src_doctopic, src_wordtopics, beam_size, maxlen, prefix_tokens)
 
+    def _max_lengths(self, src_tokens, maxlen=None):
+        """Return a tensor with the max output length of each sentence."""
+        maxlens = src_tokens.data.new(src_tokens.size(0))
+        if torch.is_tensor(maxlen):
+            maxlens.copy_(maxlen)
+        else:
+            maxlens.fill_(maxlen if maxlen is not None else self.maxlen)
+        return maxlens.clamp_(1, self.maxlen)
+
+    def _vocab_subset(self, src_tokens, prefix_tokens=None):
+        """Restrict the output vocabulary to the shortlist for this batch.
+
+        The special symbols keep their indices, but all other candidates are
+        indexed by their position in the returned vocab_subset (None without a
+        shortlist) until they are selected. Also returns the positions of the
+        prefix tokens among the scored candidates.
+        """
+        vocab_subset = None
+        prefix_positions = prefix_tokens.data if prefix_tokens is not None else None
+        if self.shortlist is not None:
+            vocab_subset = self.shortlist.candidates(src_tokens.data, prefix_positions)
+            if prefix_tokens is not None:
+                vocab_positions = vocab_subset.new(self.vocab_size).fill_(-1)
+                vocab_positions[vocab_subset] = torch.arange(0, vocab_subset.numel()).type_as(vocab_subset)
+                prefix_positions = vocab_positions[prefix_positions]
+        return vocab_subset, prefix_positions
+
+    def _map_models(self, fn, *iterables):
+        """Apply fn to each model (and the matching items of iterables),
+        concurrently if parallel_ensemble is set."""
+        if self.executor is not None:
+            return self.executor.map(fn, self.models, *iterables)
+        return list(map(fn, self.models, *iterables))
+
+    def _encode(self, src_tokens, src_lengths, src_doctopic, src_wordtopics):
+        """Run the encoders and set up the decoders for a new batch."""
+        incremental_states = {}
+        for model in self.models:
+            if not self.retain_dropout:
+                model.eval()
+            if isinstance(model.decoder, FairseqIncrementalDecoder):
+                incremental_states[model] = utils.IncrementalState()
+            else:
+                incremental_states[model] = None
+
+        def encode(model):
+            with utils.maybe_no_grad():
+                return model.encoder(src_tokens, src_lengths, src_doctopic, src_wordtopics)
+        encoder_outs = self._map_models(encode)
+        return encoder_outs, incremental_states
+
+    def _generate_greedy(self, src_tokens, src_lengths, src_doctopic, src_wordtopics, maxlen=None, prefix_tokens=None):
+        """Generate a batch of translations by picking the most likely token at
+        each step. This is equivalent to beam search with a beam size of 1,
+        but doesn't need any candidate selection or reordering."""
+        bsz, srclen = src_tokens.size()
+        maxlens = self._max_lengths(src_tokens, maxlen)
+        maxlen = int(maxlens.max())
+        vocab_subset, prefix_positions = self._vocab_subset(src_tokens, prefix_tokens)
+        encoder_outs, incremental_states = self._encode(
+            src_tokens, src_lengths, src_doctopic, src_wordtopics)
+
+        tokens = src_tokens.data.new(bsz, maxlen + 2).fill_(self.pad)
+        tokens[:, 0] = self.eos
+        pos_scores = src_tokens.data.new(bsz, maxlen + 1).float().fill_(0)
+        attn = pos_scores.new(bsz, srclen, maxlen + 1).fill_(0)
+        lengths = tokens.new(bsz).fill_(maxlen + 1)
+        finished = tokens.new(bsz).fill_(0).bool()
+
+        for step in range(maxlen + 1):  # one extra step for EOS marker
+            probs, avg_attn_scores = self._decode(
+                tokens[:, :step+1], encoder_outs, src_doctopic, incremental_states, vocab_subset)
+            probs[:, self.pad] = -math.inf  # never select pad
+            probs[:, self.unk] -= self.unk_penalty  # apply unk penalty
+            if step < self.minlen:
+                probs[:, self.eos] = -math.inf
+
+            if prefix_tokens is not None and step < prefix_tokens.size(1):
+                next_scores = probs.gather(1, prefix_positions[:, step].view(-1, 1)).view(-1)
+                next_tokens = prefix_tokens.data[:, step].clone()
+            else:
+                next_scores, next_tokens = probs.max(1)
+                if vocab_subset is not None:
+                    next_tokens = vocab_subset[next_tokens]
+
+            # force EOS for hypotheses that reached their max length
+            capped = maxlens.eq(step)
+            next_scores = torch.where(capped, probs[:, self.eos], next_scores)
+            next_tokens.masked_fill_(capped, self.eos)
+
+            # finished hypotheses only produce padding from here on
+            next_tokens.masked_fill_(finished, self.pad)
+            tokens[:, step+1] = next_tokens
+            pos_scores[:, step] = next_scores.type_as(pos_scores).masked_fill_(finished, 0)
+            if avg_attn_scores is not None:
+                attn[:, :, step] = avg_attn_scores
+
+            newly_finished = next_tokens.eq(self.eos)
+            lengths.masked_fill_(newly_finished, step + 1)
+            finished |= newly_finished
+            if finished.all():
+                break
+
+        scores = pos_scores.sum(1)
+        if self.normalize_scores:
+            scores /= lengths.type_as(scores)**self.len_penalty
+        _, alignment = attn.max(dim=1)
+        scores = scores.tolist()
+        lengths = lengths.tolist()
+
+        return [
+            [{
+                'tokens': tokens[i, 1:lengths[i]+1],
+                'score': scores[i],
+                'attention': attn[i, :, :lengths[i]],  # src_len x tgt_len
+                'alignment': alignment[i, :lengths[i]],
+                'positional_scores': pos_scores[i, :lengths[i]],
+            }]
+            for i in range(bsz)
+        ]
+
     def _generate(self, src_tokens, src_lengths, src_doctopic, src_wordtopics, beam_size=None, maxlen=None, prefix_tokens=None):
         bsz, srclen = src_tokens.size()
         bsz_1, emb_dim = src_doctopic.size()
@@ -100,45 +240,32 @@ class SequenceGenerator(object):
         assert (bsz == bsz_1) and (bsz == bsz_2) and (emb_dim == emb_dim_1) and (srclen == srclen_1)
         # assert (1 == 2), ("%d %d %d %d %d %d %d")%(bsz, bsz_1, bsz_2, emb_dim, emb_dim_1, srclen, srclen_1)
         
-        maxlen = min(maxlen, self.maxlen) if maxlen is not None else self.maxlen
+        # buffers are sized for the longest max length in the batch, but each
+        # sentence is finalized once it reaches its own max length
+        maxlens = self._max_lengths(src_tokens, maxlen)
+        maxlen = int(maxlens.max())
+
+        vocab_subset, prefix_positions = self._vocab_subset(src_tokens, prefix_tokens)
+        vocab_size = vocab_subset.numel() if vocab_subset is not None else self.vocab_size
 
         # the max beam size is the dictionary size - 1, since we never select pad
         beam_size = beam_size if beam_size is not None else self.beam_size
-        beam_size = min(beam_size, self.vocab_size - 1)
+        beam_size = min(beam_size, vocab_size - 1)
 
         # Reshape inputs 
         src_tokens_reshaped = src_tokens.repeat(1, beam_size).view(-1, srclen)
         src_lengths_reshaped = src_lengths.repeat(beam_size)
-        src_doctopic_reshaped = src_doctopic.repeat(beam_size,1).view(-1, emb_dim)
+        src_doctopic_reshaped = src_doctopic.repeat(1, beam_size).view(-1, emb_dim)
         src_wordtopics_reshaped = src_wordtopics.repeat(1, beam_size, 1).view(-1, srclen, emb_dim)            
         # print(src_tokens_reshaped.size(),src_lengths_reshaped.size(),src_doctopic_reshaped.size(),src_wordtopics_reshaped.size())
             
-        encoder_outs = []
-        incremental_states = {}
-        for model in self.models:
-            if not self.retain_dropout:
-                model.eval()
-            if isinstance(model.decoder, FairseqIncrementalDecoder):
-                incremental_states[model] = {}
-            else:
-                incremental_states[model] = None
-
-            # compute the encoder output for each beam
-                
-            # encoder_out = model.encoder(
-            #     src_tokens.repeat(1, beam_size).view(-1, srclen),
-            #     src_lengths.repeat(beam_size),
-            # )
-
-            encoder_out = model.encoder(
-                src_tokens_reshaped,
-                src_lengths_reshaped,
-                src_doctopic_reshaped,
-                src_wordtopics_reshaped,
-            )
-
-            # print(encoder_out.size())
-            encoder_outs.append(encoder_out)
+        # compute the encoder output for each beam
+        encoder_outs, incremental_states = self._encode(
+            src_tokens_reshaped,
+            src_lengths_reshaped,
+            src_doctopic_reshaped,
+            src_wordtopics_reshaped,
+        )
 
         # initialize buffers
         scores = src_tokens.data.new(bsz * beam_size, maxlen + 1).float().fill_(0)
@@ -149,10 +276,16 @@ class SequenceGenerator(object):
         attn = scores.new(bsz * beam_size, src_tokens.size(1), maxlen + 2)
         attn_buf = attn.clone()
 
-        # list of completed sentences
-        finalized = [[] for i in range(bsz)]
-        finished = [False for i in range(bsz)]
-        worst_finalized = [{'idx': None, 'score': -math.inf} for i in range(bsz)]
+        # completed hypotheses, kept in preallocated per-sentence tensors. Only
+        # the first num_finalized[sent] slots of each sentence are valid.
+        fin_tokens = tokens.new(bsz, beam_size, maxlen + 1).fill_(self.pad)
+        fin_scores = scores.new(bsz, beam_size).fill_(-math.inf)
+        fin_pos_scores = scores.new(bsz, beam_size, maxlen + 1).fill_(0)
+        fin_attn = scores.new(bsz, beam_size, src_tokens.size(1), maxlen + 1).fill_(0)
+        fin_alignment = tokens.new(bsz, beam_size, maxlen + 1).fill_(0)
+        fin_lengths = tokens.new(bsz, beam_size).fill_(0)
+        num_finalized = tokens.new(bsz).fill_(0)
+        finished = tokens.new(bsz).fill_(0).bool()
         num_remaining_sent = bsz
 
         # number of candidate hypos per step
@@ -169,24 +302,24 @@ class SequenceGenerator(object):
                 buffers[name] = type_of.new()
             return buffers[name]
 
-        def is_finished(sent, step, unfinalized_scores=None):
+        def is_finished(sents_seen, step, unfinalized_scores=None):
             """
-            Check whether we've finished generation for a given sentence, by
+            Check whether we've finished generation for the given sentences, by
             comparing the worst score among finalized hypotheses to the best
             possible score among unfinalized hypotheses.
+
+            Returns a mask over sentences that are newly finished.
             """
-            assert len(finalized[sent]) <= beam_size
-            if len(finalized[sent]) == beam_size:
-                if self.stop_early or step == maxlen or unfinalized_scores is None:
-                    return True
-                # stop if the best unfinalized score is worse than the worst
-                # finalized one
-                best_unfinalized_score = unfinalized_scores[sent].max()
-                if self.normalize_scores:
-                    best_unfinalized_score /= maxlen
-                if worst_finalized[sent]['score'] >= best_unfinalized_score:
-                    return True
-            return False
+            newly_finished = sents_seen & num_finalized.eq(beam_size) & ~finished
+            if self.stop_early or unfinalized_scores is None:
+                return newly_finished
+            # stop if the sentence reached its maximum length, or if the best
+            # unfinalized score is worse than the worst finalized one
+            best_unfinalized_scores = unfinalized_scores.view(bsz, -1).max(1)[0]
+            if self.normalize_scores:
+                best_unfinalized_scores = best_unfinalized_scores / maxlens.type_as(best_unfinalized_scores)
+            worst_finalized_scores = fin_scores.min(1)[0]
+            return newly_finished & (worst_finalized_scores.ge(best_unfinalized_scores) | maxlens.le(step))
 
         def finalize_hypos(step, bbsz_idx, eos_scores, unfinalized_scores=None):
             """
@@ -213,6 +346,7 @@ class SequenceGenerator(object):
             tokens_clone = tokens_clone[:, 1:step+2]  # skip the first index, which is EOS
             tokens_clone[:, step] = self.eos
             attn_clone = attn.index_select(0, bbsz_idx)[:, :, 1:step+2]
+            _, alignment = attn_clone.max(dim=1)
 
             # compute scores per token position
             pos_scores = scores.index_select(0, bbsz_idx)[:, :step+1]
@@ -224,44 +358,52 @@ class SequenceGenerator(object):
             if self.normalize_scores:
                 eos_scores /= (step+1)**self.len_penalty
 
-            sents_seen = set()
-            for i, (idx, score) in enumerate(zip(bbsz_idx.tolist(), eos_scores.tolist())):
-                sent = idx // beam_size
-                sents_seen.add(sent)
-
-                def get_hypo():
-                    _, alignment = attn_clone[i].max(dim=0)
-                    return {
-                        'tokens': tokens_clone[i],
-                        'score': score,
-                        'attention': attn_clone[i],  # src_len x tgt_len
-                        'alignment': alignment,
-                        'positional_scores': pos_scores[i],
-                    }
-
-                if len(finalized[sent]) < beam_size:
-                    finalized[sent].append(get_hypo())
-                elif not self.stop_early and score > worst_finalized[sent]['score']:
-                    # replace worst hypo for this sentence with new/better one
-                    worst_idx = worst_finalized[sent]['idx']
-                    if worst_idx is not None:
-                        finalized[sent][worst_idx] = get_hypo()
-
-                    # find new worst finalized hypo for this sentence
-                    idx, s = min(enumerate(finalized[sent]), key=lambda r: r[1]['score'])
-                    worst_finalized[sent] = {
-                        'score': s['score'],
-                        'idx': idx,
-                    }
+            # rank each hypothesis among the ones for the same sentence
+            sents = torch.floor_divide(bbsz_idx, beam_size)
+            same_sent = sents.unsqueeze(0).eq(sents.unsqueeze(1)).long()
+            rank = same_sent.tril(-1).sum(1)
+            sents_seen = finished.new(bsz).fill_(False).index_fill_(0, sents, True)
+
+            def store(mask, sent, slot):
+                """Store the hypotheses selected by mask at the given slots."""
+                idx = mask.nonzero().view(-1)
+                if idx.numel() == 0:
+                    return
+                flat_idx = (sent * beam_size + slot).index_select(0, idx)
+                fin_tokens.view(bsz * beam_size, -1)[:, :step+1].index_copy_(
+                    0, flat_idx, tokens_clone.index_select(0, idx))
+                fin_scores.view(-1).index_copy_(
+                    0, flat_idx, eos_scores.index_select(0, idx).type_as(fin_scores))
+                fin_pos_scores.view(bsz * beam_size, -1)[:, :step+1].index_copy_(
+                    0, flat_idx, pos_scores.index_select(0, idx).type_as(fin_pos_scores))
+                fin_attn.view(bsz * beam_size, fin_attn.size(2), -1)[:, :, :step+1].index_copy_(
+                    0, flat_idx, attn_clone.index_select(0, idx).type_as(fin_attn))
+                fin_alignment.view(bsz * beam_size, -1)[:, :step+1].index_copy_(
+                    0, flat_idx, alignment.index_select(0, idx))
+                fin_lengths.view(-1).index_fill_(0, flat_idx, step + 1)
+
+            # fill the free slots of each sentence in order
+            slots = num_finalized.index_select(0, sents) + rank
+            fits = slots.lt(beam_size)
+            store(fits, sents, slots)
+            num_finalized.index_add_(0, sents, fits.long())
+            num_finalized.clamp_(max=beam_size)
+
+            overflow = ~fits
+            if not self.stop_early and overflow.any():
+                # replace the worst hypothesis of each sentence with a better
+                # one, one rank at a time so that earlier hypotheses are
+                # considered first
+                for r in range(int(rank.max()) + 1):
+                    worst_scores, worst_slots = fin_scores.min(1)
+                    better = overflow & rank.eq(r) & eos_scores.type_as(fin_scores).gt(
+                        worst_scores.index_select(0, sents))
+                    store(better, sents, worst_slots.index_select(0, sents))
 
             # return number of hypotheses finished this step
-            num_finished = 0
-            for sent in sents_seen:
-                # check termination conditions for this sentence
-                if not finished[sent] and is_finished(sent, step, unfinalized_scores):
-                    finished[sent] = True
-                    num_finished += 1
-            return num_finished
+            newly_finished = is_finished(sents_seen, step, unfinalized_scores)
+            finished.masked_fill_(newly_finished, True)
+            return int(newly_finished.sum())
 
         reorder_state = None
         for step in range(maxlen + 1):  # one extra step for EOS marker
@@ -273,7 +415,8 @@ class SequenceGenerator(object):
                             incremental_states[model], reorder_state)
 
             probs, avg_attn_scores = self._decode(
-                tokens[:, :step+1], encoder_outs, src_doctopic_reshaped, incremental_states)
+                tokens[:, :step+1], encoder_outs, src_doctopic_reshaped, incremental_states,
+                vocab_subset)
             if step == 0:
                 # at the first step all hypotheses are equally likely, so use
                 # only the first beam
@@ -289,43 +432,49 @@ class SequenceGenerator(object):
             # Record attention scores
             attn[:, :, step+1].copy_(avg_attn_scores)
 
+            # finalize all hypotheses of the sentences that hit their max
+            # length, picking the hypothesis with the highest prob of EOS first
+            capped = maxlens.eq(step)
+            if capped.any():
+                capped_sents = capped.nonzero().view(-1)
+                capped_scores, capped_beams = probs[:, self.eos].contiguous().view(bsz, -1).sort(
+                    1, descending=True)
+                num_remaining_sent -= finalize_hypos(
+                    step,
+                    (capped_beams + bbsz_offsets).index_select(0, capped_sents).view(-1),
+                    capped_scores.index_select(0, capped_sents).view(-1),
+                )
+                assert step < maxlen or num_remaining_sent == 0
+                if num_remaining_sent == 0:
+                    break
+
             cand_scores = buffer('cand_scores', type_of=scores)
             cand_indices = buffer('cand_indices')
             cand_beams = buffer('cand_beams')
             eos_bbsz_idx = buffer('eos_bbsz_idx')
             eos_scores = buffer('eos_scores', type_of=scores)
-            if step < maxlen:
-                if prefix_tokens is not None and step < prefix_tokens.size(1):
-                    probs_slice = probs.view(bsz, -1, probs.size(-1))[:, 0, :]
-                    cand_scores = torch.gather(
-                        probs_slice, dim=1,
-                        index=prefix_tokens[:, step].view(-1, 1).data
-                    ).expand(-1, cand_size)
-                    cand_indices = prefix_tokens[:, step].view(-1, 1).expand(bsz, cand_size).data
-                    cand_beams.resize_as_(cand_indices).fill_(0)
-                else:
-                    # take the best 2 x beam_size predictions. We'll choose the first
-                    # beam_size of these which don't predict eos to continue with.
-                    torch.topk(
-                        probs.view(bsz, -1),
-                        k=min(cand_size, probs.view(bsz, -1).size(1) - 1),  # -1 so we never select pad
-                        out=(cand_scores, cand_indices),
-                    )
-                    # torch.div(cand_indices, self.vocab_size, out=cand_beams)  # this command is not valid anymore.
-                    torch.floor_divide(cand_indices, self.vocab_size, out=cand_beams)
-                    cand_indices.fmod_(self.vocab_size)
+            if prefix_tokens is not None and step < prefix_tokens.size(1):
+                probs_slice = probs.view(bsz, -1, probs.size(-1))[:, 0, :]
+                cand_scores = torch.gather(
+                    probs_slice, dim=1,
+                    index=prefix_positions[:, step].view(-1, 1),
+                ).expand(-1, cand_size)
+                cand_indices = prefix_tokens[:, step].view(-1, 1).expand(bsz, cand_size).data
+                cand_beams.resize_as_(cand_indices).fill_(0)
             else:
-                # finalize all active hypotheses once we hit maxlen
-                # pick the hypothesis with the highest prob of EOS right now
-                torch.sort(
-                    probs[:, self.eos],
-                    descending=True,
-                    out=(eos_scores, eos_bbsz_idx),
+                # take the best 2 x beam_size predictions. We'll choose the first
+                # beam_size of these which don't predict eos to continue with.
+                torch.topk(
+                    probs.view(bsz, -1),
+                    k=min(cand_size, probs.view(bsz, -1).size(1) - 1),  # -1 so we never select pad
+                    out=(cand_scores, cand_indices),
                 )
-                num_remaining_sent -= finalize_hypos(
-                    step, eos_bbsz_idx, eos_scores)
-                assert num_remaining_sent == 0
-                break
+                # torch.div(cand_indices, self.vocab_size, out=cand_beams)  # this command is not valid anymore.
+                torch.floor_divide(cand_indices, vocab_size, out=cand_beams)
+                cand_indices.fmod_(vocab_size)
+                if vocab_subset is not None:
+                    # map positions in the shortlist back to target indices
+                    cand_indices = vocab_subset[cand_indices]
 
             # cand_bbsz_idx contains beam indices for the top candidate
             # hypotheses, with a range of values: [0, bsz*beam_size),
@@ -335,16 +484,18 @@ class SequenceGenerator(object):
             # finalize hypotheses that end in eos
             eos_mask = cand_indices.eq(self.eos)
             if step >= self.minlen:
-                # only consider eos when it's among the top beam_size indices
+                # only consider eos when it's among the top beam_size indices,
+                # and only for sentences that haven't hit their max length
+                final_mask = eos_mask[:, :beam_size] & maxlens.gt(step).unsqueeze(1)
                 torch.masked_select(
                     cand_bbsz_idx[:, :beam_size],
-                    mask=eos_mask[:, :beam_size],
+                    mask=final_mask,
                     out=eos_bbsz_idx,
                 )
                 if eos_bbsz_idx.numel() > 0:
                     torch.masked_select(
                         cand_scores[:, :beam_size],
-                        mask=eos_mask[:, :beam_size],
+                        mask=final_mask,
                         out=eos_scores,
                     )
                     num_remaining_sent -= finalize_hypos(
@@ -423,39 +574,64 @@ class SequenceGenerator(object):
             # reorder incremental state in decoder
             reorder_state = active_bbsz_idx
 
-        # sort by score descending
+        # sort by score descending and convert to a list of hypotheses per sentence
+        _, order = fin_scores.sort(1, descending=True)
+        flat_order = (order + bbsz_offsets).view(-1)
+        fin_tokens = fin_tokens.view(bsz * beam_size, -1).index_select(0, flat_order)
+        fin_pos_scores = fin_pos_scores.view(bsz * beam_size, -1).index_select(0, flat_order)
+        fin_attn = fin_attn.view(bsz * beam_size, fin_attn.size(2), -1).index_select(0, flat_order)
+        fin_alignment = fin_alignment.view(bsz * beam_size, -1).index_select(0, flat_order)
+        fin_scores = fin_scores.view(-1).index_select(0, flat_order).tolist()
+        fin_lengths = fin_lengths.view(-1).index_select(0, flat_order).tolist()
+        num_finalized = num_finalized.tolist()
+
+        finalized = []
         for sent in range(bsz):
-            finalized[sent] = sorted(finalized[sent], key=lambda r: r['score'], reverse=True)
-
+            hypos = []
+            for j in range(sent * beam_size, sent * beam_size + num_finalized[sent]):
+                length = fin_lengths[j]
+                hypos.append({
+                    'tokens': fin_tokens[j, :length],
+                    'score': fin_scores[j],
+                    'attention': fin_attn[j, :, :length],  # src_len x tgt_len
+                    'alignment': fin_alignment[j, :length],
+                    'positional_scores': fin_pos_scores[j, :length],
+                })
+            finalized.append(hypos)
         return finalized
 
-    def _decode(self, tokens, encoder_outs, src_doctopic_reshaped, incremental_states):
+    def _decode(self, tokens, encoder_outs, src_doctopic_reshaped, incremental_states, vocab_subset=None):
 
         # print(tokens, encoder_outs, src_doctopic_reshaped.size(), incremental_states)
         
         # wrap in Variable
         tokens = utils.volatile_variable(tokens)
 
-        avg_probs = None
-        avg_attn = None
-        for model, encoder_out in zip(self.models, encoder_outs):
+        def decode(model, encoder_out):
             with utils.maybe_no_grad():
                 
-                decoder_out, attn = model.decoder(tokens, encoder_out, src_doctopic_reshaped, incremental_states[model])
-            probs = model.get_normalized_probs(decoder_out[:, -1, :], log_probs=False).data
-            if avg_probs is None:
-                avg_probs = probs
-            else:
-                avg_probs.add_(probs)
+                if vocab_subset is None:
+                    decoder_out, attn = model.decoder(tokens, encoder_out, src_doctopic_reshaped, incremental_states[model])
+                else:
+                    # only project the last step onto the shortlisted words
+                    features, attn = model.decoder.extract_features(
+                        tokens, encoder_out, src_doctopic_reshaped, incremental_states[model])
+                    decoder_out = model.decoder.output_layer(
+                        features[:, -1:, :], vocab_subset=vocab_subset)
+                log_probs = model.get_normalized_probs(decoder_out[:, -1, :], log_probs=True).data
             if attn is not None:
                 attn = attn[:, -1, :].data
-                if avg_attn is None:
-                    avg_attn = attn
-                else:
-                    avg_attn.add_(attn)
-        avg_probs.div_(len(self.models))
-        avg_probs.log_()
-        if avg_attn is not None:
-            avg_attn.div_(len(self.models))
+            return log_probs, attn
+
+        outputs = self._map_models(decode, encoder_outs)
+        if len(outputs) == 1:
+            return outputs[0]
+
+        # average the probabilities of the models in log space
+        log_probs, attn = zip(*outputs)
+        avg_probs = torch.logsumexp(torch.stack(log_probs), dim=0) - math.log(len(self.models))
+        avg_attn = None
+        if attn[0] is not None:
+            avg_attn = torch.stack(attn).mean(dim=0)
 
         return avg_probs, avg_attn
@@ -12,7 +12,6 @@ Train a network on multiple GPUs.
 """
 
 from collections import OrderedDict
-import math
 import torch
 
 from fairseq import distributed_utils, optim, utils
@@ -60,11 +59,30 @@ class Trainer(object):
         self._max_bsz_seen = 0
         self._num_updates = 0
 
-    def save_checkpoint(self, filename, extra_state):
-        """Save all training state in a checkpoint file."""
+        if getattr(args, 'no_async_save', False):
+            self._checkpoint_writer = None
+        else:
+            self._checkpoint_writer = utils.CheckpointWriter()
+
+    def save_checkpoint(self, filenames, extra_state, callback=None):
+        """Save all training state in one or more checkpoint files.
+
+        The state is serialized once; additional filenames are hard links to
+        the first one. Unless --no-async-save is given, files are written in
+        the background and *callback* is called from the writer thread.
+        """
+        if hasattr(self.optimizer, 'consolidate_state_dict'):
+            # sharded optimizer state is gathered collectively on all workers
+            self.optimizer.consolidate_state_dict()
         if self.args.distributed_rank == 0:  # only save one checkpoint
-            utils.save_state(filename, self.args, self.model, self.criterion, self.optimizer,
-                             self.lr_scheduler, self._num_updates, self._optim_history, extra_state)
+            utils.save_state(filenames, self.args, self.model, self.criterion, self.optimizer,
+                             self.lr_scheduler, self._num_updates, self._optim_history, extra_state,
+                             writer=self._checkpoint_writer, callback=callback)
+
+    def wait_for_checkpoint(self):
+        """Block until pending checkpoint writes are finished."""
+        if self._checkpoint_writer is not None:
+            self._checkpoint_writer.wait()
 
     def load_checkpoint(self, filename):
         """Load all training state from a checkpoint file."""
@@ -182,19 +200,18 @@ class Trainer(object):
                     raise e
 
         # all-reduce grads and rescale by grad_denom
+        grads = [p.grad.data for p in self.model.parameters() if p.requires_grad]
         if self.args.distributed_world_size > 1:
-            grads = [p.grad.data for p in self.model.parameters() if p.requires_grad]
-            distributed_utils.all_reduce_and_rescale_tensors(grads, grad_denom)
+            # the gradient norm is computed on the all-reduce buffer
+            grad_norm = distributed_utils.all_reduce_and_rescale_tensors(
+                grads, grad_denom, compute_norm=True)
         else:
-            for p in self.model.parameters():
-                if p.requires_grad:
-                    p.grad.data.div_(grad_denom)
+            for g in grads:
+                g.div_(grad_denom)
+            grad_norm = None
 
-        # clip grads
-        if self.args.clip_norm > 0:
-            grad_norm = utils.item(torch.nn.utils.clip_grad_norm(self.model.parameters(), self.args.clip_norm))
-        else:
-            grad_norm = math.sqrt(sum(p.grad.data.norm()**2 for p in self.model.parameters()))
+        # clip grads, reusing the same norm for the gnorm meter
+        grad_norm = utils.clip_grad_norm_(grads, self.args.clip_norm, total_norm=grad_norm)
 
         # take an optimization step
         self.optimizer.step()
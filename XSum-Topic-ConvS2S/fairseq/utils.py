@@ -5,10 +5,16 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
-from collections import defaultdict
+from collections import OrderedDict
 import contextlib
+import itertools
 import logging
+import numpy as np
 import os
+import pickle
+import shutil
+import struct
+import threading
 import torch
 import traceback
 
@@ -27,8 +33,97 @@ def torch_persistent_save(*args, **kwargs):
                 logging.error(traceback.format_exc())
 
 
-def save_state(filename, args, model, criterion, optimizer, lr_scheduler,
-               num_updates, optim_history=None, extra_state=None):
+def move_to_cpu(sample):
+    """Return a copy of a (nested) state dict with all tensors on the CPU.
+
+    CPU tensors are cloned as well, so the result is a snapshot that is not
+    affected by later in-place updates.
+    """
+    if torch.is_tensor(sample):
+        return sample.cpu() if sample.is_cuda else sample.clone()
+    elif isinstance(sample, dict):
+        return sample.__class__((key, move_to_cpu(value)) for key, value in sample.items())
+    elif isinstance(sample, list):
+        return [move_to_cpu(x) for x in sample]
+    elif isinstance(sample, tuple):
+        return tuple(move_to_cpu(x) for x in sample)
+    else:
+        return sample
+
+
+def link_or_copy(src, dst):
+    """Atomically replace dst with a hard link to (or a copy of) src."""
+    tmp = dst + '.tmp'
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def write_checkpoint(state_dict, filenames):
+    """Serialize state_dict once to filenames[0] and alias the other filenames.
+
+    Files are written under a temporary name and renamed, so an interrupted
+    write never leaves a truncated checkpoint behind.
+    """
+    tmp = filenames[0] + '.tmp'
+    torch_persistent_save(state_dict, tmp)
+    os.replace(tmp, filenames[0])
+    for filename in filenames[1:]:
+        link_or_copy(filenames[0], filename)
+
+
+class CheckpointWriter(object):
+    """Writes checkpoints in a background thread.
+
+    The state is snapshotted to CPU memory before :func:`write` returns, so
+    training can continue while the snapshot is serialized. At most one write
+    is in flight; a new write waits for the previous one to finish.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._error = None
+
+    def write(self, state_dict, filenames, callback=None):
+        self.wait()
+        state_dict = move_to_cpu(state_dict)
+        self._thread = threading.Thread(target=self._write, args=(state_dict, filenames, callback))
+        self._thread.start()
+
+    def _write(self, state_dict, filenames, callback):
+        try:
+            write_checkpoint(state_dict, filenames)
+            if callback is not None:
+                callback()
+        except Exception:
+            self._error = traceback.format_exc()
+
+    def wait(self):
+        """Block until the pending write (if any) is finished."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('Failed to write checkpoint:\n' + error)
+
+
+def save_state(filenames, args, model, criterion, optimizer, lr_scheduler,
+               num_updates, optim_history=None, extra_state=None, writer=None,
+               callback=None):
+    """Save training state to one or more checkpoint files.
+
+    The state is serialized once, to the first filename; the remaining
+    filenames are hard links to (or copies of) it. If a
+    :class:`CheckpointWriter` is given, the write happens in the background.
+    *callback* is called once all files have been written.
+    """
+    if isinstance(filenames, str):
+        filenames = [filenames]
     if optim_history is None:
         optim_history = []
     if extra_state is None:
@@ -47,7 +142,12 @@ def save_state(filename, args, model, criterion, optimizer, lr_scheduler,
         'last_optimizer_state': optimizer.state_dict(),
         'extra_state': extra_state,
     }
-    torch_persistent_save(state_dict, filename)
+    if writer is not None:
+        writer.write(state_dict, filenames, callback)
+    else:
+        write_checkpoint(state_dict, filenames)
+        if callback is not None:
+            callback()
 
 
 def load_model_state(filename, model, cuda_device=None):
@@ -129,9 +229,12 @@ def load_ensemble_for_inference(filenames, src_dict=None, dst_dict=None, data_di
     for filename in filenames:
         if not os.path.exists(filename):
             raise IOError('Model file not found: {}'.format(filename))
-        states.append(
-            torch.load(filename, map_location=lambda s, l: default_restore_location(s, 'cpu'))
-        )
+        if is_inference_state(filename):
+            states.append(load_inference_state(filename))
+        else:
+            states.append(
+                torch.load(filename, map_location=lambda s, l: default_restore_location(s, 'cpu'))
+            )
     args = states[0]['args']
     args = _upgrade_args(args)
 
@@ -148,6 +251,74 @@ def load_ensemble_for_inference(filenames, src_dict=None, dst_dict=None, data_di
     return ensemble, args
 
 
+INFERENCE_STATE_MAGIC = b'FSINF\x00\x00\x00'
+INFERENCE_STATE_ALIGN = 64
+
+
+def _align(n):
+    return (n + INFERENCE_STATE_ALIGN - 1) // INFERENCE_STATE_ALIGN * INFERENCE_STATE_ALIGN
+
+
+def save_inference_state(filename, args, model_state, fp16=False):
+    """Save an inference-only checkpoint with the model args and parameters.
+
+    The file starts with a pickled header that lists the name, dtype, shape
+    and offset of each tensor, followed by the raw tensor data, so that it
+    can be memory-mapped by :func:`load_inference_state`. If *fp16* is True,
+    floating point tensors are stored in half precision.
+    """
+    tensors, arrays = [], []
+    offset = 0
+    for name, tensor in model_state.items():
+        tensor = tensor.cpu()
+        if fp16 and tensor.is_floating_point():
+            tensor = tensor.half()
+        array = tensor.contiguous().numpy()
+        tensors.append((name, array.dtype.str, array.shape, offset))
+        arrays.append(array)
+        offset += _align(array.nbytes)
+    header = pickle.dumps({'args': args, 'tensors': tensors})
+    data_offset = _align(len(INFERENCE_STATE_MAGIC) + 16 + len(header))
+
+    with open(filename, 'wb') as f:
+        f.write(INFERENCE_STATE_MAGIC)
+        f.write(struct.pack('<QQ', 1, len(header)))
+        f.write(header)
+        for (_, _, _, offset), array in zip(tensors, arrays):
+            f.seek(data_offset + offset)
+            f.write(array.tobytes())
+
+
+def is_inference_state(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(INFERENCE_STATE_MAGIC)) == INFERENCE_STATE_MAGIC
+
+
+def load_inference_state(filename):
+    """Load a checkpoint saved by :func:`save_inference_state`.
+
+    The tensors are backed by a copy-on-write memory map of the file, so
+    only the pages that are used are read, once, when the tensors are copied
+    into the model parameters.
+    """
+    with open(filename, 'rb') as f:
+        magic = f.read(len(INFERENCE_STATE_MAGIC))
+        assert magic == INFERENCE_STATE_MAGIC
+        version, header_len = struct.unpack('<QQ', f.read(16))
+        assert version == 1
+        header = pickle.loads(f.read(header_len))
+    data_offset = _align(len(INFERENCE_STATE_MAGIC) + 16 + header_len)
+
+    buffer = np.memmap(filename, dtype=np.uint8, mode='c')
+    model_state = OrderedDict()
+    for name, dtype, shape, offset in header['tensors']:
+        dtype = np.dtype(dtype)
+        start = data_offset + offset
+        array = buffer[start:start + int(np.prod(shape)) * dtype.itemsize].view(dtype)
+        model_state[name] = torch.from_numpy(array.reshape(shape))
+    return {'args': header['args'], 'model': model_state}
+
+
 def _upgrade_args(args):
     if not hasattr(args, 'max_source_positions'):
         args.max_source_positions = args.max_positions
@@ -199,34 +370,110 @@ def make_variable(sample, volatile=False, cuda=False):
     return _make_variable(sample)
 
 
-INCREMENTAL_STATE_INSTANCE_ID = defaultdict(lambda: 0)
+INCREMENTAL_STATE_SLOTS = itertools.count()
+
+
+class IncrementalState(object):
+    """Incremental decoding state shared by all modules of a decoder.
 
+    Each (module, key) pair is assigned an integer slot the first time it is
+    used, and values are stored in a flat list indexed by slot. Values that
+    are set with ``reorder=True`` must be tensors of the same type whose first
+    dimension is the batch. They are packed into a single buffer, so that
+    :func:`reorder` reorders all of them with one index_select into a spare
+    buffer, after which the two buffers are swapped.
+    """
 
-def _get_full_incremental_state_key(module_instance, key):
-    module_name = module_instance.__class__.__name__
+    def __init__(self):
+        self.values = []
+        self._reorder_slots = []
+        self._buffers = None  # (buffer, spare), once packed
+        self._spare_values = None  # values that view the spare buffer
 
-    # assign a unique ID to each module instance, so that incremental state is
-    # not shared across module instances
-    if not hasattr(module_instance, '_fairseq_instance_id'):
-        INCREMENTAL_STATE_INSTANCE_ID[module_name] += 1
-        module_instance._fairseq_instance_id = INCREMENTAL_STATE_INSTANCE_ID[module_name]
+    def get(self, slot):
+        if slot < len(self.values):
+            return self.values[slot]
+        return None
 
-    return '{}.{}.{}'.format(module_name, module_instance._fairseq_instance_id, key)
+    def set(self, slot, value, reorder=False):
+        self._set(self.values, slot, value)
+        if reorder:
+            if slot not in self._reorder_slots:
+                self._reorder_slots.append(slot)
+            # pack again on the next reorder
+            self._unpack()
+        elif self._spare_values is not None:
+            self._set(self._spare_values, slot, value)
+
+    def reorder(self, new_order):
+        """Reorder the batch dimension of all values set with reorder=True."""
+        if len(self._reorder_slots) == 0:
+            return
+        if self._buffers is None:
+            self._pack()
+        buffer, spare = self._buffers
+        if new_order.numel() != buffer.size(0):
+            # the batch size changed, so the packed buffers can't be reused
+            for slot in self._reorder_slots:
+                self.values[slot] = self.values[slot].index_select(0, new_order)
+            self._unpack()
+            return
+        torch.index_select(buffer, 0, new_order, out=spare)
+        self._buffers = (spare, buffer)
+        self.values, self._spare_values = self._spare_values, self.values
+
+    def _pack(self):
+        values = [self.values[slot] for slot in self._reorder_slots]
+        bsz = values[0].size(0)
+        buffer = torch.cat([v.contiguous().view(bsz, -1) for v in values], dim=1)
+        spare = buffer.new(buffer.size())
+        self._spare_values = list(self.values)
+        offset = 0
+        for slot, v in zip(self._reorder_slots, values):
+            numel = v.numel() // bsz
+            self.values[slot] = buffer[:, offset:offset+numel].view(v.size())
+            self._spare_values[slot] = spare[:, offset:offset+numel].view(v.size())
+            offset += numel
+        self._buffers = (buffer, spare)
+
+    def _unpack(self):
+        self._buffers = None
+        self._spare_values = None
+
+    @staticmethod
+    def _set(values, slot, value):
+        if slot >= len(values):
+            values.extend([None] * (slot + 1 - len(values)))
+        values[slot] = value
+
+
+def _get_incremental_state_slot(module, key):
+    # assign a unique slot to each module instance and key, so that
+    # incremental state is not shared across module instances
+    slots = getattr(module, '_incremental_state_slots', None)
+    if slots is None:
+        slots = module._incremental_state_slots = {}
+    slot = slots.get(key)
+    if slot is None:
+        slot = slots[key] = next(INCREMENTAL_STATE_SLOTS)
+    return slot
 
 
 def get_incremental_state(module, incremental_state, key):
     """Helper for getting incremental state for an nn.Module."""
-    full_key = _get_full_incremental_state_key(module, key)
-    if incremental_state is None or full_key not in incremental_state:
+    if incremental_state is None:
         return None
-    return incremental_state[full_key]
+    return incremental_state.get(_get_incremental_state_slot(module, key))
+
 
+def set_incremental_state(module, incremental_state, key, value, reorder=False):
+    """Helper for setting incremental state for an nn.Module.
 
-def set_incremental_state(module, incremental_state, key, value):
-    """Helper for setting incremental state for an nn.Module."""
+    If *reorder* is True, *value* is reordered along with the other batch
+    buffers by :func:`IncrementalState.reorder`.
+    """
     if incremental_state is not None:
-        full_key = _get_full_incremental_state_key(module, key)
-        incremental_state[full_key] = value
+        incremental_state.set(_get_incremental_state_slot(module, key), value, reorder)
 
 
 def load_align_dict(replace_unk):
@@ -303,6 +550,42 @@ def convert_padding_direction(
         index = torch.remainder(range + num_pads, max_len)
     return src_tokens.gather(1, index)
 
+
+def grad_norm(grads):
+    """Compute the total 2-norm of a list of gradient tensors.
+
+    The per-tensor norms are combined on the device, so there is a single host
+    synchronization when the result is converted to a Python float.
+    """
+    if len(grads) == 0:
+        return 0.
+    if hasattr(torch, '_foreach_norm'):
+        norms = torch._foreach_norm(grads)
+    else:
+        norms = [g.norm() for g in grads]
+    return item(torch.stack(norms).norm())
+
+
+def clip_grad_norm_(grads, max_norm, total_norm=None):
+    """Clip a list of gradient tensors in place by their total 2-norm.
+
+    If *total_norm* is given (e.g., computed while all-reducing the
+    gradients), it is used instead of recomputing the norm. Returns the total
+    norm before clipping.
+    """
+    if total_norm is None:
+        total_norm = grad_norm(grads)
+    if max_norm > 0:
+        clip_coef = max_norm / (total_norm + 1e-6)
+        if clip_coef < 1:
+            if hasattr(torch, '_foreach_mul_'):
+                torch._foreach_mul_(grads, clip_coef)
+            else:
+                for g in grads:
+                    g.mul_(clip_coef)
+    return total_norm
+
+
 def item(tensor):
     if hasattr(tensor, 'item'):
         return tensor.item()
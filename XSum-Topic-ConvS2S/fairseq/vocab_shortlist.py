@@ -0,0 +1,65 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import torch
+
+from fairseq import utils
+
+
+def build_shortlist(args, src_dict, dst_dict):
+    """Return a VocabShortlist configured by --shortlist-*, or None."""
+    if args.shortlist_topk <= 0:
+        return None
+    align_dict = None
+    if args.shortlist_align_dict is not None:
+        align_dict = utils.load_align_dict(args.shortlist_align_dict)
+    return VocabShortlist(src_dict, dst_dict, topk=args.shortlist_topk, align_dict=align_dict)
+
+
+class VocabShortlist(object):
+    def __init__(self, src_dict, dst_dict, topk=0, align_dict=None):
+        """Builds a per-batch candidate target vocabulary for decoding.
+
+        The candidates for a batch are the target words that also occur in
+        the source documents, the *topk* most frequent target words and, if
+        *align_dict* is given, the aligned translation of each source word.
+        The special symbols are always included, and since they have the
+        lowest indices in the dictionary, their positions in the shortlist
+        are the same as their indices in *dst_dict*.
+
+        Args:
+            src_dict: source Dictionary
+            dst_dict: target Dictionary, assumed to be sorted by frequency
+            topk: number of most frequent target words to always include
+            align_dict: optional mapping from source to target words
+        """
+        self.frequent = torch.arange(0, min(max(topk, dst_dict.nspecial), len(dst_dict))).long()
+
+        # map each source index to the index of the same (or aligned) word in
+        # the target dictionary, or to unk if it doesn't have one
+        self.src_maps = [torch.LongTensor([dst_dict.index(w) for w in src_dict.symbols])]
+        if align_dict:
+            self.src_maps.append(torch.LongTensor([
+                dst_dict.index(align_dict.get(w, w)) for w in src_dict.symbols
+            ]))
+        self._cuda_maps = None
+
+    def candidates(self, src_tokens, prefix_tokens=None):
+        """Return the sorted target indices that may be generated for a batch
+        of source documents (and optional target prefixes)."""
+        src_maps = self.src_maps
+        if src_tokens.is_cuda:
+            if self._cuda_maps is None:
+                self._cuda_maps = [m.cuda() for m in self.src_maps]
+            src_maps = self._cuda_maps
+
+        src_tokens = src_tokens.contiguous().view(-1)
+        ids = [self.frequent.type_as(src_tokens)]
+        ids.extend(m.index_select(0, src_tokens) for m in src_maps)
+        if prefix_tokens is not None:
+            ids.append(prefix_tokens.contiguous().view(-1))
+        return torch.unique(torch.cat(ids), sorted=True)
@@ -8,10 +8,11 @@
 
 import torch
 
-from fairseq import bleu, data, options, progress_bar, tokenizer, utils
+from fairseq import bleu, data, options, progress_bar, rouge, tokenizer, utils
 from fairseq.meters import StopwatchMeter, TimeMeter
 from fairseq.sequence_generator import SequenceGenerator
 from fairseq.sequence_scorer import SequenceScorer
+from fairseq.vocab_shortlist import build_shortlist
 
 
 def main(args):
@@ -19,7 +20,39 @@ def main(args):
 
     use_cuda = torch.cuda.is_available() and not args.cpu
 
-    # Load dataset
+    dataset = load_dataset_for_generation(args)
+    models = load_models_for_generation(args, dataset)
+
+    # Load dataset (possibly sharded)
+    itr = get_generation_iterator(args, dataset, models)
+    if args.num_shards > 1:
+        if args.shard_id < 0 or args.shard_id >= args.num_shards:
+            raise ValueError('--shard-id must be between 0 and num_shards')
+        itr = data.sharded_iterator(itr, args.num_shards, args.shard_id)
+
+    # Generate and compute BLEU score
+    scorer = bleu.Scorer(dataset.dst_dict.pad(), dataset.dst_dict.eos(), dataset.dst_dict.unk())
+    rouge_scorer = rouge.RougeScorer(num_workers=args.rouge_workers) if args.rouge else None
+    gen_timer = StopwatchMeter()
+    num_sentences = 0
+    has_target = True
+    for sample_id, lines, has_target in generate(
+            args, dataset, models, itr, scorer, gen_timer, use_cuda, rouge_scorer=rouge_scorer):
+        for line in lines:
+            print(line)
+        num_sentences += 1
+
+    print('| Translated {} sentences ({} tokens) in {:.1f}s ({:.2f} tokens/s)'.format(
+        num_sentences, gen_timer.n, gen_timer.sum, 1. / gen_timer.avg))
+    if has_target:
+        print('| Generate {} with beam={}: {}'.format(args.gen_subset, args.beam, scorer.result_string()))
+        if rouge_scorer is not None:
+            print('| Generate {} with beam={}: {}'.format(args.gen_subset, args.beam, rouge_scorer.result_string()))
+    if rouge_scorer is not None:
+        rouge_scorer.shutdown()
+
+
+def load_dataset_for_generation(args):
     if args.replace_unk is None:
         dataset = data.load_dataset(
             args.data,
@@ -38,6 +71,12 @@ def main(args):
     if args.source_lang is None or args.target_lang is None:
         # record inferred languages in args
         args.source_lang, args.target_lang = dataset.src, dataset.dst
+    return dataset
+
+
+def load_models_for_generation(args, dataset):
+    if args.quantize and torch.cuda.is_available() and not args.cpu:
+        raise ValueError('--quantize is only supported with --cpu')
 
     # Load ensemble
     print('| loading model(s) from {}'.format(', '.join(args.path)))
@@ -51,43 +90,52 @@ def main(args):
     for model in models:
         model.make_generation_fast_(
             beamable_mm_beam_size=None if args.no_beamable_mm else args.beam,
+            quantize=args.quantize,
+            jit=args.jit,
         )
+    return models
 
-    # Load alignment dictionary for unknown word replacement
-    # (None if no unknown word replacement, empty if no path to align dictionary)
-    align_dict = utils.load_align_dict(args.replace_unk)
 
-    # Load dataset (possibly sharded)
+def get_generation_iterator(args, dataset, models, shard_id=0, num_shards=1):
     max_positions = min(model.max_encoder_positions() for model in models)
-    itr = dataset.eval_dataloader(
+    return dataset.eval_dataloader(
         args.gen_subset,
         max_sentences=args.max_sentences,
         max_positions=max_positions,
         skip_invalid_size_inputs_valid_test=args.skip_invalid_size_inputs_valid_test,
+        shard_id=shard_id,
+        num_shards=num_shards,
+        shard_by_tokens=(num_shards > 1),
     )
-    if args.num_shards > 1:
-        if args.shard_id < 0 or args.shard_id >= args.num_shards:
-            raise ValueError('--shard-id must be between 0 and num_shards')
-        itr = data.sharded_iterator(itr, args.num_shards, args.shard_id)
+
+
+def generate(args, dataset, models, itr, scorer, gen_timer, use_cuda, rouge_scorer=None):
+    """Generate translations for the batches in itr.
+
+    Adds the top hypothesis of each sentence to the BLEU scorer (and to the
+    ROUGE scorer, if given) and yields
+    the sample id, the output lines and whether a reference was available
+    for each sentence.
+    """
+    # Load alignment dictionary for unknown word replacement
+    # (None if no unknown word replacement, empty if no path to align dictionary)
+    align_dict = utils.load_align_dict(args.replace_unk)
 
     # print("SHASHI: I AM HERE")
         
     # Initialize generator
-    gen_timer = StopwatchMeter()
     if args.score_reference:
         translator = SequenceScorer(models)
     else:
         translator = SequenceGenerator(
             models, beam_size=args.beam, stop_early=(not args.no_early_stop),
             normalize_scores=(not args.unnormalized), len_penalty=args.lenpen,
-            unk_penalty=args.unkpen)
+            unk_penalty=args.unkpen,
+            shortlist=build_shortlist(args, dataset.src_dict, dataset.dst_dict),
+            parallel_ensemble=args.parallel_ensemble)
     if use_cuda:
         translator.cuda()
 
-    # Generate and compute BLEU score
-    scorer = bleu.Scorer(dataset.dst_dict.pad(), dataset.dst_dict.eos(), dataset.dst_dict.unk())
-    num_sentences = 0
-    has_target = True
     with progress_bar.build_progress_bar(args, itr) as t:
         if args.score_reference:
             translations = translator.score_batched_itr(t, cuda=use_cuda, timer=gen_timer)
@@ -110,10 +158,11 @@ def main(args):
                                                      args.remove_bpe,
                                                      escape_unk=True) if has_target else ''
 
+            lines = []
             if not args.quiet:
-                print('S-{}\t{}'.format(sample_id, src_str))
+                lines.append('S-{}\t{}'.format(sample_id, src_str))
                 if has_target:
-                    print('T-{}\t{}'.format(sample_id, target_str))
+                    lines.append('T-{}\t{}'.format(sample_id, target_str))
 
             # Process top predictions
             for i, hypo in enumerate(hypos[:min(len(hypos), args.nbest)]):
@@ -127,15 +176,15 @@ def main(args):
                 )
 
                 if not args.quiet:
-                    print('H-{}\t{}\t{}'.format(sample_id, hypo['score'], hypo_str))
-                    print('P-{}\t{}'.format(
+                    lines.append('H-{}\t{}\t{}'.format(sample_id, hypo['score'], hypo_str))
+                    lines.append('P-{}\t{}'.format(
                         sample_id,
                         ' '.join(map(
                             lambda x: '{:.4f}'.format(x),
                             hypo['positional_scores'].tolist(),
                         ))
                     ))
-                    print('A-{}\t{}'.format(
+                    lines.append('A-{}\t{}'.format(
                         sample_id,
                         ' '.join(map(lambda x: str(utils.item(x)), alignment))
                     ))
@@ -147,15 +196,12 @@ def main(args):
                         target_tokens = tokenizer.Tokenizer.tokenize(
                             target_str, dataset.dst_dict, add_if_not_exist=True)
                     scorer.add(target_tokens, hypo_tokens)
+                    if rouge_scorer is not None:
+                        rouge_scorer.add(target_str, hypo_str)
 
             wps_meter.update(src_tokens.size(0))
             t.log({'wps': round(wps_meter.avg)})
-            num_sentences += 1
-
-    print('| Translated {} sentences ({} tokens) in {:.1f}s ({:.2f} tokens/s)'.format(
-        num_sentences, gen_timer.n, gen_timer.sum, 1. / gen_timer.avg))
-    if has_target:
-        print('| Generate {} with beam={}: {}'.format(args.gen_subset, args.beam, scorer.result_string()))
+            yield sample_id, lines, has_target
 
 
 if __name__ == '__main__':
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+#
+
+import argparse
+import os
+import sys
+
+from fairseq import rouge
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Command-line script for ROUGE scoring. Words are not '
+                                     'stemmed, so the scores are not comparable to those '
+                                     'of the Perl ROUGE toolkit.')
+    parser.add_argument('-s', '--sys', default='-', help='system output')
+    parser.add_argument('-r', '--ref', required=True, help='references')
+    parser.add_argument('--workers', default=1, type=int, metavar='N',
+                        help='number of processes used for scoring')
+    parser.add_argument('--chunk-size', default=1000, type=int, metavar='N',
+                        help='number of documents scored at once by a worker')
+
+    args = parser.parse_args()
+    print(args)
+
+    assert args.sys == '-' or os.path.exists(args.sys), \
+        "System output file {} does not exist".format(args.sys)
+    assert os.path.exists(args.ref), \
+        "Reference file {} does not exist".format(args.ref)
+
+    def score(fdsys):
+        with open(args.ref) as fdref:
+            scorer = rouge.RougeScorer(num_workers=args.workers, chunk_size=args.chunk_size)
+            for sys_line, ref_line in zip(fdsys, fdref):
+                scorer.add(ref_line, sys_line)
+            print(scorer.result_string())
+            scorer.shutdown()
+
+    if args.sys == '-':
+        score(sys.stdin)
+    else:
+        with open(args.sys, 'r') as f:
+            score(f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+#
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+
+import numpy as np
+
+from fairseq import rouge
+
+
+METRICS = ['BLEU', 'ROUGE-1', 'ROUGE-2', 'ROUGE-L']
+
+# per-sentence BLEU statistics, in the order of bleu.BleuStat
+NUM_BLEU_STATS = 10
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Paired bootstrap significance tests of BLEU and ROUGE between systems.')
+    parser.add_argument('-r', '--ref', required=True, help='references')
+    parser.add_argument('-s', '--sys', required=True, nargs='+', help='system outputs')
+    parser.add_argument('--num-samples', default=1000, type=int, metavar='N',
+                        help='number of bootstrap samples')
+    parser.add_argument('--batch-size', default=100, type=int, metavar='N',
+                        help='number of bootstrap samples drawn at once')
+    parser.add_argument('--seed', default=1, type=int, metavar='N',
+                        help='random seed')
+    parser.add_argument('--workers', default=1, type=int, metavar='N',
+                        help='number of processes used to compute the sentence statistics')
+
+    args = parser.parse_args()
+    print(args)
+
+    for filename in [args.ref] + args.sys:
+        assert os.path.exists(filename), "File {} does not exist".format(filename)
+
+    with open(args.ref) as f:
+        refs = f.readlines()
+    names = [os.path.basename(filename) for filename in args.sys]
+
+    # compute the sufficient statistics of each sentence once
+    stats = []
+    for filename in args.sys:
+        with open(filename) as f:
+            hyps = f.readlines()
+        assert len(hyps) == len(refs), \
+            "{} has {} lines, but there are {} references".format(filename, len(hyps), len(refs))
+        stats.append(corpus_stats(refs, hyps, args.workers))
+    num_stats = stats[0].shape[1]
+    stats = np.concatenate(stats, axis=1)
+
+    # score the full test set and the bootstrap samples
+    rng = np.random.RandomState(args.seed)
+    full = stats.sum(axis=0, keepdims=True)
+    samples = bootstrap_sums(stats, args.num_samples, args.batch_size, rng)
+    full_scores, sample_scores = [], []
+    for i in range(len(names)):
+        system = slice(i * num_stats, (i + 1) * num_stats)
+        full_scores.append(scores(full[:, system], len(refs))[0])
+        sample_scores.append(scores(samples[:, system], len(refs)))
+
+    print('| {} bootstrap samples of {} sentences'.format(args.num_samples, len(refs)))
+    for name, full_score, sample_score in zip(names, full_scores, sample_scores):
+        lo, hi = np.percentile(sample_score, [2.5, 97.5], axis=0)
+        print('| {}: {}'.format(name, ', '.join(
+            '{} = {:.2f} [{:.2f}, {:.2f}]'.format(metric, full_score[k], lo[k], hi[k])
+            for k, metric in enumerate(METRICS)
+        )))
+
+    # paired bootstrap test: the p-value is the fraction of samples in which
+    # the system that is better on the full test set is not better
+    for i, j in itertools.combinations(range(len(names)), 2):
+        results = []
+        for k, metric in enumerate(METRICS):
+            delta = full_scores[i][k] - full_scores[j][k]
+            if delta >= 0:
+                p = np.mean(sample_scores[i][:, k] <= sample_scores[j][:, k])
+            else:
+                p = np.mean(sample_scores[j][:, k] <= sample_scores[i][:, k])
+            results.append('{} {:+.2f} (p = {:.4f})'.format(metric, delta, p))
+        print('| {} vs {}: {}'.format(names[i], names[j], ', '.join(results)))
+
+
+def sentence_stats(ref, hyp):
+    """Return the BLEU statistics (reference length, hypothesis length and
+    n-gram matches/counts for n = 1..4) and the ROUGE-1/2/L F1 of a sentence."""
+    vocab = {}
+    ref_ids = [vocab.setdefault(w, len(vocab)) for w in ref.split()]
+    hyp_ids = [vocab.setdefault(w, len(vocab)) for w in hyp.split()]
+    res = [len(ref_ids), len(hyp_ids)]
+    for n in range(1, 5):
+        ref_ngrams, hyp_ngrams = rouge.ngrams(ref_ids, n), rouge.ngrams(hyp_ids, n)
+        res.append(sum((ref_ngrams & hyp_ngrams).values()))
+        res.append(max(len(hyp_ids) - n + 1, 0))
+
+    ref_ids, hyp_ids = rouge.to_ids(ref, hyp)
+    res.extend(f1 for _, _, f1 in rouge.score_pair(ref_ids, hyp_ids))
+    return res
+
+
+def _chunk_stats(pairs):
+    return [sentence_stats(ref, hyp) for ref, hyp in pairs]
+
+
+def corpus_stats(refs, hyps, num_workers=1, chunk_size=1000):
+    """Return an array with the :func:`sentence_stats` of each sentence."""
+    pairs = list(zip(refs, hyps))
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    if num_workers > 1:
+        with ProcessPoolExecutor(num_workers) as pool:
+            results = list(pool.map(_chunk_stats, chunks))
+    else:
+        results = [_chunk_stats(chunk) for chunk in chunks]
+    return np.array([stats for result in results for stats in result], dtype=np.float64)
+
+
+def bootstrap_sums(stats, num_samples, batch_size, rng):
+    """Return the column sums of *num_samples* resamples (with replacement)
+    of the rows of *stats*.
+
+    The resamples of each batch are drawn as a batch_size x N matrix of row
+    indices, turned into per-row counts, and summed with one matrix product.
+    """
+    n = stats.shape[0]
+    sums = np.empty((num_samples, stats.shape[1]))
+    for start in range(0, num_samples, batch_size):
+        bsz = min(batch_size, num_samples - start)
+        indices = rng.randint(0, n, size=(bsz, n))
+        indices += n * np.arange(bsz)[:, None]
+        counts = np.bincount(indices.ravel(), minlength=bsz * n).reshape(bsz, n)
+        sums[start:start + bsz] = counts.dot(stats)
+    return sums
+
+
+def scores(sums, num_sentences):
+    """Return the BLEU and ROUGE-1/2/L scores (one row per row of *sums*)
+    from summed :func:`sentence_stats`."""
+    reflen, predlen = sums[:, 0], sums[:, 1]
+    matches = sums[:, 2:NUM_BLEU_STATS:2]
+    counts = sums[:, 3:NUM_BLEU_STATS:2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(counts > 0, matches / counts, 0.)
+        brevity = np.minimum(1., np.exp(1. - reflen / predlen))
+        bleu = brevity * np.exp(np.log(precision).mean(axis=1)) * 100
+    rouge_f1 = sums[:, NUM_BLEU_STATS:] / num_sentences * 100
+    return np.concatenate([bleu[:, None], rouge_f1], axis=1)
+
+
+if __name__ == '__main__':
+    main()
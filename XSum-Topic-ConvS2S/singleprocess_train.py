@@ -12,6 +12,7 @@ import collections
 import itertools
 import os
 import math
+import re
 import torch
 
 from fairseq import criterions, data, models, options, progress_bar
@@ -98,6 +99,7 @@ def main(args):
 
         epoch += 1
         batch_offset = 0
+    trainer.wait_for_checkpoint()
     train_meter.stop()
 
     print('| done training in {:.1f} seconds'.format(train_meter.sum))
@@ -274,23 +276,54 @@ def save_checkpoint(trainer, args, epoch, batch_offset, val_loss=None):
         'val_loss': val_loss,
     }
 
+    # the state is serialized once, all other files are hard links to it
+    checkpoints = []
     if batch_offset == 0:
         if not args.no_epoch_checkpoints:
-            epoch_filename = os.path.join(args.save_dir, 'checkpoint{}.pt'.format(epoch))
-            trainer.save_checkpoint(epoch_filename, extra_state)
+            checkpoints.append(os.path.join(args.save_dir, 'checkpoint{}.pt'.format(epoch)))
 
         assert val_loss is not None
         if not hasattr(save_checkpoint, 'best') or val_loss < save_checkpoint.best:
             save_checkpoint.best = val_loss
-            best_filename = os.path.join(args.save_dir, 'checkpoint_best.pt')
-            trainer.save_checkpoint(best_filename, extra_state)
+            checkpoints.append(os.path.join(args.save_dir, 'checkpoint_best.pt'))
+        if args.keep_best_checkpoints > 0:
+            checkpoints.append(os.path.join(
+                args.save_dir, 'checkpoint.best_{:.4f}.pt'.format(val_loss)))
     elif not args.no_epoch_checkpoints:
-        epoch_filename = os.path.join(
-            args.save_dir, 'checkpoint{}_{}.pt'.format(epoch, batch_offset))
-        trainer.save_checkpoint(epoch_filename, extra_state)
-
-    last_filename = os.path.join(args.save_dir, 'checkpoint_last.pt')
-    trainer.save_checkpoint(last_filename, extra_state)
+        checkpoints.append(os.path.join(
+            args.save_dir, 'checkpoint{}_{}.pt'.format(epoch, batch_offset)))
+
+    checkpoints.append(os.path.join(args.save_dir, 'checkpoint_last.pt'))
+    trainer.save_checkpoint(checkpoints, extra_state, callback=lambda: remove_old_checkpoints(args))
+
+
+def remove_old_checkpoints(args):
+    """Delete checkpoints that fall outside the retention policy."""
+
+    def checkpoint_paths(pattern, key):
+        """Return checkpoints matching pattern, in ascending order of key."""
+        matches = []
+        for filename in os.listdir(args.save_dir):
+            m = re.fullmatch(pattern, filename)
+            if m is not None:
+                matches.append((key(m), os.path.join(args.save_dir, filename)))
+        return [path for _, path in sorted(matches)]
+
+    old_checkpoints = []
+    if args.keep_last_epochs > 0:
+        old_checkpoints += checkpoint_paths(
+            r'checkpoint(\d+)\.pt', lambda m: int(m.group(1)),
+        )[:-args.keep_last_epochs]
+    if args.keep_interval_updates > 0:
+        old_checkpoints += checkpoint_paths(
+            r'checkpoint(\d+)_(\d+)\.pt', lambda m: (int(m.group(1)), int(m.group(2))),
+        )[:-args.keep_interval_updates]
+    if args.keep_best_checkpoints > 0:
+        old_checkpoints += checkpoint_paths(
+            r'checkpoint\.best_(-?[\d.]+)\.pt', lambda m: float(m.group(1)),
+        )[args.keep_best_checkpoints:]
+    for path in old_checkpoints:
+        os.remove(path)
 
 
 if __name__ == '__main__':
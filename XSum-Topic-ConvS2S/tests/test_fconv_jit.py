@@ -0,0 +1,81 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import itertools
+import unittest
+
+import torch
+
+from fairseq import utils
+from fairseq.sequence_generator import SequenceGenerator
+
+import tests.utils as test_utils
+
+
+class TestFConvJit(unittest.TestCase):
+    """The traced encoder and decoder steps (--jit) must match eager mode."""
+
+    def setUp(self):
+        self.dict = test_utils.dummy_dictionary(20)
+        self.args = test_utils.fconv_args()
+        self.src = test_utils.dummy_source(self.dict)
+        self.src_tokens, self.src_lengths, self.src_doctopic, _ = self.src
+
+    def _build(self, quantize=False, **kwargs):
+        args = test_utils.fconv_args(**kwargs)
+        eager, traced = test_utils.build_fconv_models(args, self.dict)
+        eager.make_generation_fast_(quantize=quantize)
+        traced.make_generation_fast_(quantize=quantize, jit=True)
+        return eager, traced
+
+    def assertTensorEqual(self, t1, t2):
+        self.assertEqual(t1.size(), t2.size(), "size mismatch")
+        self.assertLess((t1 - t2).abs().max().item(), 1e-5)
+
+    def test_encoder(self):
+        eager, traced = self._build()
+        with torch.no_grad():
+            # the second call runs the traced graph rather than tracing it
+            for _ in range(2):
+                for x, y in zip(eager.encoder(*self.src), traced.encoder(*self.src)):
+                    self.assertTensorEqual(x, y)
+
+    def test_decoder_steps(self):
+        for quantize, attention in itertools.product([False, True], ['True', '[False, True, False]']):
+            # with quantize, the traced graph must match eager int8
+            eager, traced = self._build(quantize=quantize, decoder_attention=attention)
+            tokens = torch.randint(self.dict.nspecial, len(self.dict), (self.src_tokens.size(0), 6))
+            tokens[:, 0] = self.dict.eos()
+            with torch.no_grad():
+                encoder_out = eager.encoder(*self.src)
+                states = [utils.IncrementalState(), utils.IncrementalState()]
+                for step in range(tokens.size(1)):
+                    outputs = [
+                        model.decoder(tokens[:, :step + 1], encoder_out, self.src_doctopic, state)
+                        for model, state in zip([eager, traced], states)
+                    ]
+                    (x1, attn1), (x2, attn2) = outputs
+                    self.assertTensorEqual(x1, x2)
+                    self.assertTensorEqual(attn1, attn2)
+
+    def test_generate(self):
+        for quantize, attention, beam_size in itertools.product(
+                [False, True], ['True', '[False, True, False]'], [1, 2, 4]):
+            eager, traced = self._build(quantize=quantize, decoder_attention=attention)
+            hypos = [
+                SequenceGenerator([model], beam_size=beam_size, maxlen=10).generate(*self.src)
+                for model in [eager, traced]
+            ]
+            for sent1, sent2 in zip(*hypos):
+                self.assertEqual(len(sent1), len(sent2))
+                for hypo1, hypo2 in zip(sent1, sent2):
+                    self.assertEqual(hypo1['tokens'].tolist(), hypo2['tokens'].tolist())
+                    self.assertAlmostEqual(hypo1['score'], hypo2['score'], places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
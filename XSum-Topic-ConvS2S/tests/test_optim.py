@@ -0,0 +1,86 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import unittest
+from unittest import mock
+
+import torch
+
+from fairseq.optim import adam, nag
+
+
+SHAPES = [(7, 5), (5,), (3, 4, 2), (1,)]
+
+
+def run(optimizer_cls, num_steps=20, **kwargs):
+    """Return the parameters and optimizer state after *num_steps* steps on
+    random gradients, which only depend on the seed."""
+    torch.manual_seed(1)
+    params = [torch.nn.Parameter(torch.randn(*shape)) for shape in SHAPES]
+    optimizer = optimizer_cls(params, **kwargs)
+    for step in range(num_steps):
+        for i, p in enumerate(params):
+            # leave a parameter without gradient from time to time
+            if (i + step) % 5 == 4:
+                p.grad = None
+            else:
+                p.grad = torch.randn(*p.size())
+        if step == num_steps // 2:
+            # NAG corrects the momentum for learning rate changes
+            for group in optimizer.param_groups:
+                group['lr'] *= 0.5
+        optimizer.step()
+    return params, optimizer.state
+
+
+class TestMultiTensorOptimizers(unittest.TestCase):
+    """The multi-tensor (torch._foreach_*) updates must follow the same
+    trajectories as the single-tensor ones."""
+
+    def assertTrajectoriesEqual(self, single, multi):
+        (params1, state1), (params2, state2) = single, multi
+        for p1, p2 in zip(params1, params2):
+            self.assertTrue(torch.allclose(p1, p2, rtol=1e-5, atol=1e-6))
+            self.assertEqual(state1[p1].keys(), state2[p2].keys())
+            for key, value in state1[p1].items():
+                if torch.is_tensor(value):
+                    self.assertTrue(torch.allclose(value, state2[p2][key], rtol=1e-5, atol=1e-6), key)
+                else:
+                    self.assertEqual(value, state2[p2][key])
+
+    @unittest.skipIf(not hasattr(torch, '_foreach_add_'), 'no multi-tensor ops in this version of PyTorch')
+    def test_adam(self):
+        for weight_decay in [0, 0.01]:
+            for amsgrad in [False, True]:
+                kwargs = dict(lr=0.01, betas=(0.9, 0.98), weight_decay=weight_decay, amsgrad=amsgrad)
+                with mock.patch.object(adam, '_multi_tensor_available', return_value=True), \
+                        mock.patch.object(adam, '_single_tensor_adam') as single:
+                    multi = run(adam.Adam, **kwargs)
+                    self.assertFalse(single.called)
+                with mock.patch.object(adam, '_multi_tensor_available', return_value=False), \
+                        mock.patch.object(adam, '_multi_tensor_adam') as multi_tensor:
+                    single = run(adam.Adam, **kwargs)
+                    self.assertFalse(multi_tensor.called)
+                self.assertTrajectoriesEqual(single, multi)
+
+    @unittest.skipIf(not hasattr(torch, '_foreach_add_'), 'no multi-tensor ops in this version of PyTorch')
+    def test_nag(self):
+        for weight_decay in [0, 0.01]:
+            kwargs = dict(lr=0.1, momentum=0.99, weight_decay=weight_decay)
+            with mock.patch.object(nag, '_multi_tensor_available', return_value=True), \
+                    mock.patch.object(nag, '_single_tensor_nag') as single:
+                multi = run(nag.NAG, **kwargs)
+                self.assertFalse(single.called)
+            with mock.patch.object(nag, '_multi_tensor_available', return_value=False), \
+                    mock.patch.object(nag, '_multi_tensor_nag') as multi_tensor:
+                single = run(nag.NAG, **kwargs)
+                self.assertFalse(multi_tensor.called)
+            self.assertTrajectoriesEqual(single, multi)
+
+
+if __name__ == '__main__':
+    unittest.main()
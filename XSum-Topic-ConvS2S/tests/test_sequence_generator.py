@@ -0,0 +1,46 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the LICENSE file in
+# the root directory of this source tree. An additional grant of patent rights
+# can be found in the PATENTS file in the same directory.
+
+import unittest
+
+import torch
+
+from fairseq.sequence_generator import SequenceGenerator
+
+import tests.utils as test_utils
+
+
+class TestSequenceGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.dict = test_utils.dummy_dictionary(20)
+        self.model, = test_utils.build_fconv_models(test_utils.fconv_args(), self.dict, n=1)
+        self.model.make_generation_fast_()
+        self.src_tokens, self.src_lengths, self.src_doctopic, self.src_wordtopics = \
+            test_utils.dummy_source(self.dict)
+
+    def test_per_sentence_maxlen(self):
+        """With a max length per sentence, each sentence of a batch is
+        generated as if it was alone, with its own max length."""
+        maxlens = torch.LongTensor([2, 5, 9])
+        for stop_early in [True, False]:
+            generator = SequenceGenerator([self.model], beam_size=4, stop_early=stop_early, maxlen=20)
+            batch = generator.generate(
+                self.src_tokens, self.src_lengths, self.src_doctopic, self.src_wordtopics, maxlen=maxlens)
+            for i, hypos in enumerate(batch):
+                alone, = generator.generate(
+                    self.src_tokens[i:i + 1], self.src_lengths[i:i + 1], self.src_doctopic[i:i + 1],
+                    self.src_wordtopics[i:i + 1], maxlen=int(maxlens[i]))
+                self.assertEqual(len(hypos), len(alone))
+                for hypo1, hypo2 in zip(hypos, alone):
+                    self.assertLessEqual(hypo1['tokens'].numel(), maxlens[i] + 1)
+                    self.assertEqual(hypo1['tokens'].tolist(), hypo2['tokens'].tolist())
+                    self.assertAlmostEqual(hypo1['score'], hypo2['score'], places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+# -*- encoding: utf-8 -*-
+"""Read the model predictions and human evaluation tarballs without extracting them.
+
+The first time a tarball is opened, its members are indexed (name, offset and
+size in the decompressed stream) and the index is cached next to it in
+`<tarball>.index.json`. Members are then read by seeking in the gzip stream,
+so that single summaries can be looked up and all systems can be iterated
+in lockstep, line by line.
+
+    predictions = ModelPredictions("xsum-model-predictions.tar.gz")
+    predictions.get("40453444", "convs2s")
+    for bbcid, system, summary in predictions:
+        ...
+
+Line i of the prediction files (and block ==i== of the human evaluation
+data) is the i-th BBC id of the test split.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tarfile
+
+SPLIT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "XSum-Dataset",
+                          "XSum-TRAINING-DEV-TEST-SPLIT-90-5-5.json")
+
+# Systems of the human evaluation data, with the names of their prediction files
+HUMAN_EVALUATION_SYSTEMS = {
+  "LEAD": "lead",
+  "Ext-Oracle": "ext-oracle",
+  "Pointer-Generator": "ptgen",
+  "ConvS2S": "convs2s",
+  "Topic-ConvS2S": "topic-convs2s",
+  "Reference": "gold",
+}
+HUMAN_EVALUATION_SECTIONS = ["Document-400", "Document-Full", "Questions-Answers"] + list(HUMAN_EVALUATION_SYSTEMS)
+
+
+def load_test_ids(split_file=SPLIT_FILE):
+  with open(split_file) as f:
+    return json.load(f)["test"]
+
+
+class TarIndex(object):
+  """Member index of a .tar.gz file, cached in *index_file*."""
+
+  def __init__(self, path, index_file=None):
+    self.path = path
+    self.index_file = index_file if index_file is not None else path + ".index.json"
+    stat = os.stat(path)
+    self.key = [stat.st_size, int(stat.st_mtime)]
+    self.members = self._load()
+    if self.members is None:
+      self.members = self._build()
+      self._save()
+
+  def _load(self):
+    if not os.path.exists(self.index_file):
+      return None
+    with open(self.index_file) as f:
+      cached = json.load(f)
+    if cached.get("key") != self.key:
+      return None
+    return {name: tuple(member) for name, member in cached["members"].items()}
+
+  def _build(self):
+    # a single pass over the decompressed stream
+    members = {}
+    with tarfile.open(self.path, "r|gz") as tar:
+      for member in tar:
+        if member.isfile():
+          members[member.name] = (member.offset_data, member.size)
+    return members
+
+  def _save(self):
+    try:
+      with open(self.index_file, "w") as f:
+        json.dump({"key": self.key, "members": self.members}, f)
+    except (IOError, OSError):
+      # read-only location: the index is rebuilt next time
+      pass
+
+  def __contains__(self, name):
+    return name in self.members
+
+  def names(self):
+    return sorted(self.members)
+
+  def read(self, name):
+    """Return the content of member *name* as a string."""
+    return "".join(self.lines(name))
+
+  def lines(self, name):
+    """Iterate over the lines of member *name*, reading it from the gzip stream."""
+    offset, size = self.members[name]
+    with gzip.open(self.path, "rb") as f:
+      f.seek(offset)
+      while size > 0:
+        line = f.readline(size)
+        if not line:
+          break
+        size -= len(line)
+        yield line.decode("utf-8")
+
+
+class ModelPredictions(object):
+  """The test set predictions of xsum-model-predictions.tar.gz.
+
+  Systems are named after their files, e.g. "convs2s" for
+  convs2s-test-output.txt; the references are "gold".
+  """
+
+  def __init__(self, path, split_file=SPLIT_FILE, index_file=None):
+    self.index = TarIndex(path, index_file)
+    self.ids = load_test_ids(split_file)
+    self.positions = {bbcid: i for i, bbcid in enumerate(self.ids)}
+    self.files = {}
+    for name in self.index.names():
+      basename = os.path.basename(name)
+      if basename.endswith("-test-output.txt"):
+        self.files[basename[:-len("-test-output.txt")]] = name
+      elif basename == "gold-test-sentences.txt":
+        self.files["gold"] = name
+    self.cache = {}
+
+  @property
+  def systems(self):
+    return sorted(self.files)
+
+  def get(self, bbcid, system):
+    """Return the summary of *system* for the document *bbcid*."""
+    if system not in self.cache:
+      self.cache[system] = [line.rstrip("\n") for line in self.index.lines(self.files[system])]
+    return self.cache[system][self.positions[bbcid]]
+
+  def records(self, systems=None):
+    """Iterate over aligned (bbcid, system, summary) records, streaming all
+    prediction files at once."""
+    systems = self.systems if systems is None else systems
+    streams = [self.index.lines(self.files[system]) for system in systems]
+    for bbcid, lines in zip(self.ids, zip(*streams)):
+      for system, line in zip(systems, lines):
+        yield bbcid, system, line.rstrip("\n")
+
+  def __iter__(self):
+    return self.records()
+
+
+class HumanEvaluation(object):
+  """The documents of xsum-human-evaluation-data.tar.gz, with their summaries
+  and questions. Systems have the names of :class:`ModelPredictions`."""
+
+  def __init__(self, path, split_file=SPLIT_FILE, index_file=None):
+    self.index = TarIndex(path, index_file)
+    self.ids = load_test_ids(split_file)
+    self.member = [name for name in self.index.names() if name.endswith("xsum-human-evaluation-data.txt")][0]
+    self.cache = None
+
+  @property
+  def systems(self):
+    return sorted(HUMAN_EVALUATION_SYSTEMS.values())
+
+  def documents(self):
+    """Iterate over (bbcid, sections) pairs, where sections maps the section
+    names (e.g. "Document-400", "ConvS2S", "Questions-Answers") to their lines."""
+    bbcid, sections, section = None, None, None
+    for line in self.index.lines(self.member):
+      line = line.rstrip("\n")
+      if line.startswith("==") and line.endswith("==") and line[2:-2].isdigit():
+        if bbcid is not None:
+          yield bbcid, sections
+        bbcid, sections, section = self.ids[int(line[2:-2])], {}, None
+      elif line in HUMAN_EVALUATION_SECTIONS and (section is None or not sections[section] or sections[section][-1] == ""):
+        section = line
+        sections[section] = []
+      elif section is not None:
+        sections[section].append(line)
+    if bbcid is not None:
+      yield bbcid, sections
+
+  def get(self, bbcid, system):
+    """Return the summary of *system* for the document *bbcid*."""
+    if self.cache is None:
+      self.cache = dict(self.documents())
+    return self._summary(self.cache[bbcid], system)
+
+  def records(self, systems=None):
+    """Iterate over (bbcid, system, summary) records."""
+    systems = self.systems if systems is None else systems
+    for bbcid, sections in self.documents():
+      for system in systems:
+        yield bbcid, system, self._summary(sections, system)
+
+  def __iter__(self):
+    return self.records()
+
+  @staticmethod
+  def _summary(sections, system):
+    for section, name in HUMAN_EVALUATION_SYSTEMS.items():
+      if name == system:
+        return " ".join(line for line in sections[section] if line)
+    raise KeyError(system)
+
+
+def open_archive(path, split_file=SPLIT_FILE, index_file=None):
+  """Return a :class:`ModelPredictions` or :class:`HumanEvaluation` reader for *path*."""
+  index = TarIndex(path, index_file)
+  if any(name.endswith("xsum-human-evaluation-data.txt") for name in index.names()):
+    return HumanEvaluation(path, split_file, index_file)
+  return ModelPredictions(path, split_file, index_file)
+
+
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser(description="Print summaries from the XSum prediction or human evaluation tarballs.")
+  parser.add_argument('archive', type=str, help='xsum-model-predictions.tar.gz or xsum-human-evaluation-data.tar.gz')
+  parser.add_argument('--split', type=str, default=SPLIT_FILE, help='Training, dev and test split file')
+  parser.add_argument('--ids', type=str, nargs='+', default=None, help='BBC ids to look up (default: all, streamed)')
+  parser.add_argument('--systems', type=str, nargs='+', default=None, help='Systems to print (default: all)')
+  args = parser.parse_args()
+
+  archive = open_archive(args.archive, args.split)
+  systems = archive.systems if args.systems is None else args.systems
+  if args.ids is None:
+    records = archive.records(systems)
+  else:
+    records = ((bbcid, system, archive.get(bbcid, system)) for bbcid in args.ids for system in systems)
+  for bbcid, system, summary in records:
+    sys.stdout.write("%s\t%s\t%s\n" % (bbcid, system, summary))